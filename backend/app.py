@@ -33,6 +33,7 @@ def create_app():
     from routes.chunked_upload import chunked_upload_bp
     from routes.odoo_logs import odoo_logs_bp
     from routes.users import users_bp
+    from routes.jobs import jobs_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
@@ -45,6 +46,7 @@ def create_app():
     app.register_blueprint(chunked_upload_bp, url_prefix='/api')
     app.register_blueprint(odoo_logs_bp, url_prefix='/api/odoo-logs')
     app.register_blueprint(users_bp, url_prefix='/api/users')
+    app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
     
     # Manejadores de errores JWT
     @jwt.expired_token_loader
@@ -75,16 +77,28 @@ def create_app():
                 'instances': '/api/instances',
                 'logs': '/api/logs',
                 'backup': '/api/backup',
-                'github': '/api/github'
+                'github': '/api/github',
+                'jobs': '/api/jobs'
             }
         }), 200
     
     return app
 
+def _ensure_indexes():
+    """Crea los índices agregados a tablas que ya existían (create_all solo crea tablas nuevas)"""
+    from models import Job
+    for index in Job.__table__.indexes:
+        try:
+            index.create(db.engine, checkfirst=True)
+        except Exception as e:
+            # Otro worker pudo crearlo a la vez, o hay duplicados activos que resolver a mano
+            print(f"⚠️  No se pudo crear el índice {index.name}: {e}")
+
 def init_db(app):
     """Inicializa la base de datos y crea usuario admin por defecto"""
     with app.app_context():
         db.create_all()
+        _ensure_indexes()
         
         # Crear usuario admin si no existe
         admin = User.query.filter_by(username='admin').first()
@@ -103,5 +117,25 @@ if __name__ == '__main__':
     # Inicializar BD
     init_db(app)
     
+    # Grabador de métricas en segundo plano
+    from services.metrics_recorder import start_metrics_recorder
+    start_metrics_recorder(app)
+    
+    # Indexador de logs de Odoo
+    from services.log_index import start_log_indexer
+    start_log_indexer()
+    
+    # Supervisor de jobs (backups, restores, clonados)
+    from services.job_runner import start_job_runner
+    start_job_runner(app)
+
+    # Reconciliación del catálogo de backups
+    from services.backup_catalog import start_backup_catalog
+    start_backup_catalog(app)
+
+    # Separador de logs de nginx por dominio
+    from services.nginx_log_demux import start_nginx_log_demux
+    start_nginx_log_demux(app)
+
     # Ejecutar en modo desarrollo
     app.run(host='0.0.0.0', port=5000, debug=True)
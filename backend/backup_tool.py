@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Herramienta de los scripts de backup: almacén deduplicado de filestore,
+importación de uploads y encolado de los backups programados (cron)
+
+Uso:
+  backup_tool.py store <filestore_dir> <archivo_backup>
+  backup_tool.py release <archivo_backup>
+  backup_tool.py materialize <archivo_backup> <directorio_destino>
+  backup_tool.py stats
+  backup_tool.py import <instancia> <archivo> <nombre_original> [--cleanup <dir>]
+  backup_tool.py enqueue-backup <instancia>
+  backup_tool.py enqueue-base-backup
+  backup_tool.py sync-cron
+"""
+import sys
+import os
+import json
+import shutil
+import argparse
+from datetime import datetime
+
+# Agregar el directorio backend al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.filestore_store import FilestoreStore, manifest_path_for
+
+
+def _human(size_bytes):
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if size_bytes < 1024.0:
+            return f"{size_bytes:.2f} {unit}"
+        size_bytes /= 1024.0
+    return f"{size_bytes:.2f} PB"
+
+
+def cmd_store(store, args):
+    result = store.store_filestore(args.filestore, manifest_path_for(args.archive))
+    print(f"✅ Filestore: {result['file_count']} archivos ({_human(result['total_bytes'])}), "
+          f"{result['new_objects']} nuevos en el almacén ({_human(result['new_bytes'])})")
+    return 0
+
+
+def cmd_release(store, args):
+    manifest = manifest_path_for(args.archive)
+    if not os.path.exists(manifest):
+        print(f"ℹ️  {os.path.basename(args.archive)} no usa el almacén de filestore")
+        return 0
+    result = store.release(manifest)
+    print(f"🧹 Referencias liberadas: {result['released']}, objetos eliminados: "
+          f"{result['deleted_objects']} ({_human(result['freed_bytes'])})")
+    return 0
+
+
+def cmd_materialize(store, args):
+    result = store.materialize(manifest_path_for(args.archive), args.destination)
+    if result['missing']:
+        print(f"❌ Faltan {len(result['missing'])} archivos en el almacén")
+        return 1
+    print(f"✅ Filestore reconstruido: {result['file_count']} archivos")
+    return 0
+
+
+def cmd_stats(store, _args):
+    print(json.dumps(store.stats(), indent=2))
+    return 0
+
+
+def cmd_import(_store, args):
+    # Validación e importación de un upload por partes (job import_backup).
+    # Sin base del panel: el catálogo se reconcilia al terminar el job
+    from services.backup_manager_v2 import BackupManagerV2
+
+    try:
+        print(f"🔍 Validando {args.original_name} para {args.instance}...")
+        result = BackupManagerV2().import_backup_file(args.instance, args.file, args.original_name, record=False)
+    finally:
+        if args.cleanup:
+            shutil.rmtree(args.cleanup, ignore_errors=True)
+
+    if not result['success']:
+        print(f"❌ {result['error']}")
+        return 1
+    print(f"✅ Backup importado: {result['filename']} ({result['size_human']})")
+    return 0
+
+
+def _print_enqueued(result):
+    stamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if not result['success']:
+        print(f"[{stamp}] ❌ {result['error']}")
+        return 1
+    print(f"[{stamp}] {'⏸️ ' if result.get('skipped') else '✅'} {result['message']}")
+    return 0
+
+
+def _with_manager(action):
+    # Con contexto de la app: usa la base del panel (cola de jobs)
+    from app import create_app
+    from services.backup_manager_v2 import BackupManagerV2
+
+    with create_app().app_context():
+        return action(BackupManagerV2())
+
+
+def cmd_enqueue_backup(_store, args):
+    # Backups programados (cron): se encolan en el supervisor de jobs como los manuales
+    return _print_enqueued(_with_manager(lambda manager: manager.run_scheduled_backup(args.instance)))
+
+
+def cmd_enqueue_base_backup(_store, _args):
+    return _print_enqueued(_with_manager(lambda manager: manager.run_scheduled_base_backup()))
+
+
+def cmd_sync_cron(_store, _args):
+    _with_manager(lambda manager: manager._update_crontab())
+    print("✅ Cron de backups actualizado")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Herramienta de los scripts de backup')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_store = subparsers.add_parser('store', help='Agrega un filestore y escribe el manifiesto del backup')
+    parser_store.add_argument('filestore')
+    parser_store.add_argument('archive')
+    parser_store.set_defaults(func=cmd_store)
+
+    parser_release = subparsers.add_parser('release', help='Libera las referencias de un backup eliminado')
+    parser_release.add_argument('archive')
+    parser_release.set_defaults(func=cmd_release)
+
+    parser_materialize = subparsers.add_parser('materialize', help='Reconstruye el filestore de un backup')
+    parser_materialize.add_argument('archive')
+    parser_materialize.add_argument('destination')
+    parser_materialize.set_defaults(func=cmd_materialize)
+
+    parser_stats = subparsers.add_parser('stats', help='Estadísticas del almacén')
+    parser_stats.set_defaults(func=cmd_stats)
+
+    parser_import = subparsers.add_parser('import', help='Valida e importa un backup subido por partes')
+    parser_import.add_argument('instance')
+    parser_import.add_argument('file')
+    parser_import.add_argument('original_name')
+    parser_import.add_argument('--cleanup', help='Directorio del upload a eliminar al terminar')
+    parser_import.set_defaults(func=cmd_import)
+
+    parser_enqueue = subparsers.add_parser('enqueue-backup', help='Encola el backup programado de una instancia')
+    parser_enqueue.add_argument('instance')
+    parser_enqueue.set_defaults(func=cmd_enqueue_backup)
+
+    parser_enqueue_base = subparsers.add_parser('enqueue-base-backup', help='Encola el base backup PITR programado')
+    parser_enqueue_base.set_defaults(func=cmd_enqueue_base_backup)
+
+    parser_sync_cron = subparsers.add_parser('sync-cron', help='Regenera las líneas de cron de los backups')
+    parser_sync_cron.set_defaults(func=cmd_sync_cron)
+
+    args = parser.parse_args()
+    return args.func(FilestoreStore(), args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -30,9 +30,63 @@ class Config:
     PUERTOS_FILE = os.getenv('PUERTOS_FILE', f'{DATA_PATH}/puertos_ocupados_odoo.txt')
     DEV_INSTANCES_FILE = os.getenv('DEV_INSTANCES_FILE', f'{DATA_PATH}/dev-instances.txt')
     BACKUPS_PATH = os.getenv('BACKUPS_PATH', '/home/go/backups')
+    BACKUP_STORE_PATH = os.getenv('BACKUP_STORE_PATH', f'{BACKUPS_PATH}/store')
+    PITR_BASE_PATH = os.getenv('PITR_BASE_PATH', f'{BACKUPS_PATH}/pitr/base')
+    PITR_WAL_ARCHIVE_PATH = os.getenv('PITR_WAL_ARCHIVE_PATH', f'{BACKUPS_PATH}/pitr/wal')
+    # Uploads por partes reanudables (mismo filesystem que los backups: se mueven con rename)
+    UPLOADS_PATH = os.getenv('UPLOADS_PATH', f'{BACKUPS_PATH}/uploads')
+    UPLOAD_MAX_CHUNK_BYTES = int(os.getenv('UPLOAD_MAX_CHUNK_BYTES', str(256 * 1024 * 1024)))
+    UPLOAD_SESSION_EXPIRE_HOURS = float(os.getenv('UPLOAD_SESSION_EXPIRE_HOURS', '24'))
+    # Descargas de backups: location interna de nginx que sirve BACKUPS_PATH
+    # (X-Accel-Redirect; vacío = las sirve Flask) y vigencia de los enlaces firmados
+    BACKUP_DOWNLOAD_ACCEL_PREFIX = os.getenv('BACKUP_DOWNLOAD_ACCEL_PREFIX', '')
+    BACKUP_DOWNLOAD_URL_TTL_SECONDS = int(os.getenv('BACKUP_DOWNLOAD_URL_TTL_SECONDS', '900'))
+    # Exportaciones en vivo (pg_dump + filestore en streaming) simultáneas por worker
+    BACKUP_EXPORT_MAX_CONCURRENT = int(os.getenv('BACKUP_EXPORT_MAX_CONCURRENT', '1'))
+    # Clonado de bases para desarrollo: antigüedad máxima (horas) de un backup
+    # de producción para usarlo como origen en lugar de volcar la base (0 = nunca)
+    CLONE_BACKUP_MAX_AGE_HOURS = float(os.getenv('CLONE_BACKUP_MAX_AGE_HOURS', '6'))
     SYSTEM_USER_SYNC_SCRIPT = os.getenv('SYSTEM_USER_SYNC_SCRIPT', f'{SCRIPTS_PATH}/users/sync-instance-access.sh')
     SYSTEM_USER_SSH_KEY_SCRIPT = os.getenv('SYSTEM_USER_SSH_KEY_SCRIPT', f'{SCRIPTS_PATH}/users/set-ssh-public-key.sh')
     
+    # Métricas del sistema
+    METRICS_SAMPLE_INTERVAL_SECONDS = float(os.getenv('METRICS_SAMPLE_INTERVAL_SECONDS', '2'))
+    METRICS_SAMPLE_HISTORY = int(os.getenv('METRICS_SAMPLE_HISTORY', '300'))
+    METRICS_RECORDER_ENABLED = os.getenv('METRICS_RECORDER_ENABLED', 'true').lower() == 'true'
+    METRICS_RECORD_INTERVAL_SECONDS = float(os.getenv('METRICS_RECORD_INTERVAL_SECONDS', '15'))
+    METRICS_FLUSH_INTERVAL_SECONDS = float(os.getenv('METRICS_FLUSH_INTERVAL_SECONDS', '60'))
+    INSTANCE_METRICS_INTERVAL_SECONDS = float(os.getenv('INSTANCE_METRICS_INTERVAL_SECONDS', '60'))
+    CGROUP_SYSTEM_SLICE = os.getenv('CGROUP_SYSTEM_SLICE', '/sys/fs/cgroup/system.slice')
+    ODOO_FILESTORE_ROOT = os.getenv('ODOO_FILESTORE_ROOT', '/home/go/.local/share/Odoo/filestore')
+    NGINX_ACCESS_LOG = os.getenv('NGINX_ACCESS_LOG', '/var/log/nginx/access.log')
+    NGINX_ERROR_LOG = os.getenv('NGINX_ERROR_LOG', '/var/log/nginx/error.log')
+    NGINX_LOG_BUFFER_LINES = int(os.getenv('NGINX_LOG_BUFFER_LINES', '1000'))
+    NGINX_LOG_BACKFILL_MB = int(os.getenv('NGINX_LOG_BACKFILL_MB', '64'))
+    NGINX_LOG_BUFFER_PATH = os.getenv('NGINX_LOG_BUFFER_PATH', f'{DATA_PATH}/nginx-logs')
+    NGINX_LOG_DEMUX_LOCK_FILE = os.getenv('NGINX_LOG_DEMUX_LOCK_FILE', f'{DATA_PATH}/nginx-log-demux.lock')
+    TRAFFIC_RETENTION_MINUTES = int(os.getenv('TRAFFIC_RETENTION_MINUTES', '1440'))
+    METRICS_STREAM_MAX_SECONDS = int(os.getenv('METRICS_STREAM_MAX_SECONDS', '300'))
+    METRICS_STREAM_URL_TTL_SECONDS = int(os.getenv('METRICS_STREAM_URL_TTL_SECONDS', '60'))
+    METRICS_RECORDER_LOCK_FILE = os.getenv('METRICS_RECORDER_LOCK_FILE', f'{DATA_PATH}/metrics-recorder.lock')
+    
+    # Índice de logs de Odoo (búsqueda por rango de fechas / nivel)
+    LOG_INDEX_ENABLED = os.getenv('LOG_INDEX_ENABLED', 'true').lower() == 'true'
+    LOG_INDEX_PATH = os.getenv('LOG_INDEX_PATH', f'{DATA_PATH}/log-index')
+    LOG_INDEX_EVERY_LINES = int(os.getenv('LOG_INDEX_EVERY_LINES', '1000'))
+    LOG_INDEX_INTERVAL_SECONDS = float(os.getenv('LOG_INDEX_INTERVAL_SECONDS', '60'))
+    LOG_INDEX_SEARCH_TAIL_MB = int(os.getenv('LOG_INDEX_SEARCH_TAIL_MB', '16'))
+    
+    # Jobs (operaciones largas: backups, restores, clonados, actualizaciones)
+    JOBS_LOG_PATH = os.getenv('JOBS_LOG_PATH', f'{DATA_PATH}/jobs')
+    JOBS_MAX_CONCURRENT = int(os.getenv('JOBS_MAX_CONCURRENT', '2'))
+    JOBS_MAX_PER_INSTANCE = int(os.getenv('JOBS_MAX_PER_INSTANCE', '1'))
+    JOBS_POLL_INTERVAL_SECONDS = float(os.getenv('JOBS_POLL_INTERVAL_SECONDS', '2'))
+    JOB_RUNNER_LOCK_FILE = os.getenv('JOB_RUNNER_LOCK_FILE', f'{DATA_PATH}/job-runner.lock')
+    
+    # Catálogo de backups (se reconcilia con el disco cada N segundos)
+    BACKUP_CATALOG_RECONCILE_SECONDS = float(os.getenv('BACKUP_CATALOG_RECONCILE_SECONDS', '300'))
+    BACKUP_CATALOG_LOCK_FILE = os.getenv('BACKUP_CATALOG_LOCK_FILE', f'{DATA_PATH}/backup-catalog.lock')
+    
     # Domain configuration - IMPORTANTE: El dominio raíz está protegido
     DOMAIN_ROOT = os.getenv('DOMAIN_ROOT', 'hospitalprivadosalta.ar')
     PUBLIC_IP = os.getenv('PUBLIC_IP', '')
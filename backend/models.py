@@ -193,3 +193,237 @@ class MetricsHistory(db.Model):
             'network_sent_mb': self.network_sent_mb,
             'network_recv_mb': self.network_recv_mb
         }
+
+class MetricsRollup(db.Model):
+    """Agregados min/avg/max de MetricsHistory por resolución (1 min, 5 min, 1 h)"""
+    __tablename__ = 'metrics_rollups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    resolution_seconds = db.Column(db.Integer, nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    sample_count = db.Column(db.Integer, nullable=False, default=0)
+    cpu_percent_min = db.Column(db.Float)
+    cpu_percent_avg = db.Column(db.Float)
+    cpu_percent_max = db.Column(db.Float)
+    ram_percent_min = db.Column(db.Float)
+    ram_percent_avg = db.Column(db.Float)
+    ram_percent_max = db.Column(db.Float)
+    ram_used_gb_min = db.Column(db.Float)
+    ram_used_gb_avg = db.Column(db.Float)
+    ram_used_gb_max = db.Column(db.Float)
+    ram_total_gb_min = db.Column(db.Float)
+    ram_total_gb_avg = db.Column(db.Float)
+    ram_total_gb_max = db.Column(db.Float)
+    disk_percent_min = db.Column(db.Float)
+    disk_percent_avg = db.Column(db.Float)
+    disk_percent_max = db.Column(db.Float)
+    disk_used_gb_min = db.Column(db.Float)
+    disk_used_gb_avg = db.Column(db.Float)
+    disk_used_gb_max = db.Column(db.Float)
+    disk_total_gb_min = db.Column(db.Float)
+    disk_total_gb_avg = db.Column(db.Float)
+    disk_total_gb_max = db.Column(db.Float)
+    network_sent_mb_min = db.Column(db.Float)
+    network_sent_mb_avg = db.Column(db.Float)
+    network_sent_mb_max = db.Column(db.Float)
+    network_recv_mb_min = db.Column(db.Float)
+    network_recv_mb_avg = db.Column(db.Float)
+    network_recv_mb_max = db.Column(db.Float)
+    
+    __table_args__ = (
+        db.UniqueConstraint('resolution_seconds', 'bucket_start', name='_metrics_rollup_bucket_uc'),
+    )
+
+class InstanceMetricsHistory(db.Model):
+    """Muestras de consumo por instancia Odoo (cgroup de systemd, PostgreSQL, filestore, nginx)"""
+    __tablename__ = 'instance_metrics_history'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    instance_name = db.Column(db.String(100), nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    cpu_percent = db.Column(db.Float)
+    memory_mb = db.Column(db.Float)
+    workers = db.Column(db.Float)
+    connections = db.Column(db.Float)
+    db_size_mb = db.Column(db.Float)
+    filestore_mb = db.Column(db.Float)
+    requests_per_min = db.Column(db.Float)
+    
+    __table_args__ = (
+        db.Index('ix_instance_metrics_history_instance_ts', 'instance_name', 'timestamp'),
+    )
+    
+    def to_dict(self):
+        return {
+            'instance_name': self.instance_name,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'cpu_percent': self.cpu_percent,
+            'memory_mb': self.memory_mb,
+            'workers': self.workers,
+            'connections': self.connections,
+            'db_size_mb': self.db_size_mb,
+            'filestore_mb': self.filestore_mb,
+            'requests_per_min': self.requests_per_min
+        }
+
+class InstanceMetricsRollup(db.Model):
+    """Agregados min/avg/max de InstanceMetricsHistory por instancia y resolución"""
+    __tablename__ = 'instance_metrics_rollups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    instance_name = db.Column(db.String(100), nullable=False)
+    resolution_seconds = db.Column(db.Integer, nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    sample_count = db.Column(db.Integer, nullable=False, default=0)
+    cpu_percent_min = db.Column(db.Float)
+    cpu_percent_avg = db.Column(db.Float)
+    cpu_percent_max = db.Column(db.Float)
+    memory_mb_min = db.Column(db.Float)
+    memory_mb_avg = db.Column(db.Float)
+    memory_mb_max = db.Column(db.Float)
+    workers_min = db.Column(db.Float)
+    workers_avg = db.Column(db.Float)
+    workers_max = db.Column(db.Float)
+    connections_min = db.Column(db.Float)
+    connections_avg = db.Column(db.Float)
+    connections_max = db.Column(db.Float)
+    db_size_mb_min = db.Column(db.Float)
+    db_size_mb_avg = db.Column(db.Float)
+    db_size_mb_max = db.Column(db.Float)
+    filestore_mb_min = db.Column(db.Float)
+    filestore_mb_avg = db.Column(db.Float)
+    filestore_mb_max = db.Column(db.Float)
+    requests_per_min_min = db.Column(db.Float)
+    requests_per_min_avg = db.Column(db.Float)
+    requests_per_min_max = db.Column(db.Float)
+    
+    __table_args__ = (
+        db.UniqueConstraint('resolution_seconds', 'bucket_start', 'instance_name', name='_instance_metrics_rollup_bucket_uc'),
+    )
+
+class Job(db.Model):
+    """Operación larga sobre una instancia (backup, restore, clonado, etc.) ejecutada por el supervisor de jobs"""
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)  # restore, backup, create_dev, update_db, etc.
+    instance_name = db.Column(db.String(100), nullable=False, index=True)
+    priority = db.Column(db.Integer, nullable=False, default=0)  # Mayor valor = se ejecuta antes
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, success, error, cancelled
+    command = db.Column(db.Text, nullable=False)  # argv en JSON
+    cwd = db.Column(db.String(500))
+    stdin_data = db.Column(db.Text)
+    log_path = db.Column(db.String(500))
+    pid = db.Column(db.Integer)
+    exit_code = db.Column(db.Integer)
+    progress = db.Column(db.Integer)  # 0-100, si el script lo informa
+    progress_message = db.Column(db.String(500))
+    error = db.Column(db.Text)
+    cancel_requested = db.Column(db.Boolean, default=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    user = db.relationship('User', backref='jobs')
+    
+    __table_args__ = (
+        db.Index('ix_jobs_status_priority', 'status', 'priority', 'id'),
+        # Un solo job activo por instancia y tipo, aunque dos workers encolen a la vez
+        db.Index(
+            'uq_jobs_active_instance_type', 'instance_name', 'job_type', unique=True,
+            postgresql_where=db.text("status IN ('queued', 'running')"),
+            sqlite_where=db.text("status IN ('queued', 'running')"),
+        ),
+    )
+    
+    @property
+    def finished(self):
+        return self.status in ('success', 'error', 'cancelled')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'instance_name': self.instance_name,
+            'priority': self.priority,
+            'status': self.status,
+            'finished': self.finished,
+            'pid': self.pid,
+            'exit_code': self.exit_code,
+            'progress': self.progress,
+            'progress_message': self.progress_message,
+            'error': self.error,
+            'cancel_requested': bool(self.cancel_requested),
+            'log_file': self.log_path,
+            'user_id': self.user_id,
+            'username': self.user.username if self.user else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class LogCursor(db.Model):
+    """Posición leída de un log compartido (nginx) para que el próximo líder retome desde ahí"""
+    __tablename__ = 'log_cursors'
+    
+    path = db.Column(db.String(500), primary_key=True)
+    inode = db.Column(db.BigInteger, nullable=False)
+    offset = db.Column(db.BigInteger, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class TrafficMinute(db.Model):
+    """Agregado del access.log de nginx por dominio y minuto (lo escribe el lector líder de logs)"""
+    __tablename__ = 'traffic_minutes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    domain = db.Column(db.String(255), nullable=False)
+    minute = db.Column(db.DateTime, nullable=False, index=True)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    timed = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.Text)  # JSON {código: cantidad}
+    latency = db.Column(db.Text)  # JSON {bucket: cantidad}
+    slow_urls = db.Column(db.Text)  # JSON del top Space-Saving
+    
+    __table_args__ = (
+        db.UniqueConstraint('domain', 'minute', name='_traffic_minute_uc'),
+    )
+
+class BackupRecord(db.Model):
+    """Backup de una instancia registrado en el catálogo (un archivo en su directorio de backups)"""
+    __tablename__ = 'backup_records'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    instance_name = db.Column(db.String(100), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    size_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    mtime = db.Column(db.Float)  # Para detectar cambios al reconciliar
+    checksum = db.Column(db.String(64))  # SHA-256 del archivo, si se conoce
+    db_size_bytes = db.Column(db.BigInteger)  # Tamaño del dump sin comprimir
+    filestore_size_bytes = db.Column(db.BigInteger)
+    dump_format = db.Column(db.String(20))  # sql, directory
+    filestore_mode = db.Column(db.String(20))  # archive, store
+    source = db.Column(db.String(20))  # backup, upload, scan
+    created_at = db.Column(db.DateTime)
+    recorded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('instance_name', 'filename', name='_backup_record_uc'),)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'instance_name': self.instance_name,
+            'filename': self.filename,
+            'size_bytes': self.size_bytes,
+            'checksum': self.checksum,
+            'db_size_bytes': self.db_size_bytes,
+            'filestore_size_bytes': self.filestore_size_bytes,
+            'dump_format': self.dump_format,
+            'filestore_mode': self.filestore_mode,
+            'source': self.source,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'recorded_at': self.recorded_at.isoformat() if self.recorded_at else None
+        }
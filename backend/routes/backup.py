@@ -1,7 +1,8 @@
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import User, ActionLog, db
 from services.backup_manager import BackupManager
+from services.backup_downloads import send_backup_file, signed_download_url
 import os
 from datetime import datetime
 import logging
@@ -57,7 +58,7 @@ def create_backup():
         return jsonify({'error': 'Permisos insuficientes'}), 403
     
     try:
-        result = manager.create_backup()
+        result = manager.create_backup(user_id=user_id)
         
         # Log
         log_action(
@@ -97,19 +98,36 @@ def download_backup(filename):
         return jsonify({'error': 'Backup no encontrado'}), 404
     
     try:
-        # Log
-        log_action(user_id, 'download_backup', filename, 'Descarga iniciada', 'success')
+        # Log (las reanudaciones con Range no cuentan como descargas nuevas)
+        if not request.headers.get('Range'):
+            log_action(user_id, 'download_backup', filename, 'Descarga iniciada', 'success')
         
-        return send_file(
-            backup_path,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/gzip'
-        )
+        return send_backup_file(backup_path, filename)
     except Exception as e:
         log_action(user_id, 'download_backup', filename, str(e), 'error')
         return jsonify({'error': str(e)}), 500
 
+@backup_bp.route('/download-url/<filename>', methods=['POST'])
+@jwt_required()
+def create_download_url(filename):
+    """Genera un enlace de descarga firmado y de corta duración para el navegador"""
+    user_id = int(get_jwt_identity())
+    user = User.query.get(user_id)
+    
+    if user.role != 'admin':
+        return jsonify({'error': 'Permisos insuficientes'}), 403
+    
+    if not filename.startswith('backup_') or not filename.endswith('.tar.gz'):
+        return jsonify({'error': 'Nombre de archivo inválido'}), 400
+    
+    backup_path = os.path.join(manager.backup_dir, filename)
+    if not os.path.exists(backup_path):
+        return jsonify({'error': 'Backup no encontrado'}), 404
+    
+    url, expires = signed_download_url(backup_path)
+    log_action(user_id, 'download_backup', filename, 'Descarga iniciada', 'success')
+    return jsonify({'url': url, 'expires_at': datetime.utcfromtimestamp(expires).isoformat()}), 200
+
 @backup_bp.route('/delete/<filename>', methods=['DELETE'])
 @jwt_required()
 def delete_backup(filename):
@@ -231,7 +249,7 @@ def restore_backup():
         if not confirmed:
             return jsonify({'error': 'Debe confirmar la restauración'}), 400
         
-        result = manager.restore_backup(filename)
+        result = manager.restore_backup(filename, user_id=user_id)
         
         if result['success']:
             log_action(
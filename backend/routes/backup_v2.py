@@ -1,8 +1,11 @@
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, Response, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import User, ActionLog, db
 from services.backup_manager_v2 import BackupManagerV2
 from services.access_control import can_user_access_instance, filter_instances_for_user
+from services.backup_downloads import (
+    send_backup_file, signed_download_url, resolve_signed_download, signed_export_url, check_signed_export
+)
 import os
 from datetime import datetime
 import logging
@@ -209,7 +212,7 @@ def create_instance_backup(instance_name):
         data = request.get_json(silent=True) or {}
         custom_filename = data.get('custom_filename')
 
-        result = manager.create_backup(instance_name, custom_filename=custom_filename)
+        result = manager.create_backup(instance_name, custom_filename=custom_filename, user_id=user_id)
         
         log_action(
             user_id,
@@ -251,40 +254,125 @@ def delete_instance_backup(instance_name, filename):
         log_action(user_id, 'delete_backup', instance_name, str(e), 'error')
         return jsonify({'error': str(e)}), 500
 
+def _resolve_instance_backup(instance_name, filename):
+    """Ruta de un backup de la instancia, o (None, respuesta de error)"""
+    if not manager._is_safe_backup_filename(filename):
+        return None, (jsonify({'error': 'Nombre de archivo inválido'}), 400)
+    backup_path = os.path.join(manager._get_instance_dir(instance_name), filename)
+    if not os.path.exists(backup_path):
+        return None, (jsonify({'error': 'Backup no encontrado'}), 404)
+    return backup_path, None
+
 @backup_v2_bp.route('/instances/<instance_name>/backups/<filename>/download', methods=['GET'])
 @jwt_required()
 def download_instance_backup(instance_name, filename):
-    """Descarga un backup específico"""
+    """Descarga un backup específico (Range/ETag; vía nginx si está configurado)"""
     user_id, user = _get_current_user()
     access_error = _ensure_instance_access(user, instance_name)
     if access_error:
         return access_error
     
     try:
-        instance_dir = manager._get_instance_dir(instance_name)
-        backup_path = os.path.join(instance_dir, filename)
-        
-        if not os.path.exists(backup_path):
-            return jsonify({'error': 'Backup no encontrado'}), 404
-        
-        if not manager._is_safe_backup_filename(filename):
-            return jsonify({'error': 'Nombre de archivo inválido'}), 400
+        backup_path, error = _resolve_instance_backup(instance_name, filename)
+        if error:
+            return error
         
-        log_action(user_id, 'download_backup', instance_name, f"Downloaded: {filename}", 'success')
+        # Las reanudaciones (Range) no se registran como descargas nuevas
+        if not request.headers.get('Range'):
+            log_action(user_id, 'download_backup', instance_name, f"Downloaded: {filename}", 'success')
         
-        mimetype = 'application/zip' if filename.endswith('.zip') else 'application/gzip'
-
-        return send_file(
-            backup_path,
-            as_attachment=True,
-            download_name=filename,
-            mimetype=mimetype
-        )
+        # El checksum del catálogo es un ETag fuerte y estable
+        record = manager.catalog.get(instance_name, filename)
+        return send_backup_file(backup_path, filename, etag=record.checksum if record else None)
     except Exception as e:
         logger.error(f"Error downloading backup {filename} for {instance_name}: {e}")
         log_action(user_id, 'download_backup', instance_name, str(e), 'error')
         return jsonify({'error': str(e)}), 500
 
+@backup_v2_bp.route('/instances/<instance_name>/backups/<filename>/download-url', methods=['POST'])
+@jwt_required()
+def create_download_url(instance_name, filename):
+    """Genera un enlace de descarga firmado y de corta duración para el navegador"""
+    user_id, user = _get_current_user()
+    access_error = _ensure_instance_access(user, instance_name)
+    if access_error:
+        return access_error
+    
+    backup_path, error = _resolve_instance_backup(instance_name, filename)
+    if error:
+        return error
+    
+    url, expires = signed_download_url(backup_path)
+    log_action(user_id, 'download_backup', instance_name, f"Downloaded: {filename}", 'success')
+    return jsonify({'url': url, 'expires_at': datetime.utcfromtimestamp(expires).isoformat()}), 200
+
+@backup_v2_bp.route('/download', methods=['GET'])
+def download_signed():
+    """Descarga con enlace firmado (sin JWT: la firma HMAC y la expiración son la autorización)"""
+    backup_path, error = resolve_signed_download(
+        request.args.get('path'), request.args.get('expires'), request.args.get('sig')
+    )
+    if error:
+        message, status = error
+        return jsonify({'error': message}), status
+    
+    return send_backup_file(backup_path)
+
+def _export_response(instance_name):
+    """Respuesta en streaming de la exportación en vivo, o error JSON"""
+    result = manager.export_backup_stream(instance_name)
+    if not result['success']:
+        return jsonify({'error': result['error']}), 429 if result.get('busy') else 404
+    
+    # Sin Content-Length: se envía con chunked encoding; nginx no debe bufferizar
+    return Response(
+        result['stream'],
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f"attachment; filename={result['filename']}",
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@backup_v2_bp.route('/instances/<instance_name>/export', methods=['GET'])
+@jwt_required()
+def export_instance(instance_name):
+    """Exporta la instancia en vivo (dump + filestore en .zip) sin crear un backup en disco"""
+    user_id, user = _get_current_user()
+    access_error = _ensure_instance_access(user, instance_name)
+    if access_error:
+        return access_error
+    
+    response = _export_response(instance_name)
+    if isinstance(response, Response):
+        log_action(user_id, 'export_backup', instance_name, 'Exportación en vivo', 'success')
+    return response
+
+@backup_v2_bp.route('/instances/<instance_name>/export-url', methods=['POST'])
+@jwt_required()
+def create_export_url(instance_name):
+    """Genera un enlace firmado para descargar la exportación en vivo desde el navegador"""
+    user_id, user = _get_current_user()
+    access_error = _ensure_instance_access(user, instance_name)
+    if access_error:
+        return access_error
+    
+    url, expires = signed_export_url(instance_name)
+    log_action(user_id, 'export_backup', instance_name, 'Exportación en vivo', 'success')
+    return jsonify({'url': url, 'expires_at': datetime.utcfromtimestamp(expires).isoformat()}), 200
+
+@backup_v2_bp.route('/export', methods=['GET'])
+def export_signed():
+    """Exportación en vivo con enlace firmado (sin JWT)"""
+    instance_name = request.args.get('instance')
+    error = check_signed_export(instance_name, request.args.get('expires'), request.args.get('sig'))
+    if error:
+        message, status = error
+        return jsonify({'error': message}), status
+    
+    return _export_response(instance_name)
+
 @backup_v2_bp.route('/instances/<instance_name>/restore', methods=['POST'])
 @jwt_required()
 def restore_instance_backup(instance_name):
@@ -301,7 +389,7 @@ def restore_instance_backup(instance_name):
         if not filename:
             return jsonify({'error': 'Se requiere el nombre del archivo'}), 400
         
-        result = manager.restore_backup(instance_name, filename)
+        result = manager.restore_backup(instance_name, filename, user_id=user_id)
         
         log_action(
             user_id,
@@ -317,6 +405,105 @@ def restore_instance_backup(instance_name):
         log_action(user_id, 'restore_backup', instance_name, str(e), 'error')
         return jsonify({'error': str(e)}), 500
 
+@backup_v2_bp.route('/instances/<instance_name>/restore-pitr', methods=['POST'])
+@jwt_required()
+def restore_instance_point_in_time(instance_name):
+    """Restaura la base de una instancia a un punto en el tiempo (WAL archivado)"""
+    user_id, user = _get_current_user()
+    access_error = _ensure_instance_access(user, instance_name)
+    if access_error:
+        return access_error
+
+    try:
+        data = request.get_json() or {}
+        target_time = data.get('target_time')
+
+        if not target_time:
+            return jsonify({'error': 'Se requiere la fecha objetivo (target_time)'}), 400
+
+        result = manager.restore_point_in_time(instance_name, target_time, user_id=user_id)
+
+        log_action(
+            user_id,
+            'restore_pitr',
+            instance_name,
+            result.get('message') or result.get('error'),
+            'success' if result['success'] else 'error'
+        )
+
+        return jsonify(result), 200 if result['success'] else 400
+    except Exception as e:
+        logger.error(f"Error restoring {instance_name} to point in time: {e}")
+        log_action(user_id, 'restore_pitr', instance_name, str(e), 'error')
+        return jsonify({'error': str(e)}), 500
+
+# ============================================================================
+# ENDPOINTS DE PITR (BASE BACKUPS + WAL ARCHIVADO)
+# ============================================================================
+
+def _require_admin():
+    _, user = _get_current_user()
+    if not user:
+        return jsonify({'error': 'Usuario no encontrado'}), 404
+    if user.role != 'admin':
+        return jsonify({'error': 'Permisos insuficientes'}), 403
+    return None
+
+@backup_v2_bp.route('/pitr', methods=['GET'])
+@jwt_required()
+def get_pitr_status():
+    """Base backups disponibles y ventana de restauración a un punto en el tiempo"""
+    admin_error = _require_admin()
+    if admin_error:
+        return admin_error
+
+    try:
+        return jsonify(manager.get_pitr_status()), 200
+    except Exception as e:
+        logger.error(f"Error getting PITR status: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@backup_v2_bp.route('/pitr/config', methods=['PUT'])
+@jwt_required()
+def update_pitr_config():
+    """Activa los base backups programados y define su frecuencia"""
+    admin_error = _require_admin()
+    if admin_error:
+        return admin_error
+
+    user_id = int(get_jwt_identity())
+    try:
+        data = request.get_json() or {}
+        result = manager.update_pitr_config(enabled=data.get('enabled'), schedule=data.get('schedule'))
+        log_action(user_id, 'update_pitr_config', None, str(data), 'success' if result['success'] else 'error')
+        return jsonify(result), 200 if result['success'] else 400
+    except Exception as e:
+        logger.error(f"Error updating PITR config: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@backup_v2_bp.route('/pitr/base-backup', methods=['POST'])
+@jwt_required()
+def create_base_backup():
+    """Encola un base backup del cluster"""
+    admin_error = _require_admin()
+    if admin_error:
+        return admin_error
+
+    user_id = int(get_jwt_identity())
+    try:
+        result = manager.create_base_backup(user_id=user_id)
+        log_action(
+            user_id,
+            'create_base_backup',
+            None,
+            result.get('message') or result.get('error'),
+            'success' if result['success'] else 'error'
+        )
+        return jsonify(result), 200 if result['success'] else 409
+    except Exception as e:
+        logger.error(f"Error creating base backup: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # ============================================================================
 # ENDPOINTS DE LOGS
 # ============================================================================
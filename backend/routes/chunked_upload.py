@@ -1,92 +1,113 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import User
-import os
-import hashlib
-
-from config import Config
+from services.access_control import can_user_access_instance
+from services.chunked_uploads import ChunkedUploadManager
 
 chunked_upload_bp = Blueprint('chunked_upload', __name__)
+uploads = ChunkedUploadManager()
+
+
+def _get_session_for_user(upload_id):
+    """Sesión de upload si existe y el usuario tiene acceso a su instancia"""
+    user = User.query.get(int(get_jwt_identity()))
+    session = uploads.get_session(upload_id)
+    if not session:
+        return None, (jsonify({'error': 'Upload no encontrado'}), 404)
+    if not can_user_access_instance(user, session['instance_name']):
+        return None, (jsonify({'error': 'Permisos insuficientes'}), 403)
+    return session, None
 
-# Almacenamiento temporal de chunks
-UPLOAD_FOLDER = '/tmp/chunked_uploads'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 @chunked_upload_bp.route('/chunked-upload', methods=['POST'])
 @jwt_required()
-def chunked_upload():
-    """Upload de archivos en chunks para evitar límites"""
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    
-    if user.role != 'admin':
+def init_chunked_upload():
+    """
+    Inicia un upload por partes de un backup.
+    Body: {instance_name, file_name, file_size, chunk_size}
+    """
+    user = User.query.get(int(get_jwt_identity()))
+    data = request.get_json() or {}
+    instance_name = data.get('instance_name')
+
+    if not can_user_access_instance(user, instance_name):
         return jsonify({'error': 'Permisos insuficientes'}), 403
-    
+
     try:
-        # Obtener datos del chunk
-        chunk = request.files.get('chunk')
-        chunk_number = int(request.form.get('chunkNumber', 0))
-        total_chunks = int(request.form.get('totalChunks', 1))
-        file_name = request.form.get('fileName', 'unknown')
-        file_id = request.form.get('fileId')  # ID único para el archivo
-        
-        if not chunk or not file_id:
-            return jsonify({'error': 'Datos incompletos'}), 400
-        
-        # Crear directorio para este archivo
-        file_dir = os.path.join(UPLOAD_FOLDER, file_id)
-        os.makedirs(file_dir, exist_ok=True)
-        
-        # Guardar chunk
-        chunk_path = os.path.join(file_dir, f'chunk_{chunk_number}')
-        chunk.save(chunk_path)
-        
-        # Si es el último chunk, ensamblar el archivo
-        if chunk_number == total_chunks - 1:
-            final_path = os.path.join(Config.BACKUPS_PATH, file_name)
-            
-            # Ensamblar todos los chunks
-            with open(final_path, 'wb') as final_file:
-                for i in range(total_chunks):
-                    chunk_file = os.path.join(file_dir, f'chunk_{i}')
-                    with open(chunk_file, 'rb') as cf:
-                        final_file.write(cf.read())
-                    os.remove(chunk_file)  # Limpiar chunk
-            
-            # Limpiar directorio temporal
-            os.rmdir(file_dir)
-            
-            # Obtener tamaño
-            size = os.path.getsize(final_path)
-            
-            return jsonify({
-                'success': True,
-                'message': 'Archivo ensamblado exitosamente',
-                'fileName': file_name,
-                'size': size,
-                'complete': True
-            }), 200
-        
-        return jsonify({
-            'success': True,
-            'message': f'Chunk {chunk_number + 1}/{total_chunks} recibido',
-            'complete': False
-        }), 200
-        
+        result = uploads.init_upload(
+            instance_name,
+            data.get('file_name'),
+            data.get('file_size'),
+            data.get('chunk_size'),
+            user_id=user.id
+        )
+        if not result['success']:
+            return jsonify({'error': result['error']}), 400
+        return jsonify(result), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@chunked_upload_bp.route('/chunked-upload/cancel', methods=['POST'])
+
+@chunked_upload_bp.route('/chunked-upload/<upload_id>', methods=['GET'])
 @jwt_required()
-def cancel_chunked_upload():
-    """Cancelar upload y limpiar chunks"""
+def get_chunked_upload(upload_id):
+    """Estado del upload: partes recibidas (para reanudarlo)"""
+    _session, error = _get_session_for_user(upload_id)
+    if error:
+        return error
+    return jsonify(uploads.get_status(upload_id)), 200
+
+
+@chunked_upload_bp.route('/chunked-upload/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@jwt_required()
+def put_chunk(upload_id, index):
+    """
+    Recibe una parte (cuerpo binario, application/octet-stream) y la escribe en su offset.
+    Header opcional X-Chunk-Sha256 con el checksum de la parte.
+    """
+    _session, error = _get_session_for_user(upload_id)
+    if error:
+        return error
+
     try:
-        file_id = request.json.get('fileId')
-        if file_id:
-            file_dir = os.path.join(UPLOAD_FOLDER, file_id)
-            if os.path.exists(file_dir):
-                import shutil
-                shutil.rmtree(file_dir)
-        return jsonify({'success': True}), 200
+        # Compatibilidad con clientes multipart: campo 'chunk'
+        chunk = request.files.get('chunk') if request.content_type and request.content_type.startswith('multipart/') else None
+        stream = chunk.stream if chunk else request.stream
+        result = uploads.write_chunk(upload_id, index, stream, request.headers.get('X-Chunk-Sha256'))
+        if not result['success']:
+            return jsonify({'error': result['error']}), 400
+        return jsonify(result), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+@chunked_upload_bp.route('/chunked-upload/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_chunked_upload(upload_id):
+    """Cierra el upload y encola la validación/importación del backup como job"""
+    _session, error = _get_session_for_user(upload_id)
+    if error:
+        return error
+
+    try:
+        result = uploads.complete_upload(upload_id, user_id=int(get_jwt_identity()))
+        if not result['success']:
+            # Faltan partes: 400 (el cliente reenvía missing_chunks); ya completado o job activo: 409
+            return jsonify(result), 400 if 'missing_chunks' in result else 409
+        return jsonify(result), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@chunked_upload_bp.route('/chunked-upload/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_chunked_upload(upload_id):
+    """Cancela el upload y libera el espacio"""
+    _session, error = _get_session_for_user(upload_id)
+    if error:
+        return error
+
+    result = uploads.cancel_upload(upload_id)
+    if not result['success']:
+        return jsonify({'error': result['error']}), 409
+    return jsonify(result), 200
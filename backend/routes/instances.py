@@ -4,6 +4,8 @@ from services.instance_manager import InstanceManager
 from models import db, ActionLog, User
 from services.access_control import can_user_access_instance, filter_instances_for_user, grant_user_instance_access
 from services.system_user_access import get_system_username
+from services.traffic_analytics import get_traffic_analytics
+from services.job_runner import latest_job, read_job_log, read_job_log_since
 
 instances_bp = Blueprint('instances', __name__)
 manager = InstanceManager()
@@ -120,6 +122,7 @@ def create_instance():
             git_branch,
             system_username,
             system_accesses,
+            user_id=user_id,
         )
         
         # Log
@@ -139,7 +142,7 @@ def create_instance():
             db.session.commit()
             return jsonify(result), 202  # Accepted
         else:
-            return jsonify(result), 500
+            return jsonify(result), 409 if result.get('job_id') else 500
     except Exception as e:
         log_action(user_id, 'create_instance', f"dev-{data['name']}", str(e), 'error')
         return jsonify({'error': str(e)}), 500
@@ -202,7 +205,7 @@ def create_production_instance():
         return jsonify({'error': 'Edición debe ser enterprise o community'}), 400
     
     try:
-        result = manager.create_prod_instance(name, version, edition, ssl_method)
+        result = manager.create_prod_instance(name, version, edition, ssl_method, user_id=user_id)
         
         # Log
         log_action(
@@ -309,7 +312,7 @@ def update_instance_db(instance_name):
         data = request.get_json() or {}
         neutralize = data.get('neutralize', True)
         
-        result = manager.update_instance_db(instance_name, neutralize=neutralize)
+        result = manager.update_instance_db(instance_name, neutralize=neutralize, user_id=user_id)
         
         # Log
         log_action(
@@ -323,7 +326,8 @@ def update_instance_db(instance_name):
         if result['success']:
             return jsonify(result), 200
         else:
-            return jsonify(result), 500
+            # Ya hay un job igual en cola o en curso
+            return jsonify(result), 409 if result.get('job_id') else 500
     except Exception as e:
         log_action(user_id, 'update_db', instance_name, str(e), 'error')
         return jsonify({'error': str(e)}), 500
@@ -343,7 +347,7 @@ def update_instance_files(instance_name):
         return jsonify({'error': 'No tienes acceso a esta instancia'}), 403
     
     try:
-        result = manager.update_instance_files(instance_name)
+        result = manager.update_instance_files(instance_name, user_id=user_id)
         
         # Log
         log_action(
@@ -357,7 +361,8 @@ def update_instance_files(instance_name):
         if result['success']:
             return jsonify(result), 200
         else:
-            return jsonify(result), 500
+            # Ya hay un job igual en cola o en curso
+            return jsonify(result), 409 if result.get('job_id') else 500
     except Exception as e:
         log_action(user_id, 'update_files', instance_name, str(e), 'error')
         return jsonify({'error': str(e)}), 500
@@ -387,6 +392,39 @@ def get_instance_logs(instance_name):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@instances_bp.route('/<instance_name>/traffic', methods=['GET'])
+@jwt_required()
+def get_instance_traffic(instance_name):
+    """Tráfico HTTP de la instancia por minuto: requests, status, bytes, latencias y URLs lentas"""
+    minutes = request.args.get('minutes', default=60, type=int) or 60
+    top = min(request.args.get('top', default=10, type=int) or 10, 50)
+
+    user_id = int(get_jwt_identity())
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({'error': 'Usuario no encontrado'}), 404
+
+    if not can_user_access_instance(user, instance_name):
+        return jsonify({'error': 'No tienes acceso a esta instancia'}), 403
+
+    try:
+        instance = manager.get_instance(instance_name)
+        if not instance:
+            return jsonify({'error': 'Instancia no encontrada'}), 404
+        if not instance['domain']:
+            return jsonify({'error': 'Dominio no encontrado'}), 404
+
+        traffic = get_traffic_analytics().get_traffic(instance['domain'], minutes, top)
+        return jsonify({
+            'instance': instance_name,
+            'domain': instance['domain'],
+            'range_minutes': minutes,
+            'resolution_seconds': 60,
+            **traffic
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @instances_bp.route('/<instance_name>/restart', methods=['POST'])
 @jwt_required()
 def restart_instance(instance_name):
@@ -424,9 +462,7 @@ def restart_instance(instance_name):
 @instances_bp.route('/creation-log/<instance_name>', methods=['GET'])
 @jwt_required()
 def get_creation_log(instance_name):
-    """Obtiene log incremental + estado + pid de creación"""
-    import os
-
+    """Obtiene log + estado + pid del job de creación más reciente"""
     user_id = int(get_jwt_identity())
     user = User.query.get(user_id)
     if not user:
@@ -435,69 +471,46 @@ def get_creation_log(instance_name):
     if not can_user_access_instance(user, instance_name):
         return jsonify({'error': 'No tienes acceso a esta instancia'}), 403
 
-    # Paths
-    log_file = f'/tmp/odoo-create-{instance_name}.log'
-    pid_file = f'/tmp/{instance_name}.pid'
-    status_file = f'/tmp/{instance_name}.status'
+    job = latest_job(instance_name, ['create_dev', 'create_prod'])
 
-    # Si el log aún no existe
-    if not os.path.exists(log_file):
+    # Si el job aún no existe o no arrancó
+    if not job or job.status == 'queued':
         return jsonify({
             'exists': False,
-            'log': 'Log no disponible aún...',
+            'log': 'En cola, esperando turno...' if job else 'Log no disponible aún...',
             'pid': None,
             'status': 'pending',
             'finished': False,
-            'error': False
+            'error': False,
+            'job_id': job.id if job else None
         }), 200
 
-    # Leer últimas 5000 bytes estilo tail
+    # Con ?since=<offset> solo lo agregado; si no, últimos 5000 bytes estilo tail
+    since = request.args.get('since', type=int)
     try:
-        with open(log_file, 'rb') as f:
-            f.seek(0, os.SEEK_END)
-            size = f.tell()
-            offset = max(size - 5000, 0)
-            f.seek(offset)
-            log_content = f.read().decode(errors="replace")
-    except Exception as e:
+        if since is not None:
+            log_content, next_offset, _size = read_job_log_since(job, max(since, 0))
+        else:
+            log_content, next_offset = read_job_log(job, 5000)
+    except OSError as e:
         return jsonify({'error': f'Error leyendo log: {e}'}), 500
 
-    # Leer PID
-    pid = None
-    if os.path.exists(pid_file):
-        try:
-            with open(pid_file, 'r') as f:
-                pid = f.read().strip()
-        except:
-            pid = None
-
-    # Leer estado
-    status = "running"
-    if os.path.exists(status_file):
-        try:
-            with open(status_file, 'r') as f:
-                status = f.read().strip()
-        except:
-            status = "unknown"
-
-    finished = (status == "success")
-    error = (status == "error")
-
     return jsonify({
         'exists': True,
         'log': log_content,
-        'pid': pid,
-        'status': status,
-        'finished': finished,
-        'error': error
+        'append': since is not None,
+        'next_offset': next_offset,
+        'pid': job.pid,
+        'status': job.status,
+        'finished': job.status == 'success',
+        'error': job.status in ('error', 'cancelled'),
+        'job_id': job.id
     }), 200
 
 @instances_bp.route('/update-log/<instance_name>/<action>', methods=['GET'])
 @jwt_required()
 def get_update_log(instance_name, action):
-    """Obtiene el log de actualización de una instancia"""
-    import os
-
+    """Obtiene el log del job de actualización más reciente de una instancia"""
     user_id = int(get_jwt_identity())
     user = User.query.get(user_id)
     if not user:
@@ -506,24 +519,42 @@ def get_update_log(instance_name, action):
     if not can_user_access_instance(user, instance_name):
         return jsonify({'error': 'No tienes acceso a esta instancia'}), 403
     
-    log_files = {
-        'update-db': f'/tmp/odoo-update-db-{instance_name}.log',
-        'update-files': f'/tmp/odoo-update-files-{instance_name}.log',
-        'sync-filestore': f'/tmp/odoo-sync-filestore-{instance_name}.log',
-        'regenerate-assets': f'/tmp/odoo-regenerate-assets-{instance_name}.log'
+    job_types = {
+        'update-db': 'update_db',
+        'update-files': 'update_files',
+        'sync-filestore': 'sync_filestore',
+        'regenerate-assets': 'regenerate_assets'
     }
     
-    log_file = log_files.get(action)
-    if not log_file:
+    job_type = job_types.get(action)
+    if not job_type:
         return jsonify({'error': 'Acción no válida'}), 400
     
-    if not os.path.exists(log_file):
-        return jsonify({'log': 'Log no disponible aún...', 'exists': False}), 200
+    job = latest_job(instance_name, job_type)
+    if not job or job.status == 'queued':
+        return jsonify({
+            'log': 'En cola, esperando turno...' if job else 'Log no disponible aún...',
+            'exists': False,
+            'completed': False,
+            'job_id': job.id if job else None
+        }), 200
     
+    # Con ?since=<offset> solo se devuelve lo agregado desde la última consulta
+    since = request.args.get('since', type=int)
     try:
-        with open(log_file, 'r') as f:
-            content = f.read()
-        return jsonify({'log': content, 'exists': True}), 200
+        if since is not None:
+            content, next_offset, _size = read_job_log_since(job, max(since, 0))
+        else:
+            content, next_offset = read_job_log(job)
+        return jsonify({
+            'log': content,
+            'append': since is not None,
+            'next_offset': next_offset,
+            'exists': True,
+            'completed': job.finished,
+            'status': job.status,
+            'job_id': job.id
+        }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -542,7 +573,7 @@ def sync_instance_filestore(instance_name):
         return jsonify({'error': 'No tienes acceso a esta instancia'}), 403
     
     try:
-        result = manager.sync_filestore(instance_name)
+        result = manager.sync_filestore(instance_name, user_id=user_id)
         
         # Log
         log_action(
@@ -556,7 +587,8 @@ def sync_instance_filestore(instance_name):
         if result['success']:
             return jsonify(result), 200
         else:
-            return jsonify(result), 500
+            # Ya hay un job igual en cola o en curso
+            return jsonify(result), 409 if result.get('job_id') else 500
     except Exception as e:
         log_action(user_id, 'sync_filestore', instance_name, str(e), 'error')
         return jsonify({'error': str(e)}), 500
@@ -576,7 +608,7 @@ def regenerate_instance_assets(instance_name):
         return jsonify({'error': 'No tienes acceso a esta instancia'}), 403
     
     try:
-        result = manager.regenerate_assets(instance_name)
+        result = manager.regenerate_assets(instance_name, user_id=user_id)
         
         # Log
         log_action(
@@ -590,7 +622,8 @@ def regenerate_instance_assets(instance_name):
         if result['success']:
             return jsonify(result), 200
         else:
-            return jsonify(result), 500
+            # Ya hay un job igual en cola o en curso
+            return jsonify(result), 409 if result.get('job_id') else 500
     except Exception as e:
         log_action(user_id, 'regenerate_assets', instance_name, str(e), 'error')
         return jsonify({'error': str(e)}), 500
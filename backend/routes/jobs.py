@@ -0,0 +1,162 @@
+from flask import Blueprint, jsonify, request, make_response
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db, Job, User, ActionLog
+from services.access_control import can_user_access_instance, get_user_allowed_instances
+from services.job_runner import (
+    LOG_CHUNK_BYTES,
+    cancel_job,
+    queue_position,
+    read_job_log,
+    read_job_log_since,
+    wait_for_job_log,
+)
+
+jobs_bp = Blueprint('jobs', __name__)
+
+# Bytes del final del log que se devuelven por defecto
+DEFAULT_LOG_TAIL_BYTES = 64 * 1024
+MAX_LOG_TAIL_BYTES = 1024 * 1024
+
+# Espera máxima de un long-poll (por debajo del proxy_read_timeout de nginx)
+MAX_LOG_WAIT_SECONDS = 25
+
+
+def _get_job_for_user(job_id):
+    """Devuelve (job, user, error_response)"""
+    user = User.query.get(int(get_jwt_identity()))
+    if not user:
+        return None, None, (jsonify({'error': 'Usuario no encontrado'}), 404)
+
+    job = Job.query.get(job_id)
+    if not job:
+        return None, user, (jsonify({'error': 'Job no encontrado'}), 404)
+
+    if not can_user_access_instance(user, job.instance_name):
+        return None, user, (jsonify({'error': 'No tienes acceso a esta instancia'}), 403)
+
+    return job, user, None
+
+
+@jobs_bp.route('', methods=['GET'])
+@jwt_required()
+def list_jobs():
+    """Lista los jobs (filtros: instance, status, type, limit)"""
+    user = User.query.get(int(get_jwt_identity()))
+    if not user:
+        return jsonify({'error': 'Usuario no encontrado'}), 404
+
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    query = Job.query
+
+    allowed = get_user_allowed_instances(user)
+    if allowed is not None:
+        query = query.filter(Job.instance_name.in_(allowed))
+    if request.args.get('instance'):
+        query = query.filter(Job.instance_name == request.args['instance'])
+    if request.args.get('status'):
+        query = query.filter(Job.status.in_(request.args['status'].split(',')))
+    if request.args.get('type'):
+        query = query.filter(Job.job_type.in_(request.args['type'].split(',')))
+
+    jobs = query.order_by(Job.id.desc()).limit(limit).all()
+    return jsonify({'jobs': [job.to_dict() for job in jobs], 'count': len(jobs)}), 200
+
+
+@jobs_bp.route('/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    """Estado, avance y final del log de un job"""
+    job, _user, error = _get_job_for_user(job_id)
+    if error:
+        return error
+
+    tail = request.args.get('tail', DEFAULT_LOG_TAIL_BYTES, type=int)
+    tail = max(0, min(tail, MAX_LOG_TAIL_BYTES))
+    try:
+        log, log_size = read_job_log(job, tail) if tail else ('', 0)
+    except OSError as e:
+        return jsonify({'error': f'Error leyendo log: {e}'}), 500
+
+    data = job.to_dict()
+    data['queue_position'] = queue_position(job)
+    return jsonify({
+        'success': True,
+        'job': data,
+        'log': log,
+        'log_size': log_size
+    }), 200
+
+
+@jobs_bp.route('/<int:job_id>/log', methods=['GET'])
+@jwt_required()
+def get_job_log(job_id):
+    """
+    Log incremental de un job: devuelve solo los bytes agregados desde
+    `?since=<offset>` y el `next_offset` para el próximo pedido.
+
+    Con `?wait=<segundos>` (long-poll) la respuesta se demora hasta que haya
+    datos nuevos, el job termine o se cumpla la espera. El ETag combina
+    offset y estado: con If-None-Match igual se responde 304 sin cuerpo.
+    """
+    job, _user, error = _get_job_for_user(job_id)
+    if error:
+        return error
+
+    since = max(request.args.get('since', 0, type=int), 0)
+    wait = max(0.0, min(request.args.get('wait', 0, type=float), MAX_LOG_WAIT_SECONDS))
+    max_bytes = max(1, min(request.args.get('max_bytes', LOG_CHUNK_BYTES, type=int), LOG_CHUNK_BYTES))
+
+    if wait:
+        job = wait_for_job_log(job, since, wait)
+
+    try:
+        data, next_offset, size = read_job_log_since(job, since, max_bytes)
+    except OSError as e:
+        return jsonify({'error': f'Error leyendo log: {e}'}), 500
+
+    etag = f'"job-{job.id}-{next_offset}-{job.status}"'
+    if not data and request.headers.get('If-None-Match') == etag:
+        response = make_response('', 304)
+    else:
+        response = make_response(jsonify({
+            'success': True,
+            'job': job.to_dict(),
+            'data': data,
+            'offset': since if since <= size else 0,
+            'next_offset': next_offset,
+            'size': size,
+            'has_more': next_offset < size,
+            'finished': job.finished
+        }), 200)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@jobs_bp.route('/<int:job_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel(job_id):
+    """Cancela un job en cola o detiene uno en curso"""
+    job, user, error = _get_job_for_user(job_id)
+    if error:
+        return error
+
+    if user.role not in ['admin', 'developer']:
+        return jsonify({'error': 'Permisos insuficientes'}), 403
+
+    result = cancel_job(job)
+    try:
+        db.session.add(ActionLog(
+            user_id=user.id,
+            action='cancel_job',
+            instance_name=job.instance_name,
+            details=f"Job #{job.id} ({job.job_type}): {result.get('message') or result.get('error')}",
+            status='success' if result['success'] else 'error'
+        ))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+
+    if result['success']:
+        return jsonify(result), 200
+    return jsonify(result), 409
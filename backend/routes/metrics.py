@@ -1,83 +1,140 @@
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required
+import json
+import time
+from flask import Blueprint, Response, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import func
 from datetime import datetime, timedelta
-from services.system_monitor import SystemMonitor
-from models import db, MetricsHistory
+from config import Config
+from services.system_monitor import get_system_monitor
+from models import db, MetricsHistory, InstanceMetricsHistory, User
+from services.metrics_store import host_metrics, instance_metrics, host_row_from_sample, run_metrics_maintenance
+from services.access_control import can_user_access_instance
+from services.signed_urls import signed_query, check_signature
 
 metrics_bp = Blueprint('metrics', __name__)
-monitor = SystemMonitor()
+monitor = get_system_monitor()
 
 MAX_RANGE_MINUTES = 60 * 24 * 30  # 30 días
 DEFAULT_POINTS = 240
 MAX_POINTS = 1000
-AUTO_SAVE_INTERVAL_SECONDS = 15
-
-
-def _build_history_entry(metrics):
-    return MetricsHistory(
-        cpu_percent=metrics['cpu']['percent'],
-        ram_percent=metrics['memory']['percent'],
-        ram_used_gb=metrics['memory']['used_gb'],
-        ram_total_gb=metrics['memory']['total_gb'],
-        disk_percent=metrics['disk'][0]['percent'] if metrics['disk'] else None,
-        disk_used_gb=metrics['disk'][0]['used_gb'] if metrics['disk'] else None,
-        disk_total_gb=metrics['disk'][0]['total_gb'] if metrics['disk'] else None,
-        network_sent_mb=metrics['network']['mb_sent'],
-        network_recv_mb=metrics['network']['mb_recv']
-    )
-
-
-def _downsample_metrics(rows, max_points):
-    total_rows = len(rows)
-    if total_rows <= max_points:
-        return rows
-
-    if max_points <= 1:
-        return [rows[-1]]
+MAINTENANCE_INTERVAL_SECONDS = 60
+# Una muestra por instancia más vieja que esto se considera desactualizada
+INSTANCE_LATEST_MAX_AGE_MINUTES = 10
 
-    step = (total_rows - 1) / (max_points - 1)
-    sampled = []
-    seen_indexes = set()
+# Stream SSE: comentario de keepalive si no hubo muestras y reintento del cliente
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_RETRY_MS = 3000
+STREAM_ENDPOINT = '/api/metrics/stream'
 
-    for i in range(max_points):
-        index = int(round(i * step))
-        if index >= total_rows:
-            index = total_rows - 1
-        if index in seen_indexes:
-            continue
-        sampled.append(rows[index])
-        seen_indexes.add(index)
+_last_maintenance = None
 
-    if sampled and sampled[-1] != rows[-1]:
-        sampled.append(rows[-1])
 
-    return sampled
+def _maybe_run_maintenance():
+    """Ejecuta rollups y retención como máximo una vez por intervalo"""
+    global _last_maintenance
+    now = datetime.utcnow()
+    if _last_maintenance and (now - _last_maintenance).total_seconds() < MAINTENANCE_INTERVAL_SECONDS:
+        return
+    _last_maintenance = now
+    try:
+        run_metrics_maintenance(now)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error en mantenimiento de métricas: {e}")
 
 @metrics_bp.route('/current', methods=['GET'])
 @jwt_required()
 def get_current_metrics():
-    """Obtiene las métricas actuales del sistema"""
+    """Obtiene las métricas actuales del sistema (solo memoria, sin consultar la BD)"""
     try:
         metrics = monitor.get_all_metrics()
+        return jsonify(metrics), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _parse_range_args():
+    minutes = request.args.get('minutes', default=60, type=int) or 60
+    minutes = max(1, min(minutes, MAX_RANGE_MINUTES))
+    requested_points = request.args.get('points', default=DEFAULT_POINTS, type=int) or DEFAULT_POINTS
+    return minutes, max(1, min(requested_points, MAX_POINTS))
+
+
+def _sse_event(event, seq, payload):
+    return f"id: {seq}\nevent: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
 
-        # Guardado oportunista para asegurar historial aunque el cron falle
-        latest = MetricsHistory.query.order_by(MetricsHistory.timestamp.desc()).first()
-        now = datetime.utcnow()
-        should_store = (
-            latest is None
-            or latest.timestamp is None
-            or (now - latest.timestamp).total_seconds() >= AUTO_SAVE_INTERVAL_SECONDS
+
+def _stream_resource(user_id):
+    return f"metrics-stream:{user_id}"
+
+
+@metrics_bp.route('/stream-url', methods=['POST'])
+@jwt_required()
+def create_stream_url():
+    """
+    Enlace firmado para abrir el stream con EventSource (que no permite
+    headers): solo sirve para /stream y vence en METRICS_STREAM_URL_TTL_SECONDS,
+    así el JWT no viaja en la URL ni queda en los logs de nginx.
+    """
+    user_id = get_jwt_identity()
+    query, expires = signed_query(
+        _stream_resource(user_id), Config.METRICS_STREAM_URL_TTL_SECONDS, user=user_id
+    )
+    return jsonify({
+        'url': f"{STREAM_ENDPOINT}?{query}",
+        'expires_at': datetime.utcfromtimestamp(expires).isoformat()
+    }), 200
+
+
+@metrics_bp.route('/stream', methods=['GET'])
+def stream_metrics():
+    """
+    Stream SSE de métricas en vivo.
+
+    Envía un evento `snapshot` con la muestra completa y luego un evento
+    `delta` por muestra (solo las claves que cambiaron, merge profundo).
+    Si el cliente se atrasa se le reenvía un `snapshot`. El stream se cierra
+    tras METRICS_STREAM_MAX_SECONDS y el cliente reconecta con un enlace nuevo.
+    Se autoriza con el enlace firmado de /stream-url o con el JWT en el header.
+    """
+    if request.args.get('sig'):
+        user_id = request.args.get('user')
+        error = check_signature(
+            _stream_resource(user_id) if user_id else None,
+            request.args.get('expires'), request.args.get('sig')
         )
+        if error:
+            message, status = error
+            return jsonify({'error': message}), status
+        if not User.query.get(int(user_id)):
+            return jsonify({'error': 'Usuario no encontrado'}), 401
+    else:
+        verify_jwt_in_request()
 
-        if should_store:
-            history = _build_history_entry(metrics)
-            db.session.add(history)
-            db.session.commit()
+    max_seconds = Config.METRICS_STREAM_MAX_SECONDS
 
-        return jsonify(metrics), 200
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': str(e)}), 500
+    def generate():
+        deadline = time.monotonic() + max_seconds
+        last_seq = 0
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+
+        while time.monotonic() < deadline:
+            timeout = min(STREAM_HEARTBEAT_SECONDS, max(deadline - time.monotonic(), 0))
+            result = monitor.wait_for_sample(last_seq, timeout)
+            if result is None:
+                yield ": keepalive\n\n"
+                continue
+
+            seq, sample, delta = result
+            if delta is None:
+                yield _sse_event('snapshot', seq, sample)
+            else:
+                yield _sse_event('delta', seq, delta)
+            last_seq = seq
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
 
 @metrics_bp.route('/history', methods=['GET'])
 @jwt_required()
@@ -85,35 +142,100 @@ def get_metrics_history():
     """Obtiene el historial de métricas"""
     try:
         # Parámetros
-        minutes = request.args.get('minutes', default=60, type=int) or 60
-        minutes = max(1, min(minutes, MAX_RANGE_MINUTES))
+        minutes, max_points = _parse_range_args()
 
-        requested_points = request.args.get('points', default=DEFAULT_POINTS, type=int) or DEFAULT_POINTS
-        max_points = max(1, min(requested_points, MAX_POINTS))
+        # source=raw: agregar solo la tabla cruda, sin usar rollups
+        source = request.args.get('source', default='auto', type=str)
+        resolution = 0 if source == 'raw' else None
         
-        # Calcular timestamp de inicio
-        start_time = datetime.utcnow() - timedelta(minutes=minutes)
+        # Calcular ventana
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(minutes=minutes)
         
-        # Consultar historial
-        metrics = MetricsHistory.query.filter(
-            MetricsHistory.timestamp >= start_time
-        ).order_by(MetricsHistory.timestamp.asc()).all()
+        # Consultar historial agregado en el nivel que corresponde a la ventana
+        metrics, resolution, bucket_seconds = host_metrics.query(
+            start_time, end_time, max_points, now=end_time, resolution=resolution
+        )
+        total = sum(m['samples'] for m in metrics)
 
         # Asegurar al menos un dato para que el dashboard nunca quede vacío
+        # (la muestra en vivo no se guarda: de eso se encarga el grabador)
         if not metrics:
             live_metrics = monitor.get_all_metrics()
-            history = _build_history_entry(live_metrics)
-            db.session.add(history)
-            db.session.commit()
-            metrics = [history]
-
-        sampled_metrics = _downsample_metrics(metrics, max_points)
+            metrics = [MetricsHistory(**host_row_from_sample(live_metrics)).to_dict()]
+            total = 1
         
         return jsonify({
-            'metrics': [m.to_dict() for m in sampled_metrics],
-            'count': len(sampled_metrics),
-            'total': len(metrics),
-            'range_minutes': minutes
+            'metrics': metrics,
+            'count': len(metrics),
+            'total': total,
+            'range_minutes': minutes,
+            'resolution_seconds': resolution,
+            'bucket_seconds': bucket_seconds
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@metrics_bp.route('/instances', methods=['GET'])
+@jwt_required()
+def get_instances_metrics():
+    """Última muestra de consumo de cada instancia visible para el usuario"""
+    try:
+        user = User.query.get(int(get_jwt_identity()))
+        if not user:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+
+        since = datetime.utcnow() - timedelta(minutes=INSTANCE_LATEST_MAX_AGE_MINUTES)
+        latest = db.session.query(
+            InstanceMetricsHistory.instance_name,
+            func.max(InstanceMetricsHistory.timestamp).label('timestamp')
+        ).filter(
+            InstanceMetricsHistory.timestamp >= since
+        ).group_by(InstanceMetricsHistory.instance_name).subquery()
+
+        rows = InstanceMetricsHistory.query.join(
+            latest,
+            (InstanceMetricsHistory.instance_name == latest.c.instance_name)
+            & (InstanceMetricsHistory.timestamp == latest.c.timestamp)
+        ).order_by(InstanceMetricsHistory.instance_name).all()
+
+        instances = [row.to_dict() for row in rows if can_user_access_instance(user, row.instance_name)]
+        return jsonify({'instances': instances, 'count': len(instances)}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@metrics_bp.route('/instances/<instance_name>/history', methods=['GET'])
+@jwt_required()
+def get_instance_metrics_history(instance_name):
+    """Historial de consumo de una instancia (mismos parámetros que /history)"""
+    try:
+        user = User.query.get(int(get_jwt_identity()))
+        if not user:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        if not can_user_access_instance(user, instance_name):
+            return jsonify({'error': 'Permisos insuficientes'}), 403
+
+        minutes, max_points = _parse_range_args()
+        source = request.args.get('source', default='auto', type=str)
+        resolution = 0 if source == 'raw' else None
+
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(minutes=minutes)
+        metrics, resolution, bucket_seconds = instance_metrics.query(
+            start_time, end_time, max_points,
+            keys={'instance_name': instance_name}, now=end_time, resolution=resolution
+        )
+
+        return jsonify({
+            'instance': instance_name,
+            'metrics': metrics,
+            'count': len(metrics),
+            'total': sum(m['samples'] for m in metrics),
+            'range_minutes': minutes,
+            'resolution_seconds': resolution,
+            'bucket_seconds': bucket_seconds
         }), 200
     except Exception as e:
         db.session.rollback()
@@ -121,15 +243,16 @@ def get_metrics_history():
 
 @metrics_bp.route('/save', methods=['POST'])
 def save_current_metrics():
-    """Guarda las métricas actuales en el historial (llamado por cron)"""
+    """Guarda las métricas actuales en el historial (cron, si el grabador está deshabilitado)"""
     try:
         metrics = monitor.get_all_metrics()
         
         # Crear registro
-        history = _build_history_entry(metrics)
+        history = MetricsHistory(**host_row_from_sample(metrics))
         
         db.session.add(history)
         db.session.commit()
+        _maybe_run_maintenance()
         
         return jsonify({'message': 'Métricas guardadas', 'id': history.id}), 201
     except Exception as e:
@@ -3,22 +3,25 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import User
 from config import Config
 from services.access_control import can_user_access_instance
+from services.service_status import get_service_status_collector
+from services.odoo_log_reader import (
+    DEFAULT_INCREMENT_BYTES,
+    count_levels,
+    parse_and_filter,
+    read_increment,
+    tail_file_with_cursor,
+)
+from services.log_index import get_log_index, normalize_timestamp
+from services.journal_reader import read_journal
 import os
-import re
-from collections import deque
 
 odoo_logs_bp = Blueprint('odoo_logs', __name__)
 
-# Regex para parsear líneas de log de Odoo
-# Formato: 2026-02-08 15:03:42,089 1200 WARNING dev-mtg-production odoo.http: mensaje
-LOG_LINE_REGEX = re.compile(
-    r'^(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2},\d+)\s+'  # timestamp
-    r'(\d+)\s+'                                              # pid
-    r'(DEBUG|INFO|WARNING|ERROR|CRITICAL)\s+'                # level
-    r'(\S+)\s+'                                              # database
-    r'(\S+):\s*'                                             # logger
-    r'(.*)'                                                  # message
-)
+# Máximo de bytes por llamada al endpoint incremental
+MAX_TAIL_BYTES = 4 * 1024 * 1024
+
+# Máximo de líneas por página en la búsqueda indexada
+MAX_SEARCH_LINES = 5000
 
 
 def _get_instance_log_path(instance_name):
@@ -38,101 +41,27 @@ def _get_instance_log_path(instance_name):
 
 def _get_service_name(instance_name):
     """Obtiene el nombre del servicio systemd para una instancia"""
-    # Intentar detectar el servicio automáticamente
-    import subprocess
-    try:
-        result = subprocess.run(
-            ['systemctl', 'list-units', '--type=service', '--no-pager', '-q'],
-            capture_output=True, text=True, timeout=5
-        )
-        for line in result.stdout.split('\n'):
-            if instance_name in line and 'odoo' in line.lower():
-                return line.strip().split()[0].replace('.service', '')
-    except:
-        pass
+    collector = get_service_status_collector()
+
+    # Detectar el servicio a partir de la consulta batch cacheada
+    service_name = collector.find_service(instance_name)
+    if service_name:
+        return service_name
     
-    # Fallback: intentar nombres comunes
+    # Fallback: intentar nombres comunes (resueltos en una sola consulta)
     candidates = [
         f'odoo19e-{instance_name}',
         f'odoo-{instance_name}',
         f'odoo19-{instance_name}',
     ]
+    statuses = collector.get_statuses(candidates)
     for candidate in candidates:
-        try:
-            result = subprocess.run(
-                ['systemctl', 'is-active', candidate],
-                capture_output=True, text=True, timeout=3
-            )
-            if result.stdout.strip() in ('active', 'inactive', 'failed'):
-                return candidate
-        except:
-            continue
+        if statuses.get(candidate) in ('active', 'inactive'):
+            return candidate
     
     return None
 
 
-def tail_file(filepath, lines=500):
-    """Lee las últimas N líneas de un archivo de forma eficiente"""
-    try:
-        with open(filepath, 'rb') as f:
-            # Ir al final del archivo
-            f.seek(0, 2)
-            file_size = f.tell()
-            
-            if file_size == 0:
-                return []
-            
-            # Buffer para leer bloques
-            block_size = 8192
-            blocks = []
-            remaining = file_size
-            found_lines = 0
-            
-            while remaining > 0 and found_lines < lines + 1:
-                read_size = min(block_size, remaining)
-                remaining -= read_size
-                f.seek(remaining)
-                block = f.read(read_size)
-                blocks.insert(0, block)
-                found_lines += block.count(b'\n')
-            
-            content = b''.join(blocks).decode('utf-8', errors='replace')
-            all_lines = content.split('\n')
-            
-            # Devolver las últimas N líneas (sin línea vacía final)
-            if all_lines and all_lines[-1] == '':
-                all_lines = all_lines[:-1]
-            
-            return all_lines[-lines:]
-    except Exception as e:
-        return [f"Error leyendo archivo: {str(e)}"]
-
-
-def parse_log_line(line):
-    """Parsea una línea de log de Odoo y extrae sus componentes"""
-    match = LOG_LINE_REGEX.match(line)
-    if match:
-        return {
-            'timestamp': match.group(1),
-            'pid': match.group(2),
-            'level': match.group(3),
-            'database': match.group(4),
-            'logger': match.group(5),
-            'message': match.group(6),
-            'raw': line
-        }
-    # Línea de continuación (traceback, etc.)
-    return {
-        'timestamp': '',
-        'pid': '',
-        'level': 'CONTINUATION',
-        'database': '',
-        'logger': '',
-        'message': line,
-        'raw': line
-    }
-
-
 @odoo_logs_bp.route('/available/<instance_name>', methods=['GET'])
 @jwt_required()
 def get_available_logs(instance_name):
@@ -221,38 +150,18 @@ def view_log(instance_name):
             'path': log_path
         }), 404
     
-    # Leer últimas líneas
-    raw_lines = tail_file(log_path, lines_count * 2 if level_filter else lines_count)
-    
-    # Parsear líneas
-    parsed_lines = []
-    for line in raw_lines:
-        if not line.strip():
-            continue
-        parsed = parse_log_line(line)
-        
-        # Filtrar por nivel
-        if level_filter and parsed['level'] not in ('CONTINUATION', level_filter):
-            continue
-        
-        # Filtrar por búsqueda
-        if search and search.lower() not in line.lower():
-            continue
-        
-        parsed_lines.append(parsed)
+    # Leer últimas líneas (el cursor permite seguir con /tail)
+    try:
+        raw_lines, cursor = tail_file_with_cursor(log_path, lines_count * 2 if level_filter else lines_count)
+    except OSError as e:
+        return jsonify({'error': f'Error leyendo archivo: {str(e)}'}), 500
+    
+    # Parsear y filtrar en una sola pasada
+    parsed_lines = parse_and_filter(raw_lines, level_filter, search)
     
     # Limitar resultado final
     parsed_lines = parsed_lines[-lines_count:]
-    
-    # Estadísticas
-    stats = {
-        'total': len(parsed_lines),
-        'info': sum(1 for l in parsed_lines if l['level'] == 'INFO'),
-        'warning': sum(1 for l in parsed_lines if l['level'] == 'WARNING'),
-        'error': sum(1 for l in parsed_lines if l['level'] == 'ERROR'),
-        'critical': sum(1 for l in parsed_lines if l['level'] == 'CRITICAL'),
-        'debug': sum(1 for l in parsed_lines if l['level'] == 'DEBUG'),
-    }
+    stats = count_levels(parsed_lines)
     
     # Info del archivo
     file_size = os.path.getsize(log_path)
@@ -263,6 +172,7 @@ def view_log(instance_name):
         'log_type': log_type,
         'lines': parsed_lines,
         'stats': stats,
+        'cursor': cursor,
         'file_info': {
             'path': log_path,
             'size': file_size,
@@ -271,62 +181,240 @@ def view_log(instance_name):
     }), 200
 
 
+@odoo_logs_bp.route('/tail/<instance_name>', methods=['GET'])
+@jwt_required()
+def tail_log(instance_name):
+    """
+    Devuelve solo las líneas nuevas desde un cursor (inode + offset).
+
+    El cliente arranca con el `cursor` de /view y en cada poll envía el
+    último recibido; `stats` cuenta solo las líneas nuevas para sumarlas a
+    los contadores que ya tiene. Si el log rotó se reinicia desde el
+    principio del archivo nuevo y se devuelve `rotated: true`.
+    """
+    user_id = int(get_jwt_identity())
+    user = User.query.get(user_id)
+    
+    if not user or user.role not in ['admin', 'developer', 'viewer']:
+        return jsonify({'error': 'Permisos insuficientes'}), 403
+
+    if not can_user_access_instance(user, instance_name):
+        return jsonify({'error': 'No tienes acceso a esta instancia'}), 403
+    
+    base_path = _get_instance_log_path(instance_name)
+    if not base_path:
+        return jsonify({'error': f'Instancia no encontrada: {instance_name}'}), 404
+    
+    log_type = request.args.get('type', 'odoo')
+    if os.path.basename(log_type) != log_type:
+        return jsonify({'error': 'Tipo de log inválido'}), 400
+    if log_type == 'systemd':
+        return _tail_systemd_log(instance_name)
+    inode = request.args.get('inode', type=int)
+    offset = request.args.get('offset', type=int)
+    level_filter = request.args.get('level', '')
+    search = request.args.get('search', '')
+    max_bytes = request.args.get('max_bytes', DEFAULT_INCREMENT_BYTES, type=int)
+    max_bytes = max(1, min(max_bytes, MAX_TAIL_BYTES))
+    
+    if inode is None or offset is None or offset < 0:
+        return jsonify({'error': 'Parámetros inode y offset requeridos'}), 400
+    
+    log_path = os.path.join(base_path, f'{log_type}.log')
+    if not os.path.exists(log_path):
+        return jsonify({'error': f'Archivo de log no encontrado: {log_type}.log'}), 404
+    
+    try:
+        increment = read_increment(log_path, inode, offset, max_bytes)
+    except OSError as e:
+        return jsonify({'error': f'Error leyendo archivo: {str(e)}'}), 500
+    
+    parsed_lines = parse_and_filter(increment['lines'], level_filter, search)
+    stats = count_levels(parsed_lines)
+    
+    return jsonify({
+        'success': True,
+        'instance': instance_name,
+        'log_type': log_type,
+        'lines': parsed_lines,
+        'stats': stats,
+        'cursor': increment['cursor'],
+        'rotated': increment['rotated'],
+        'has_more': increment['has_more'],
+        'file_info': {
+            'path': log_path,
+            'size': increment['size'],
+            'size_human': _human_size(increment['size'])
+        }
+    }), 200
+
+
+@odoo_logs_bp.route('/search/<instance_name>', methods=['GET'])
+@jwt_required()
+def search_log(instance_name):
+    """
+    Búsqueda por rango de fechas (`from`/`to`), nivel y texto en todo el log.
+
+    Usa el índice disperso del archivo para leer solo los tramos que pueden
+    tener resultados. Si se alcanza `limit`, `next_offset` permite pedir la
+    página siguiente con `?offset=`. Para `type=systemd` los filtros los
+    resuelve journalctl y la paginación es con `next_cursor` / `?cursor=`.
+    """
+    user_id = int(get_jwt_identity())
+    user = User.query.get(user_id)
+    
+    if not user or user.role not in ['admin', 'developer', 'viewer']:
+        return jsonify({'error': 'Permisos insuficientes'}), 403
+
+    if not can_user_access_instance(user, instance_name):
+        return jsonify({'error': 'No tienes acceso a esta instancia'}), 403
+    
+    base_path = _get_instance_log_path(instance_name)
+    if not base_path:
+        return jsonify({'error': f'Instancia no encontrada: {instance_name}'}), 404
+    
+    log_type = request.args.get('type', 'odoo')
+    if os.path.basename(log_type) != log_type:
+        return jsonify({'error': 'Tipo de log inválido'}), 400
+    level_filter = request.args.get('level', '') or None
+    search = request.args.get('search', '')
+    limit = max(1, min(request.args.get('limit', 1000, type=int), MAX_SEARCH_LINES))
+    resume_offset = request.args.get('offset', type=int)
+    
+    try:
+        start_ts = normalize_timestamp(request.args.get('from'))
+        end_ts = normalize_timestamp(request.args.get('to'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # `to` sin hora incluye el día completo
+    if end_ts and len(request.args.get('to', '').strip()) == 10:
+        end_ts = end_ts[:11] + '23:59:59'
+    
+    if log_type == 'systemd':
+        return _search_systemd_log(instance_name, start_ts, end_ts, level_filter, search, limit)
+    
+    log_path = os.path.join(base_path, f'{log_type}.log')
+    if not os.path.exists(log_path):
+        return jsonify({'error': f'Archivo de log no encontrado: {log_type}.log'}), 404
+    
+    index = get_log_index(log_path)
+    try:
+        lines, next_offset = index.search(start_ts, end_ts, level_filter, search, limit, resume_offset)
+    except OSError as e:
+        return jsonify({'error': f'Error leyendo archivo: {str(e)}'}), 500
+    
+    file_size = os.path.getsize(log_path)
+    
+    return jsonify({
+        'success': True,
+        'instance': instance_name,
+        'log_type': log_type,
+        'lines': lines,
+        'stats': count_levels(lines),
+        'next_offset': next_offset,
+        'index': index.summary(),
+        'file_info': {
+            'path': log_path,
+            'size': file_size,
+            'size_human': _human_size(file_size)
+        }
+    }), 200
+
+
+def _journal_info(service_name):
+    return {
+        'path': f'journalctl -u {service_name}',
+        'size': 0,
+        'size_human': 'systemd'
+    }
+
+
 def _read_systemd_log(instance_name, lines_count, level_filter, search):
-    """Lee logs desde journalctl para una instancia"""
-    import subprocess
+    """Lee las últimas entradas del journal de la instancia (nivel, fecha y PID reales)"""
+    service_name = _get_service_name(instance_name)
+    if not service_name:
+        return jsonify({'error': 'Servicio systemd no encontrado'}), 404
+    
+    try:
+        result = read_journal(service_name, lines=lines_count, level=level_filter, search=search)
+    except Exception as e:
+        return jsonify({'error': f'Error leyendo logs de systemd: {str(e)}'}), 500
+    
+    return jsonify({
+        'success': True,
+        'instance': instance_name,
+        'log_type': 'systemd',
+        'lines': result['lines'],
+        'stats': count_levels(result['lines']),
+        'cursor': {'journal': result['cursor']} if result['cursor'] else None,
+        'file_info': _journal_info(service_name)
+    }), 200
+
+
+def _tail_systemd_log(instance_name):
+    """Entradas del journal posteriores al cursor de journald recibido (`?cursor=`)"""
+    journal_cursor = request.args.get('cursor', '')
+    if not journal_cursor:
+        return jsonify({'error': 'Parámetro cursor requerido'}), 400
     
     service_name = _get_service_name(instance_name)
     if not service_name:
         return jsonify({'error': 'Servicio systemd no encontrado'}), 404
     
     try:
-        cmd = ['journalctl', '-u', service_name, '--no-pager', '-n', str(lines_count)]
-        
-        if level_filter:
-            priority_map = {
-                'ERROR': '3',
-                'CRITICAL': '2',
-                'WARNING': '4',
-                'INFO': '6',
-                'DEBUG': '7'
-            }
-            if level_filter in priority_map:
-                cmd.extend(['-p', priority_map[level_filter]])
-        
-        if search:
-            cmd.extend(['-g', search])
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-        
-        lines = []
-        for line in result.stdout.split('\n'):
-            if not line.strip():
-                continue
-            lines.append({
-                'timestamp': '',
-                'pid': '',
-                'level': 'INFO',
-                'database': '',
-                'logger': 'systemd',
-                'message': line,
-                'raw': line
-            })
-        
-        return jsonify({
-            'success': True,
-            'instance': instance_name,
-            'log_type': 'systemd',
-            'lines': lines,
-            'stats': {'total': len(lines)},
-            'file_info': {
-                'path': f'journalctl -u {service_name}',
-                'size': 0,
-                'size_human': 'systemd'
-            }
-        }), 200
-        
+        result = read_journal(
+            service_name,
+            after_cursor=journal_cursor,
+            level=request.args.get('level', ''),
+            search=request.args.get('search', ''),
+            limit=MAX_SEARCH_LINES,
+        )
     except Exception as e:
         return jsonify({'error': f'Error leyendo logs de systemd: {str(e)}'}), 500
+    
+    return jsonify({
+        'success': True,
+        'instance': instance_name,
+        'log_type': 'systemd',
+        'lines': result['lines'],
+        'stats': count_levels(result['lines']),
+        'cursor': {'journal': result['cursor']},
+        'rotated': False,
+        'has_more': result['has_more'],
+        'file_info': _journal_info(service_name)
+    }), 200
+
+
+def _search_systemd_log(instance_name, start_ts, end_ts, level_filter, search, limit):
+    """Búsqueda en el journal con fechas, nivel y texto resueltos por journalctl"""
+    service_name = _get_service_name(instance_name)
+    if not service_name:
+        return jsonify({'error': 'Servicio systemd no encontrado'}), 404
+    
+    journal_cursor = request.args.get('cursor') or None
+    try:
+        result = read_journal(
+            service_name,
+            after_cursor=journal_cursor,
+            level=level_filter,
+            since=None if journal_cursor else start_ts,
+            until=end_ts,
+            search=search,
+            limit=limit,
+        )
+    except Exception as e:
+        return jsonify({'error': f'Error leyendo logs de systemd: {str(e)}'}), 500
+    
+    return jsonify({
+        'success': True,
+        'instance': instance_name,
+        'log_type': 'systemd',
+        'lines': result['lines'],
+        'stats': count_levels(result['lines']),
+        'next_offset': None,
+        'next_cursor': result['cursor'] if result['has_more'] else None,
+        'file_info': _journal_info(service_name)
+    }), 200
 
 
 def _human_size(size_bytes):
@@ -0,0 +1,323 @@
+import os
+import time
+import gzip
+import shutil
+import hashlib
+import tempfile
+import tarfile
+import queue
+import zipfile
+import threading
+import subprocess
+import logging
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 1024 * 1024
+GZIP_LEVEL = 6
+# Exportación en vivo: el dump comprime bien; los adjuntos suelen venir comprimidos
+EXPORT_DUMP_LEVEL = 6
+EXPORT_FILESTORE_LEVEL = 1
+# Descarga de backups con filestore deduplicado: se comprime mientras se envía
+MATERIALIZE_GZIP_LEVEL = 1
+
+
+class _HashingWriter:
+    """Archivo de salida que calcula el SHA-256 y cuenta los bytes escritos"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+
+class _HashingReader:
+    """Archivo de entrada que calcula el SHA-256 de lo leído"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.sha256.update(data)
+        return data
+
+
+def read_tar_gz_index(path):
+    """
+    Nombres de las entradas de un .tar.gz y SHA-256 del archivo, en una sola
+    lectura secuencial (modo stream de tarfile, sin saltos hacia atrás).
+
+    Devuelve {'names', 'checksum_sha256'}.
+    """
+    with open(path, 'rb') as f:
+        source = _HashingReader(f)
+        with tarfile.open(fileobj=source, mode='r|gz') as tar:
+            names = [member.name for member in tar]
+        # El tar puede terminar antes del relleno final: completar el hash
+        for _chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b''):
+            pass
+    return {'names': names, 'checksum_sha256': source.sha256.hexdigest()}
+
+
+def _tarinfo_for(member):
+    """TarInfo equivalente a una entrada del ZIP (nombre, tipo, permisos y fecha)"""
+    info = tarfile.TarInfo(member.filename.rstrip('/'))
+    info.mtime = time.mktime(member.date_time + (0, 0, -1))
+    unix_mode = (member.external_attr >> 16) & 0o7777
+    if member.is_dir():
+        info.type = tarfile.DIRTYPE
+        info.mode = unix_mode or 0o755
+    else:
+        info.size = member.file_size
+        info.mode = unix_mode or 0o644
+    return info
+
+
+def _write_tar(zip_ref, tar_stream):
+    tar = tarfile.open(fileobj=tar_stream, mode='w|', format=tarfile.PAX_FORMAT)
+    try:
+        for member in zip_ref.infolist():
+            info = _tarinfo_for(member)
+            if member.is_dir():
+                tar.addfile(info)
+                continue
+            with zip_ref.open(member) as source:
+                tar.addfile(info, source)
+    finally:
+        tar.close()
+
+
+def transcode_zip_to_tar_gz(zip_path, dest_path):
+    """
+    Convierte un backup .zip (Odoo.sh) en .tar.gz en una sola pasada.
+
+    Cada entrada del ZIP se descomprime y se escribe como entrada del tar
+    directo sobre el stream comprimido: no se extrae nada a disco. Comprime
+    con pigz (en paralelo) si está instalado y calcula el SHA-256 del
+    resultado mientras lo escribe. Se escribe en `<dest>.part` y se renombra
+    al terminar.
+
+    Devuelve {'size_bytes', 'checksum_sha256', 'members'}.
+    """
+    part_path = dest_path + '.part'
+    pigz = shutil.which('pigz')
+
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref, open(part_path, 'wb') as out:
+            output = _HashingWriter(out)
+            if pigz:
+                proc = subprocess.Popen(
+                    [pigz, f'-{GZIP_LEVEL}', '-c'],
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE
+                )
+
+                # La salida de pigz se consume en paralelo para no bloquear el pipe.
+                # Si falla la escritura (disco lleno) se sigue drenando para que
+                # pigz no se quede bloqueado y el error se relanza al final
+                write_errors = []
+
+                def drain():
+                    for chunk in iter(lambda: proc.stdout.read(COPY_CHUNK_SIZE), b''):
+                        if write_errors:
+                            continue
+                        try:
+                            output.write(chunk)
+                        except OSError as e:
+                            write_errors.append(e)
+
+                reader = threading.Thread(target=drain, daemon=True)
+                reader.start()
+                try:
+                    _write_tar(zip_ref, proc.stdin)
+                finally:
+                    proc.stdin.close()
+                    reader.join()
+                    returncode = proc.wait()
+                if write_errors:
+                    raise write_errors[0]
+                if returncode != 0:
+                    raise RuntimeError(f'pigz terminó con código {returncode}')
+            else:
+                with gzip.GzipFile(fileobj=output, mode='wb', compresslevel=GZIP_LEVEL) as gz:
+                    _write_tar(zip_ref, gz)
+            members = len(zip_ref.infolist())
+
+        os.replace(part_path, dest_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    return {
+        'size_bytes': output.size,
+        'checksum_sha256': output.sha256.hexdigest(),
+        'members': members
+    }
+
+
+class _ChunkSink:
+    """Destino no posicionable de zipfile: acumula lo escrito hasta que se consume"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def stream_backup_zip(dump_command, filestore_path):
+    """
+    Genera un backup .zip (formato Odoo: dump.sql + filestore/) como stream de bytes.
+
+    La salida de `dump_command` (pg_dump) y los archivos del filestore se
+    comprimen a medida que se leen y se entregan por bloques: no se escribe
+    nada a disco y la memoria queda acotada a un bloque. Se usa ZIP y no
+    tar porque el tamaño del dump no se conoce de antemano (el ZIP lo
+    registra después de los datos). Si pg_dump falla o el cliente se
+    desconecta, el proceso se termina y el stream se corta.
+    """
+    # Los bloques vacíos no se envían (en HTTP chunked marcarían el fin)
+    chunks = _generate_backup_zip(dump_command, filestore_path)
+    try:
+        for data in chunks:
+            if data:
+                yield data
+    finally:
+        chunks.close()
+
+
+def _generate_backup_zip(dump_command, filestore_path):
+    sink = _ChunkSink()
+    # stderr a un archivo: un pipe sin leer bloquearía pg_dump con muchos avisos
+    stderr = tempfile.TemporaryFile()
+    proc = subprocess.Popen(dump_command, stdout=subprocess.PIPE, stderr=stderr)
+    try:
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED,
+                             compresslevel=EXPORT_DUMP_LEVEL) as zf:
+            with zf.open('dump.sql', 'w', force_zip64=True) as entry:
+                for chunk in iter(lambda: proc.stdout.read(COPY_CHUNK_SIZE), b''):
+                    entry.write(chunk)
+                    yield sink.take()
+            returncode = proc.wait()
+            if returncode != 0:
+                stderr.seek(0)
+                error = stderr.read().decode(errors='replace').strip()
+                raise RuntimeError(f'pg_dump terminó con código {returncode}: {error[-500:]}')
+            yield sink.take()
+
+            # Las entradas abiertas por nombre toman el nivel de compresión del ZipFile
+            zf.compresslevel = EXPORT_FILESTORE_LEVEL
+            if filestore_path and os.path.isdir(filestore_path):
+                for root, dirs, files in os.walk(filestore_path):
+                    dirs.sort()
+                    for name in sorted(files):
+                        path = os.path.join(root, name)
+                        arcname = os.path.join('filestore', os.path.relpath(path, filestore_path))
+                        try:
+                            source = open(path, 'rb')
+                        except OSError as e:
+                            logger.warning(f"Exportación: se omite {path}: {e}")
+                            continue
+                        with source, zf.open(arcname, 'w') as entry:
+                            for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b''):
+                                entry.write(chunk)
+                                yield sink.take()
+        # Directorio central del ZIP
+        yield sink.take()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        stderr.close()
+
+
+class _QueueSink:
+    """Destino de escritura que pasa los bloques a otro hilo por una cola acotada"""
+
+    def __init__(self, maxsize=64):
+        self.queue = queue.Queue(maxsize)
+        self.cancelled = threading.Event()
+
+    def _put(self, item):
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def write(self, data):
+        if data and not self._put(bytes(data)):
+            raise BrokenPipeError('Descarga cancelada')
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        self._put(None)
+
+
+def stream_materialized_tar_gz(archive_path, filestore_files):
+    """
+    Genera como stream de bytes un .tar.gz con las entradas de `archive_path`
+    más el filestore en `filestore/`, a partir de (ruta_relativa, ruta_origen).
+
+    Para backups cuyo filestore está en el almacén deduplicado: el .tar.gz
+    en disco solo tiene el dump. El tar se arma en un hilo aparte (tarfile
+    escribe de corrido cada entrada) y se entrega por bloques con memoria
+    acotada; si el cliente se desconecta, el hilo se corta en la siguiente
+    escritura.
+    """
+    sink = _QueueSink()
+    errors = []
+
+    def produce():
+        try:
+            with gzip.GzipFile(fileobj=sink, mode='wb', compresslevel=MATERIALIZE_GZIP_LEVEL) as gz, \
+                    tarfile.open(fileobj=gz, mode='w|', format=tarfile.PAX_FORMAT) as out, \
+                    tarfile.open(archive_path, mode='r|*') as source:
+                for member in source:
+                    out.addfile(member, source.extractfile(member) if member.isfile() else None)
+                for rel_path, path in filestore_files:
+                    try:
+                        info = out.gettarinfo(path, arcname=os.path.join('filestore', rel_path))
+                        with open(path, 'rb') as f:
+                            out.addfile(info, f)
+                    except FileNotFoundError:
+                        logger.error(f"Descarga de {archive_path}: falta en el almacén {rel_path}")
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            sink.finish()
+
+    producer = threading.Thread(target=produce, name='backup-materialize', daemon=True)
+    producer.start()
+    try:
+        for data in iter(sink.queue.get, None):
+            yield data
+        if errors and not isinstance(errors[0], BrokenPipeError):
+            raise errors[0]
+    finally:
+        sink.cancelled.set()
+        producer.join()
@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import threading
+import logging
+from datetime import datetime
+
+from sqlalchemy import func
+
+from config import Config
+from models import db, BackupRecord
+from services.job_runner import register_job_hook
+from services.filestore_store import manifest_path_for
+from services.process_lock import ProcessLock
+
+logger = logging.getLogger(__name__)
+
+# Metadatos que backup-instance.sh (y el upload) dejan junto a cada backup
+META_SUFFIX = '.meta.json'
+BACKUP_EXTENSIONS = ('.tar.gz', '.zip')
+
+LEADER_RETRY_SECONDS = 30
+
+
+def meta_path_for(archive_path):
+    """Ruta del archivo de metadatos de un backup"""
+    return archive_path + META_SUFFIX
+
+
+def read_backup_meta(archive_path):
+    try:
+        with open(meta_path_for(archive_path), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_backup_meta(archive_path, meta):
+    tmp = meta_path_for(archive_path) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, meta_path_for(archive_path))
+
+
+def _parse_datetime(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+class BackupCatalog:
+    """
+    Catálogo de backups por instancia en la base del panel.
+
+    Cada archivo de `<BACKUPS_PATH>/instances/<instancia>/` tiene una fila
+    con tamaño, checksum, tamaños del dump y del filestore y fecha de
+    creación (tomados de `<archivo>.meta.json` cuando existe). Se actualiza
+    al crear (fin del job de backup), subir, renombrar y borrar backups, y
+    se reconcilia periódicamente contra el disco para cubrir los backups del
+    cron y la retención de los scripts. Los listados leen solo de acá.
+    """
+
+    def __init__(self, instances_dir=None):
+        self.instances_dir = instances_dir or os.path.join(Config.BACKUPS_PATH, 'instances')
+
+    def _instance_dir(self, instance_name):
+        return os.path.join(self.instances_dir, instance_name)
+
+    def _fill_record(self, record, path, stat, source=None):
+        meta = read_backup_meta(path)
+        # Un checksum ya registrado solo sigue valiendo si el archivo no cambió
+        unchanged = record.mtime == stat.st_mtime and record.size_bytes == stat.st_size
+        record.checksum = meta.get('checksum_sha256') or (record.checksum if unchanged else None)
+        record.size_bytes = stat.st_size
+        record.mtime = stat.st_mtime
+        record.db_size_bytes = meta.get('db_size_bytes')
+        record.filestore_size_bytes = meta.get('filestore_size_bytes')
+        record.dump_format = meta.get('dump_format')
+        # Backups anteriores a los metadatos: el manifiesto indica el almacén deduplicado
+        record.filestore_mode = meta.get('filestore_mode') or \
+            ('store' if os.path.exists(manifest_path_for(path)) else None)
+        record.created_at = _parse_datetime(meta.get('created_at')) or datetime.fromtimestamp(stat.st_mtime)
+        record.recorded_at = datetime.utcnow()
+        if source:
+            record.source = meta.get('source') or source
+
+    def record_file(self, instance_name, filename, source='backup', commit=True):
+        """Registra (o actualiza) un backup recién creado o subido"""
+        path = os.path.join(self._instance_dir(instance_name), filename)
+        stat = os.stat(path)
+        record = BackupRecord.query.filter_by(instance_name=instance_name, filename=filename).first()
+        if record is None:
+            record = BackupRecord(instance_name=instance_name, filename=filename)
+            db.session.add(record)
+        self._fill_record(record, path, stat, source)
+        if commit:
+            db.session.commit()
+        return record
+
+    def remove(self, instance_name, filename):
+        BackupRecord.query.filter_by(instance_name=instance_name, filename=filename).delete()
+        db.session.commit()
+
+    def rename(self, instance_name, old_filename, new_filename):
+        record = BackupRecord.query.filter_by(instance_name=instance_name, filename=old_filename).first()
+        if record is None:
+            self.record_file(instance_name, new_filename, source='scan')
+            return
+        record.filename = new_filename
+        db.session.commit()
+
+    def scan_instance(self, instance_name, commit=True):
+        """Reconcilia las filas de una instancia con su directorio (un listdir + stat)"""
+        instance_dir = self._instance_dir(instance_name)
+        on_disk = {}
+        try:
+            with os.scandir(instance_dir) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.endswith(BACKUP_EXTENSIONS):
+                        on_disk[entry.name] = entry.stat()
+        except FileNotFoundError:
+            pass
+
+        records = {r.filename: r for r in BackupRecord.query.filter_by(instance_name=instance_name).all()}
+        changed = 0
+        for filename, record in records.items():
+            if filename not in on_disk:
+                db.session.delete(record)
+                changed += 1
+        for filename, stat in on_disk.items():
+            record = records.get(filename)
+            if record is not None and record.mtime == stat.st_mtime and record.size_bytes == stat.st_size:
+                continue
+            if record is None:
+                record = BackupRecord(instance_name=instance_name, filename=filename)
+                db.session.add(record)
+            self._fill_record(record, os.path.join(instance_dir, filename), stat, 'scan')
+            changed += 1
+
+        if commit:
+            db.session.commit()
+        return changed
+
+    def reconcile(self):
+        """Reconcilia todas las instancias; borra las filas de directorios que ya no existen"""
+        try:
+            instances = [name for name in os.listdir(self.instances_dir)
+                         if os.path.isdir(self._instance_dir(name))]
+        except FileNotFoundError:
+            instances = []
+
+        changed = sum(self.scan_instance(name, commit=False) for name in instances)
+        stale = BackupRecord.query.filter(~BackupRecord.instance_name.in_(instances)) if instances \
+            else BackupRecord.query
+        changed += stale.delete(synchronize_session=False)
+        db.session.commit()
+        return changed
+
+    def get(self, instance_name, filename):
+        return BackupRecord.query.filter_by(instance_name=instance_name, filename=filename).first()
+
+    def latest_backup(self, instance_name, dump_format=None, since=None):
+        """Backup más reciente de la instancia, opcionalmente de un formato de dump y posterior a `since`"""
+        query = BackupRecord.query.filter_by(instance_name=instance_name)
+        if dump_format:
+            query = query.filter_by(dump_format=dump_format)
+        if since:
+            query = query.filter(BackupRecord.created_at >= since)
+        return query.order_by(BackupRecord.created_at.desc()).first()
+
+    def backup_path(self, record):
+        return os.path.join(self._instance_dir(record.instance_name), record.filename)
+
+    def list_backups(self, instance_name):
+        return BackupRecord.query.filter_by(instance_name=instance_name) \
+            .order_by(BackupRecord.created_at.desc()).all()
+
+    def summary(self, instance_name=None):
+        """{instancia: (cantidad, bytes totales)} en una sola consulta"""
+        query = db.session.query(
+            BackupRecord.instance_name,
+            func.count(BackupRecord.id),
+            func.coalesce(func.sum(BackupRecord.size_bytes), 0)
+        )
+        if instance_name:
+            query = query.filter(BackupRecord.instance_name == instance_name)
+        rows = query.group_by(BackupRecord.instance_name).all()
+        return {name: (count, int(total)) for name, count, total in rows}
+
+
+def _on_backup_job_finished(job):
+    # El job crea (o importa) el backup y aplica la retención: reconciliar la instancia
+    BackupCatalog().scan_instance(job.instance_name)
+
+
+register_job_hook('backup', _on_backup_job_finished)
+register_job_hook('import_backup', _on_backup_job_finished)
+
+
+class BackupCatalogReconciler:
+    """
+    Reconciliación periódica del catálogo con el disco.
+
+    Corre al arrancar y cada `interval` segundos. Con varios workers de
+    gunicorn solo reconcilia el que obtiene el lock (`lock_path`).
+    """
+
+    def __init__(self, app, interval=None, lock_path=None):
+        self.app = app
+        self.interval = interval or Config.BACKUP_CATALOG_RECONCILE_SECONDS
+        self.leader_lock = ProcessLock(lock_path or Config.BACKUP_CATALOG_LOCK_FILE)
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Arranca el hilo de reconciliación si no está corriendo en este proceso"""
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='backup-catalog', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.leader_lock.try_acquire():
+                self._stop.wait(LEADER_RETRY_SECONDS)
+                continue
+
+            started = time.monotonic()
+            with self.app.app_context():
+                try:
+                    changed = BackupCatalog().reconcile()
+                    if changed:
+                        logger.info(f"Catálogo de backups reconciliado: {changed} cambios")
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error reconciliando el catálogo de backups: {e}")
+                finally:
+                    db.session.remove()
+
+            self._stop.wait(max(self.interval - (time.monotonic() - started), 0))
+
+
+_reconciler = None
+
+
+def start_backup_catalog(app):
+    """Arranca la reconciliación periódica del catálogo del proceso"""
+    global _reconciler
+    if _reconciler is None:
+        _reconciler = BackupCatalogReconciler(app)
+    _reconciler.start()
+    return _reconciler
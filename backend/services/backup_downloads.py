@@ -0,0 +1,107 @@
+import os
+from urllib.parse import quote
+
+from flask import Response, send_file, make_response
+
+from config import Config
+from services.signed_urls import signed_query, check_signature
+from services.backup_archive import stream_materialized_tar_gz
+from services.filestore_store import FilestoreStore, manifest_path_for
+
+SIGNED_DOWNLOAD_ENDPOINT = '/api/backup/v2/download'
+SIGNED_EXPORT_ENDPOINT = '/api/backup/v2/export'
+DOWNLOAD_EXTENSIONS = ('.tar.gz', '.zip')
+
+
+def signed_download_url(backup_path, ttl=None):
+    """
+    URL de descarga firmada (HMAC) y de corta duración para un archivo de BACKUPS_PATH.
+
+    No requiere JWT: la puede abrir el navegador directamente, con lo que la
+    descarga la maneja su gestor de descargas (reanudable con Range).
+    Devuelve (url, expires_at_epoch).
+    """
+    rel_path = os.path.relpath(backup_path, Config.BACKUPS_PATH)
+    query, expires = signed_query(rel_path, ttl or Config.BACKUP_DOWNLOAD_URL_TTL_SECONDS, path=rel_path)
+    return f"{SIGNED_DOWNLOAD_ENDPOINT}?{query}", expires
+
+
+def resolve_signed_download(rel_path, expires, sig):
+    """Valida una URL firmada. Devuelve (ruta_absoluta, None) o (None, (error, status))"""
+    error = check_signature(rel_path, expires, sig)
+    if error:
+        return None, error
+
+    base = os.path.realpath(Config.BACKUPS_PATH)
+    path = os.path.realpath(os.path.join(base, rel_path))
+    if not path.startswith(base + os.sep) or not path.endswith(DOWNLOAD_EXTENSIONS):
+        return None, ('Enlace de descarga inválido', 400)
+    if not os.path.isfile(path):
+        return None, ('Backup no encontrado', 404)
+    return path, None
+
+
+def signed_export_url(instance_name, ttl=None):
+    """URL firmada para la exportación en vivo de una instancia. Devuelve (url, expires_at_epoch)"""
+    query, expires = signed_query(
+        f"export:{instance_name}", ttl or Config.BACKUP_DOWNLOAD_URL_TTL_SECONDS, instance=instance_name
+    )
+    return f"{SIGNED_EXPORT_ENDPOINT}?{query}", expires
+
+
+def check_signed_export(instance_name, expires, sig):
+    """None si la URL de exportación es válida; si no, (error, status)"""
+    return check_signature(f"export:{instance_name}" if instance_name else None, expires, sig)
+
+
+def send_backup_file(backup_path, download_name=None, etag=None):
+    """
+    Respuesta de descarga de un backup.
+
+    Con BACKUP_DOWNLOAD_ACCEL_PREFIX configurado (nginx con la location
+    interna de deploy.sh) solo se devuelven los headers y X-Accel-Redirect:
+    nginx sirve el archivo con sendfile, Range, ETag y Last-Modified y el
+    worker de gunicorn queda libre al instante. Sin nginx se sirve con
+    send_file condicional (Range/If-Range, ETag, Last-Modified, 304/206).
+
+    Los backups con filestore deduplicado solo tienen el dump en disco: se
+    envían armados al vuelo con el filestore del almacén (sin Range ni ETag).
+    """
+    download_name = download_name or os.path.basename(backup_path)
+    mimetype = 'application/zip' if backup_path.endswith('.zip') else 'application/gzip'
+
+    manifest_path = manifest_path_for(backup_path)
+    if os.path.exists(manifest_path):
+        files = FilestoreStore().iter_files(manifest_path)
+        return Response(
+            stream_materialized_tar_gz(backup_path, files),
+            mimetype='application/gzip',
+            headers={
+                'Content-Disposition': f"attachment; filename*=UTF-8''{quote(download_name)}",
+                'Cache-Control': 'private, no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+
+    prefix = Config.BACKUP_DOWNLOAD_ACCEL_PREFIX
+    if prefix:
+        rel_path = os.path.relpath(backup_path, Config.BACKUPS_PATH)
+        response = make_response('', 200)
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(rel_path)
+        response.headers['Content-Type'] = mimetype
+        response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    response = send_file(
+        backup_path,
+        as_attachment=True,
+        download_name=download_name,
+        mimetype=mimetype,
+        conditional=True,
+        etag=etag or True,
+        last_modified=os.path.getmtime(backup_path),
+        max_age=0
+    )
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
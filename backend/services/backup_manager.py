@@ -6,11 +6,16 @@ import glob
 import logging
 
 from config import Config
+from services.job_runner import enqueue_job, job_response, latest_job, read_job_log
+from services.backup_archive import transcode_zip_to_tar_gz
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Los jobs del backup global se registran con este nombre de instancia
+JOB_INSTANCE_NAME = 'production'
+
 class BackupManager:
     def __init__(self, backup_dir=None, scripts_path=None):
         self.backup_dir = backup_dir or Config.BACKUPS_PATH
@@ -95,7 +100,7 @@ class BackupManager:
         except Exception as e:
             raise Exception(f"Error updating crontab: {e}")
     
-    def create_backup(self):
+    def create_backup(self, user_id=None):
         """Crea un nuevo backup"""
         script_path = os.path.join(self.scripts_path, 'odoo/backup-production.sh')
         
@@ -103,25 +108,30 @@ class BackupManager:
             return {'success': False, 'error': 'Script de backup no encontrado'}
         
         try:
-            # Ejecutar script en background
-            cmd = f"RETENTION_DAYS={self.config['retention_days']} /bin/bash {script_path} > /tmp/odoo-backup-latest.log 2>&1 &"
-            subprocess.Popen(
-                cmd,
-                shell=True,
-                stdin=subprocess.DEVNULL,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                start_new_session=True
+            # Encolar en el supervisor de jobs
+            result = enqueue_job(
+                'backup',
+                JOB_INSTANCE_NAME,
+                ['/usr/bin/env', f"RETENTION_DAYS={self.config['retention_days']}", '/bin/bash', script_path],
+                user_id=user_id,
             )
-            
-            return {
-                'success': True,
-                'message': 'Backup iniciado',
-                'log_file': '/tmp/odoo-backup-latest.log'
-            }
+            return job_response(result, 'Backup encolado')
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    def _get_job_log(self, job_type, empty_message):
+        """Log del último job global de un tipo"""
+        job = latest_job(JOB_INSTANCE_NAME, job_type)
+        if not job:
+            return {'log': empty_message, 'exists': False}
+        if job.status == 'queued':
+            return {'log': 'En cola, esperando turno...', 'exists': False, 'job_id': job.id, 'status': job.status}
+        try:
+            log_content, _size = read_job_log(job)
+            return {'log': log_content, 'exists': True, 'job_id': job.id, 'status': job.status, 'completed': job.finished}
+        except Exception as e:
+            return {'log': f'Error al leer log: {str(e)}', 'exists': False}
+    
     def list_backups(self):
         """Lista todos los backups disponibles"""
         pattern = os.path.join(self.backup_dir, 'backup_*.tar.gz')
@@ -188,19 +198,9 @@ class BackupManager:
     
     def get_backup_log(self):
         """Obtiene el log del último backup"""
-        log_file = '/tmp/odoo-backup-latest.log'
-        
-        if not os.path.exists(log_file):
-            return {'log': 'No hay log disponible', 'exists': False}
-        
-        try:
-            with open(log_file, 'r') as f:
-                log_content = f.read()
-            return {'log': log_content, 'exists': True}
-        except Exception as e:
-            return {'log': f'Error al leer log: {str(e)}', 'exists': False}
+        return self._get_job_log('backup', 'No hay log disponible')
     
-    def restore_backup(self, filename):
+    def restore_backup(self, filename, user_id=None):
         """Restaura un backup de producción"""
         backup_path = os.path.join(self.backup_dir, filename)
         
@@ -216,39 +216,18 @@ class BackupManager:
             return {'success': False, 'error': 'Script de restauración no encontrado'}
         
         try:
-            # Ejecutar script de restauración en background
-            cmd = f"/bin/bash {script_path} {filename} > /tmp/odoo-restore-latest.log 2>&1 &"
-            subprocess.Popen(
-                cmd,
-                shell=True,
-                stdin=subprocess.DEVNULL,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                start_new_session=True
-            )
-            
-            return {
-                'success': True,
-                'message': 'Restauración iniciada',
-                'log_file': '/tmp/odoo-restore-latest.log',
-                'backup_file': filename
-            }
+            # Encolar la restauración (máxima prioridad en la cola de jobs)
+            result = enqueue_job('restore', JOB_INSTANCE_NAME, ['/bin/bash', script_path, filename], user_id=user_id)
+            response = job_response(result, 'Restauración encolada')
+            if response['success']:
+                response['backup_file'] = filename
+            return response
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
     def get_restore_log(self):
         """Obtiene el log de la última restauración"""
-        log_file = '/tmp/odoo-restore-latest.log'
-        
-        if not os.path.exists(log_file):
-            return {'log': 'No hay log de restauración disponible', 'exists': False}
-        
-        try:
-            with open(log_file, 'r') as f:
-                log_content = f.read()
-            return {'log': log_content, 'exists': True}
-        except Exception as e:
-            return {'log': f'Error al leer log: {str(e)}', 'exists': False}
+        return self._get_job_log('restore', 'No hay log de restauración disponible')
     
     def upload_backup(self, file):
         """Sube un archivo de backup (.tar.gz o .zip)"""
@@ -297,65 +276,33 @@ class BackupManager:
             logger.info(f"✅ Archivo guardado completamente: {bytes_written / 1024 / 1024:.2f}MB")
             sys.stdout.flush()
             
-            # Si es ZIP, convertir a TAR.GZ
+            # Si es ZIP, convertir a TAR.GZ en streaming (sin extraer a disco)
             if is_zip:
                 logger.info("📂 Iniciando conversión de ZIP a TAR.GZ...")
                 
-                # Crear directorio temporal para extraer
-                extract_dir = os.path.join(tempfile.gettempdir(), f"extract_{timestamp}")
-                os.makedirs(extract_dir, exist_ok=True)
-                logger.info(f"📁 Directorio de extracción: {extract_dir}")
-                
                 try:
-                    # Extraer ZIP
-                    logger.info("🔓 Extrayendo archivo ZIP...")
-                    with zipfile.ZipFile(temp_path, 'r') as zip_ref:
-                        zip_ref.extractall(extract_dir)
-                    logger.info("✅ Extracción completada")
-                    
-                    # Validar estructura
+                    # Validar estructura con el índice del ZIP
                     logger.info("🔍 Validando estructura del backup...")
-                    has_dump = False
-                    has_filestore = False
-                    
-                    for root, dirs, files in os.walk(extract_dir):
-                        if 'dump.sql' in files:
-                            has_dump = True
-                            logger.info(f"✅ dump.sql encontrado en: {root}")
-                        if 'filestore' in dirs:
-                            has_filestore = True
-                            logger.info(f"✅ filestore encontrado en: {root}")
+                    with zipfile.ZipFile(temp_path, 'r') as zip_ref:
+                        names = zip_ref.namelist()
                     
-                    if not has_dump:
+                    if not any(os.path.basename(name) == 'dump.sql' for name in names):
                         logger.error("❌ El backup no contiene dump.sql")
-                        shutil.rmtree(extract_dir)
                         os.remove(temp_path)
                         return {'success': False, 'error': 'El backup no contiene dump.sql'}
                     
-                    if not has_filestore:
+                    if not any(name.startswith('filestore/') or '/filestore/' in name for name in names):
                         logger.warning("⚠️ El backup no contiene filestore")
                     
-                    # Crear TAR.GZ desde el contenido extraído
                     logger.info("📦 Creando archivo TAR.GZ...")
                     final_filename = f"backup_production_{timestamp}.tar.gz"
                     final_filepath = os.path.join(self.backup_dir, final_filename)
-                    
-                    with tarfile.open(final_filepath, 'w:gz') as tar:
-                        for item in os.listdir(extract_dir):
-                            logger.info(f"➕ Agregando: {item}")
-                            tar.add(os.path.join(extract_dir, item), arcname=item)
-                    
+                    transcode_zip_to_tar_gz(temp_path, final_filepath)
                     logger.info(f"✅ TAR.GZ creado: {final_filepath}")
                     
-                    # Limpiar temporales
-                    logger.info("🧹 Limpiando archivos temporales...")
-                    shutil.rmtree(extract_dir)
                     os.remove(temp_path)
-                    logger.info("✅ Archivos temporales eliminados")
                     
                 except Exception as e:
-                    if os.path.exists(extract_dir):
-                        shutil.rmtree(extract_dir)
                     if os.path.exists(temp_path):
                         os.remove(temp_path)
                     raise e
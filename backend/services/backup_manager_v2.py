@@ -1,17 +1,82 @@
 import os
+import sys
 import json
 import subprocess
 from datetime import datetime
-import glob
 import logging
 import re
+import threading
 
 from config import Config
+from services.job_runner import enqueue_job, job_response, latest_job, read_job_log
+from services.filestore_store import FilestoreStore, manifest_path_for
+from services.backup_catalog import BackupCatalog, meta_path_for, write_backup_meta
+from services.backup_archive import transcode_zip_to_tar_gz, read_tar_gz_index, stream_backup_zip
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Dumps restaurables: dump.sql (Odoo Online), dump/ (pg_dump -Fd) o dump.dump (pg_dump -Fc)
+DUMP_MARKERS = ('dump.sql', 'dump/toc.dat', 'dump.dump')
+MISSING_DUMP_ERROR = 'El backup no contiene dump.sql ni dump/'
+
+
+# Base backups del cluster para PITR: los jobs se registran a nombre de 'postgres'
+PITR_JOB_INSTANCE = 'postgres'
+PITR_DEFAULT_SCHEDULE = '0 2 * * 0'
+PITR_CRON_COMMENT = "# Odoo PITR base backup - Managed by API-DEV"
+
+# Los backups programados los encola cron con esta herramienta (pasan por la cola de jobs)
+BACKUP_TOOL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backup_tool.py')
+PITR_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+# Exportaciones en vivo simultáneas por worker (cada una mantiene un pg_dump abierto)
+_export_slots = threading.BoundedSemaphore(max(Config.BACKUP_EXPORT_MAX_CONCURRENT, 1))
+
+
+class _ExportStream:
+    """Cuerpo de la respuesta de una exportación: al cerrarse termina pg_dump y libera el cupo"""
+
+    def __init__(self, instance_name, chunks):
+        self.instance_name = instance_name
+        self.chunks = chunks
+        self._released = False
+
+    def __iter__(self):
+        try:
+            yield from self.chunks
+        except Exception as e:
+            logger.error(f"Exportación de {self.instance_name} interrumpida: {e}")
+            raise
+
+    def close(self):
+        # El servidor WSGI lo llama siempre, aunque el cliente se desconecte antes de empezar
+        self.chunks.close()
+        if not self._released:
+            self._released = True
+            _export_slots.release()
+
+
+def has_database_dump(paths):
+    """Indica si alguna de las rutas del backup es un dump restaurable"""
+    return any(path.rstrip('/').endswith(marker) for path in paths for marker in DUMP_MARKERS)
+
+
+def backup_timestamp(filename):
+    """Timestamp del formato por defecto backup_YYYYMMDD_HHMMSS.<ext>, o 'unknown'"""
+    base_no_ext = filename
+    for ext in ('.tar.gz', '.zip'):
+        if base_no_ext.endswith(ext):
+            base_no_ext = base_no_ext[:-len(ext)]
+            break
+
+    parts = base_no_ext.split('_')
+    if len(parts) >= 3 and parts[0] == 'backup' and parts[1].isdigit() and parts[2].isdigit():
+        return f"{parts[1]}_{parts[2]}"
+    return 'unknown'
+
 class BackupManagerV2:
     """
     Sistema de backups multi-instancia
@@ -23,6 +88,7 @@ class BackupManagerV2:
         self.scripts_path = scripts_path or Config.SCRIPTS_PATH
         self.instances_dir = os.path.join(self.backup_dir, 'instances')
         self.global_config_file = os.path.join(self.backup_dir, 'backup_config.json')
+        self.catalog = BackupCatalog(self.instances_dir)
         self._ensure_directories()
         self._load_global_config()
     
@@ -47,9 +113,11 @@ class BackupManagerV2:
             self._save_global_config()
     
     def _save_global_config(self):
-        """Guarda la configuración global"""
-        with open(self.global_config_file, 'w') as f:
+        """Guarda la configuración global (reemplazo atómico: otros workers la releen)"""
+        tmp_path = self.global_config_file + '.tmp'
+        with open(tmp_path, 'w') as f:
             json.dump(self.global_config, f, indent=2)
+        os.replace(tmp_path, self.global_config_file)
     
     def _get_instance_dir(self, instance_name):
         """Obtiene el directorio de una instancia"""
@@ -183,19 +251,14 @@ class BackupManagerV2:
         if os.path.exists(self.instances_dir):
             configured_instances = set(os.listdir(self.instances_dir))
         
+        # Cantidad y tamaño de backups de todas las instancias en una consulta
+        summary = self.catalog.summary()
+        
         # Procesar todas las instancias de producción
         for instance_name in all_prod_instances:
             # Cargar o crear configuración (esto crea la carpeta si no existe)
             config = self._load_instance_config(instance_name)
-            instance_dir = self._get_instance_dir(instance_name)
-            
-            # Contar backups
-            pattern = os.path.join(instance_dir, '*.tar.gz')
-            backup_files = glob.glob(pattern)
-            backup_count = len(backup_files)
-            
-            # Calcular tamaño total
-            total_size = sum(os.path.getsize(f) for f in backup_files if os.path.exists(f))
+            backup_count, total_size = summary.get(instance_name, (0, 0))
             
             instances.append({
                 'name': instance_name,
@@ -225,10 +288,7 @@ class BackupManagerV2:
         config = self._load_instance_config(instance_name)
         
         # Agregar estadísticas actuales
-        pattern = os.path.join(self._get_instance_dir(instance_name), '*.tar.gz')
-        backup_files = glob.glob(pattern)
-        backup_count = len(backup_files)
-        total_size = sum(os.path.getsize(f) for f in backup_files if os.path.exists(f))
+        backup_count, total_size = self.catalog.summary(instance_name).get(instance_name, (0, 0))
         
         config['backup_count'] = backup_count
         config['total_size'] = total_size
@@ -262,7 +322,7 @@ class BackupManagerV2:
             auto_backup_enabled=bool(enabled)
         )
     
-    def create_backup(self, instance_name, custom_filename=None):
+    def create_backup(self, instance_name, custom_filename=None, user_id=None):
         """Crea un backup manual de una instancia"""
         script_path = os.path.join(self.scripts_path, 'odoo/backup-instance.sh')
         
@@ -279,75 +339,47 @@ class BackupManagerV2:
         try:
             safe_custom = self._normalize_backup_filename(custom_filename) if custom_filename else None
 
-            # Ejecutar script en background
-            log_file = f'/tmp/odoo-backup-{instance_name}-latest.log'
+            # Encolar en el supervisor de jobs (prioridad y límite de concurrencia)
+            command = ['/bin/bash', script_path, instance_name]
             if safe_custom:
-                cmd = f"/bin/bash {script_path} {instance_name} {safe_custom} > {log_file} 2>&1 &"
-            else:
-                cmd = f"/bin/bash {script_path} {instance_name} > {log_file} 2>&1 &"
-            subprocess.Popen(
-                cmd,
-                shell=True,
-                stdin=subprocess.DEVNULL,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                start_new_session=True
-            )
-            
-            return {
-                'success': True,
-                'message': f'Backup de {instance_name} iniciado',
-                'log_file': log_file
-            }
+                command.append(safe_custom)
+            result = enqueue_job('backup', instance_name, command, user_id=user_id)
+            return job_response(result, f'Backup de {instance_name} encolado')
         except Exception as e:
             logger.error(f"Error creating backup for {instance_name}: {e}")
             return {'success': False, 'error': str(e)}
     
+    def run_scheduled_backup(self, instance_name):
+        """Encola el backup programado de una instancia (cron), si sigue habilitado"""
+        if instance_name not in self._get_all_production_instances():
+            return {'success': False, 'error': f'Instancia {instance_name} no encontrada'}
+        if not self._load_instance_config(instance_name).get('auto_backup_enabled', False):
+            return {'success': True, 'skipped': True,
+                    'message': f'Backup automático deshabilitado para {instance_name}'}
+        return self.create_backup(instance_name)
+    
     def list_backups(self, instance_name):
         """Lista todos los backups de una instancia"""
         instance_dir = self._get_instance_dir(instance_name)
         backups = []
 
-        patterns = [os.path.join(instance_dir, '*.tar.gz'), os.path.join(instance_dir, '*.zip')]
-        backup_files = []
-        for pattern in patterns:
-            backup_files.extend(glob.glob(pattern))
-        backup_files.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0, reverse=True)
-
-        for backup_file in backup_files:
-            try:
-                basename = os.path.basename(backup_file)
-
-                # Extraer timestamp si aplica al formato default: backup_YYYYMMDD_HHMMSS.tar.gz
-                timestamp = 'unknown'
-                base_no_ext = basename
-                if base_no_ext.endswith('.tar.gz'):
-                    base_no_ext = base_no_ext[:-len('.tar.gz')]
-                elif base_no_ext.endswith('.zip'):
-                    base_no_ext = base_no_ext[:-len('.zip')]
-
-                parts = base_no_ext.split('_')
-                if len(parts) >= 3 and parts[0] == 'backup' and parts[1].isdigit() and parts[2].isdigit():
-                    date_str = parts[1]
-                    time_str = parts[2]
-                    timestamp = f"{date_str}_{time_str}"
-                
-                # Información del archivo
-                stat = os.stat(backup_file)
-                size_bytes = stat.st_size
-                
-                backups.append({
-                    'filename': basename,
-                    'path': backup_file,
-                    'timestamp': timestamp,
-                    'date': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
-                    'size_bytes': size_bytes,
-                    'size_mb': round(size_bytes / (1024 * 1024), 2),
-                    'size_human': self._human_readable_size(size_bytes)
-                })
-            except Exception as e:
-                logger.error(f"Error reading backup {backup_file}: {e}")
-                continue
+        for record in self.catalog.list_backups(instance_name):
+            size_bytes = record.size_bytes
+            backups.append({
+                'filename': record.filename,
+                'path': os.path.join(instance_dir, record.filename),
+                'timestamp': backup_timestamp(record.filename),
+                'date': record.created_at.strftime('%Y-%m-%d %H:%M:%S') if record.created_at else None,
+                'size_bytes': size_bytes,
+                'size_mb': round(size_bytes / (1024 * 1024), 2),
+                'size_human': self._human_readable_size(size_bytes),
+                'checksum': record.checksum,
+                'db_size_bytes': record.db_size_bytes,
+                'filestore_size_bytes': record.filestore_size_bytes,
+                'dump_format': record.dump_format,
+                'source': record.source,
+                'filestore_deduplicated': record.filestore_mode == 'store'
+            })
         
         # Calcular estadísticas
         total_size = sum(b['size_bytes'] for b in backups)
@@ -375,25 +407,42 @@ class BackupManagerV2:
         
         try:
             os.remove(backup_path)
+            if os.path.exists(meta_path_for(backup_path)):
+                os.remove(meta_path_for(backup_path))
+            # Liberar del almacén deduplicado los adjuntos que solo usaba este backup
+            manifest_path = manifest_path_for(backup_path)
+            if os.path.exists(manifest_path):
+                FilestoreStore().release(manifest_path)
+            self.catalog.remove(instance_name, filename)
             return {'success': True, 'message': f'Backup {filename} eliminado'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def get_backup_log(self, instance_name):
-        """Obtiene el log del último backup de una instancia"""
-        log_file = f'/tmp/odoo-backup-{instance_name}-latest.log'
-        
-        if not os.path.exists(log_file):
-            return {'log': 'No hay log disponible', 'exists': False}
+    def _get_job_log(self, instance_name, job_type, empty_message):
+        """Log del último job de un tipo para una instancia"""
+        job = latest_job(instance_name, job_type)
+        if not job:
+            return {'log': empty_message, 'exists': False}
+        if job.status == 'queued':
+            return {'log': 'En cola, esperando turno...', 'exists': False, 'job_id': job.id, 'status': job.status}
         
         try:
-            with open(log_file, 'r') as f:
-                log_content = f.read()
-            return {'log': log_content, 'exists': True}
+            log_content, _size = read_job_log(job)
+            return {
+                'log': log_content,
+                'exists': True,
+                'job_id': job.id,
+                'status': job.status,
+                'completed': job.finished
+            }
         except Exception as e:
             return {'log': f'Error al leer log: {str(e)}', 'exists': False}
     
-    def restore_backup(self, instance_name, filename):
+    def get_backup_log(self, instance_name):
+        """Obtiene el log del último backup de una instancia"""
+        return self._get_job_log(instance_name, 'backup', 'No hay log disponible')
+    
+    def restore_backup(self, instance_name, filename, user_id=None):
         """Restaura un backup de una instancia"""
         instance_dir = self._get_instance_dir(instance_name)
         backup_path = os.path.join(instance_dir, filename)
@@ -410,62 +459,30 @@ class BackupManagerV2:
             return {'success': False, 'error': 'Script de restauración no encontrado'}
 
         try:
-            restore_path = backup_path
-
-            # Si es ZIP (Odoo.sh), convertir a TAR.GZ (formato esperado por restore-instance.sh)
+            # restore-instance.sh lee el .zip (Odoo.sh) directamente: solo se
+            # valida el índice del ZIP, sin extraerlo ni recomprimirlo
             if filename.endswith('.zip'):
-                import tarfile
                 import zipfile
-                import tempfile
-                import shutil
-
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                temp_extract_dir = os.path.join(tempfile.gettempdir(), f"odoo-zip-restore-{instance_name}-{timestamp}")
-                os.makedirs(temp_extract_dir, exist_ok=True)
 
                 try:
                     with zipfile.ZipFile(backup_path, 'r') as zip_ref:
-                        zip_ref.extractall(temp_extract_dir)
-
-                    # Validar estructura básica
-                    has_dump = False
-                    for root, _dirs, files in os.walk(temp_extract_dir):
-                        if 'dump.sql' in files:
-                            has_dump = True
-                            break
-                    if not has_dump:
-                        shutil.rmtree(temp_extract_dir)
-                        return {'success': False, 'error': 'El backup .zip no contiene dump.sql'}
-
-                    converted_name = f"restore_from_zip_{timestamp}.tar.gz"
-                    restore_path = os.path.join(instance_dir, converted_name)
-
-                    with tarfile.open(restore_path, 'w:gz') as tar:
-                        for item in os.listdir(temp_extract_dir):
-                            tar.add(os.path.join(temp_extract_dir, item), arcname=item)
-
-                finally:
-                    if os.path.exists(temp_extract_dir):
-                        shutil.rmtree(temp_extract_dir)
-
-            # Ejecutar script de restauración en background
-            log_file = f'/tmp/odoo-restore-{instance_name}-latest.log'
-            cmd = f"/bin/bash {script_path} {instance_name} {restore_path} > {log_file} 2>&1 &"
-            subprocess.Popen(
-                cmd,
-                shell=True,
-                stdin=subprocess.DEVNULL,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                start_new_session=True
+                        names = zip_ref.namelist()
+                except zipfile.BadZipFile:
+                    return {'success': False, 'error': 'El archivo .zip está dañado'}
+                if not has_database_dump(names):
+                    return {'success': False, 'error': MISSING_DUMP_ERROR}
+
+            # Encolar la restauración (máxima prioridad en la cola de jobs)
+            result = enqueue_job(
+                'restore',
+                instance_name,
+                ['/bin/bash', script_path, instance_name, backup_path],
+                user_id=user_id,
             )
-            
-            return {
-                'success': True,
-                'message': f'Restauración de {instance_name} iniciada',
-                'log_file': log_file,
-                'backup_file': filename
-            }
+            response = job_response(result, f'Restauración de {instance_name} encolada')
+            if response['success']:
+                response['backup_file'] = filename
+            return response
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
@@ -491,6 +508,10 @@ class BackupManagerV2:
 
         try:
             os.rename(old_path, new_path)
+            for sidecar_for in (manifest_path_for, meta_path_for):
+                if os.path.exists(sidecar_for(old_path)):
+                    os.rename(sidecar_for(old_path), sidecar_for(new_path))
+            self.catalog.rename(instance_name, old_filename, normalized_new)
             return {
                 'success': True,
                 'message': 'Backup renombrado',
@@ -502,18 +523,129 @@ class BackupManagerV2:
     
     def get_restore_log(self, instance_name):
         """Obtiene el log de la última restauración de una instancia"""
-        log_file = f'/tmp/odoo-restore-{instance_name}-latest.log'
-        
-        if not os.path.exists(log_file):
-            return {'log': 'No hay log de restauración disponible', 'exists': False}
+        return self._get_job_log(instance_name, 'restore', 'No hay log de restauración disponible')
+    
+    def _list_base_backups(self):
+        """Base backups completos del cluster, del más nuevo al más viejo"""
+        bases = []
+        if not os.path.isdir(Config.PITR_BASE_PATH):
+            return bases
+        for name in sorted(os.listdir(Config.PITR_BASE_PATH), reverse=True):
+            try:
+                with open(os.path.join(Config.PITR_BASE_PATH, name, 'backup.json'), 'r') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                # En curso o incompleto
+                continue
+            meta['id'] = name
+            meta['size_human'] = self._human_readable_size(meta.get('size_bytes') or 0)
+            bases.append(meta)
+        return bases
+
+    def _latest_wal_time(self):
+        """Fecha del último segmento de WAL archivado"""
+        latest = None
+        try:
+            with os.scandir(Config.PITR_WAL_ARCHIVE_PATH) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        mtime = entry.stat().st_mtime
+                        if latest is None or mtime > latest:
+                            latest = mtime
+        except OSError:
+            return None
+        return datetime.fromtimestamp(latest) if latest else None
+
+    def get_pitr_status(self):
+        """Estado de la restauración a un punto en el tiempo y ventana disponible"""
+        # El manager vive por worker: releer lo que haya guardado otro
+        self._load_global_config()
+        pitr = self.global_config.get('pitr', {})
+        bases = self._list_base_backups()
+        latest_wal = self._latest_wal_time()
+
+        earliest = bases[-1]['finished_at'] if bases else None
+        latest = None
+        if bases and latest_wal:
+            latest = max(latest_wal.strftime(PITR_TIME_FORMAT), bases[0]['finished_at'])
+
+        return {
+            'enabled': pitr.get('enabled', False),
+            'schedule': pitr.get('schedule', PITR_DEFAULT_SCHEDULE),
+            'base_backups': bases,
+            'earliest_restore_time': earliest,
+            'latest_restore_time': latest
+        }
+
+    def update_pitr_config(self, enabled=None, schedule=None):
+        """Activa/desactiva los base backups programados y su frecuencia"""
+        if enabled is not None and not isinstance(enabled, bool):
+            return {'success': False, 'error': 'enabled debe ser true o false'}
         
+        self._load_global_config()
+        pitr = self.global_config.setdefault('pitr', {})
+        if schedule is not None:
+            if len(str(schedule).split()) != 5:
+                return {'success': False, 'error': 'Schedule inválido (formato cron de 5 campos)'}
+            pitr['schedule'] = schedule
+        if enabled is not None:
+            pitr['enabled'] = enabled
+        self._save_global_config()
+
         try:
-            with open(log_file, 'r') as f:
-                log_content = f.read()
-            return {'log': log_content, 'exists': True}
+            self._update_crontab()
         except Exception as e:
-            return {'log': f'Error al leer log: {str(e)}', 'exists': False}
-    
+            return {'success': False, 'error': str(e)}
+        return {'success': True, 'pitr': self.get_pitr_status()}
+
+    def create_base_backup(self, user_id=None):
+        """Encola un base backup del cluster (punto de partida del WAL archivado)"""
+        script_path = os.path.join(self.scripts_path, 'odoo/pitr-base-backup.sh')
+        if not os.path.exists(script_path):
+            return {'success': False, 'error': 'Script de base backup no encontrado'}
+
+        result = enqueue_job('base_backup', PITR_JOB_INSTANCE, ['/bin/bash', script_path], user_id=user_id)
+        return job_response(result, 'Base backup encolado')
+
+    def run_scheduled_base_backup(self):
+        """Encola el base backup programado (cron), si PITR sigue habilitado"""
+        self._load_global_config()
+        if not self.global_config.get('pitr', {}).get('enabled'):
+            return {'success': True, 'skipped': True, 'message': 'PITR deshabilitado'}
+        return self.create_base_backup()
+
+    def restore_point_in_time(self, instance_name, target_time, user_id=None):
+        """Restaura la base de una instancia al estado que tenía en `target_time`"""
+        script_path = os.path.join(self.scripts_path, 'odoo/pitr-restore.sh')
+        if not os.path.exists(script_path):
+            return {'success': False, 'error': 'Script de restauración PITR no encontrado'}
+
+        try:
+            target = datetime.fromisoformat(str(target_time).strip()).strftime(PITR_TIME_FORMAT)
+        except ValueError:
+            return {'success': False, 'error': 'Fecha inválida (formato YYYY-MM-DD HH:MM:SS)'}
+
+        status = self.get_pitr_status()
+        if not status['earliest_restore_time']:
+            return {'success': False, 'error': 'No hay base backups para restaurar a un punto en el tiempo'}
+        if not status['earliest_restore_time'] <= target <= status['latest_restore_time']:
+            return {
+                'success': False,
+                'error': f"Fecha fuera de la ventana disponible "
+                         f"({status['earliest_restore_time']} - {status['latest_restore_time']})"
+            }
+
+        result = enqueue_job(
+            'restore',
+            instance_name,
+            ['/bin/bash', script_path, instance_name, target],
+            user_id=user_id,
+        )
+        response = job_response(result, f'Restauración de {instance_name} al {target} encolada')
+        if response['success']:
+            response['target_time'] = target
+        return response
+
     def get_global_stats(self):
         """Obtiene estadísticas globales de todos los backups"""
         instances_data = self.list_instances_with_backups()
@@ -537,8 +669,15 @@ class BackupManagerV2:
     def _update_crontab(self):
         """Actualiza el crontab con todas las instancias habilitadas"""
         cron_comment = "# Odoo Backups - Managed by API-DEV"
-        script_path = os.path.join(self.scripts_path, 'odoo/backup-instance.sh')
         cron_log = os.path.join(self.backup_dir, 'cron.log')
+        # Las versiones anteriores llamaban a los scripts directamente desde cron
+        legacy_scripts = (
+            os.path.join(self.scripts_path, 'odoo/backup-instance.sh'),
+            os.path.join(self.scripts_path, 'odoo/pitr-base-backup.sh'),
+        )
+        # Cron solo encola: el backup corre en el supervisor de jobs, con su
+        # prioridad, límite de concurrencia, log y registro en el catálogo
+        tool = f"{sys.executable} {BACKUP_TOOL}"
         
         # Leer crontab actual
         try:
@@ -549,28 +688,29 @@ class BackupManagerV2:
             current_cron = ""
         
         # Eliminar líneas antiguas de backups
-        lines = []
-        skip_next = False
-        for line in current_cron.split('\n'):
-            if cron_comment in line:
-                skip_next = True
-                continue
-            if skip_next and script_path in line:
-                skip_next = False
-                continue
-            if line.strip():
-                lines.append(line)
-        
-        # Agregar nuevas líneas para instancias habilitadas
-        instances_data = self.list_instances_with_backups()
-        enabled_instances = [i for i in instances_data['instances'] if i['auto_backup_enabled']]
+        managed = (cron_comment, PITR_CRON_COMMENT, f'{BACKUP_TOOL} enqueue-') + legacy_scripts
+        lines = [
+            line for line in current_cron.split('\n')
+            if line.strip() and not any(marker in line for marker in managed)
+        ]
+        
+        # Agregar nuevas líneas para instancias habilitadas (solo hace falta la configuración)
+        enabled_instances = []
+        for instance_name in sorted(self._get_all_production_instances()):
+            config = self._load_instance_config(instance_name)
+            if config.get('auto_backup_enabled', False):
+                enabled_instances.append((instance_name, config.get('schedule', '0 3 * * *')))
         
         if enabled_instances:
             lines.append(cron_comment)
-            for instance in enabled_instances:
-                schedule = instance['schedule']
-                instance_name = instance['name']
-                lines.append(f"{schedule} {script_path} {instance_name} >> {cron_log} 2>&1")
+            for instance_name, schedule in enabled_instances:
+                lines.append(f"{schedule} {tool} enqueue-backup {instance_name} >> {cron_log} 2>&1")
+
+        self._load_global_config()
+        pitr = self.global_config.get('pitr', {})
+        if pitr.get('enabled'):
+            lines.append(PITR_CRON_COMMENT)
+            lines.append(f"{pitr.get('schedule', PITR_DEFAULT_SCHEDULE)} {tool} enqueue-base-backup >> {cron_log} 2>&1")
         
         # Escribir nuevo crontab
         new_cron = '\n'.join(lines) + '\n'
@@ -591,10 +731,6 @@ class BackupManagerV2:
     
     def upload_backup(self, instance_name, file):
         """Sube un archivo de backup para una instancia específica"""
-        import tarfile
-        import zipfile
-        import tempfile
-        import shutil
         import sys
         
         try:
@@ -608,15 +744,12 @@ class BackupManagerV2:
             if not os.path.exists(instance_dir):
                 return {'success': False, 'error': f'Instancia {instance_name} no encontrada'}
             
-            # Generar nombre único con timestamp
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             original_filename = file.filename
-            is_zip = original_filename.endswith('.zip')
-            
-            logger.info(f"📝 Tipo de archivo: {'ZIP' if is_zip else 'TAR.GZ'}")
             
-            # Guardar archivo temporal
-            temp_path = os.path.join(tempfile.gettempdir(), f"upload_{timestamp}_{original_filename}")
+            # Guardar archivo temporal en el directorio de la instancia: el .tar.gz
+            # se mueve con un rename y el .zip no pasa por /tmp (.part: fuera del catálogo)
+            temp_path = os.path.join(instance_dir, f".upload_{timestamp}_{os.path.basename(original_filename)}.part")
             
             logger.info(f"💾 Guardando en: {temp_path}")
             sys.stdout.flush()
@@ -632,7 +765,6 @@ class BackupManagerV2:
                         break
                     f.write(chunk)
             logger.info("✅ Archivo guardado completamente (stream-safe)")
-            sys.stdout.flush()
             
             # Obtener tamaño del archivo guardado
             bytes_written = os.path.getsize(temp_path)
@@ -640,126 +772,149 @@ class BackupManagerV2:
             logger.info(f"✅ Archivo guardado completamente: {bytes_written / 1024 / 1024:.2f}MB")
             sys.stdout.flush()
             
-            # Si es ZIP, convertir a TAR.GZ
+            result = self.import_backup_file(instance_name, temp_path, original_filename)
+            sys.stdout.flush()
+            return result
+            
+        except Exception as e:
+            logger.error(f"💥 Error en upload_backup: {str(e)}")
+            logger.exception("Stack trace:")
+            sys.stdout.flush()
+            return {'success': False, 'error': str(e)}
+    
+    def import_backup_file(self, instance_name, source_path, original_filename, record=True):
+        """
+        Valida un backup subido y lo incorpora a la instancia como backup_<timestamp>.tar.gz.
+        
+        `source_path` se consume (se mueve o se elimina). Un .zip se transcodifica
+        a .tar.gz en streaming; un .tar.gz se valida y se mueve con un rename.
+        Con `record=False` no se toca la base del panel (uso desde backup_tool.py:
+        el catálogo se reconcilia al terminar el job).
+        """
+        import zipfile
+        import tarfile
+        
+        instance_dir = os.path.join(self.instances_dir, instance_name)
+        if not os.path.exists(instance_dir):
+            return {'success': False, 'error': f'Instancia {instance_name} no encontrada'}
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        final_filename = f"backup_{timestamp}.tar.gz"
+        final_filepath = os.path.join(instance_dir, final_filename)
+        is_zip = original_filename.endswith('.zip')
+        
+        logger.info(f"📝 Tipo de archivo: {'ZIP' if is_zip else 'TAR.GZ'}")
+        
+        try:
+            # Si es ZIP, convertir a TAR.GZ en streaming (sin extraer a disco)
             if is_zip:
                 logger.info("📂 Iniciando conversión de ZIP a TAR.GZ...")
                 
-                # Crear directorio temporal para extraer
-                extract_dir = os.path.join(tempfile.gettempdir(), f"extract_{timestamp}")
-                os.makedirs(extract_dir, exist_ok=True)
-                logger.info(f"📁 Directorio de extracción: {extract_dir}")
+                # Validar estructura con el índice del ZIP (no requiere leer el contenido)
+                logger.info("🔍 Validando estructura del backup...")
+                try:
+                    with zipfile.ZipFile(source_path, 'r') as zip_ref:
+                        names = zip_ref.namelist()
+                except zipfile.BadZipFile:
+                    return {'success': False, 'error': 'El archivo .zip está dañado'}
+                
+                if not has_database_dump(names):
+                    logger.error(f"❌ {MISSING_DUMP_ERROR}")
+                    return {'success': False, 'error': MISSING_DUMP_ERROR}
                 
+                if not any(name.startswith('filestore/') or '/filestore/' in name for name in names):
+                    logger.warning("⚠️ El backup no contiene filestore")
+                
+                logger.info(f"📦 Transcodificando {len(names)} entradas a TAR.GZ...")
                 try:
-                    # Extraer ZIP
-                    logger.info("🔓 Extrayendo archivo ZIP...")
-                    with zipfile.ZipFile(temp_path, 'r') as zip_ref:
-                        zip_ref.extractall(extract_dir)
-                    logger.info("✅ Extracción completada")
-                    
-                    # Validar estructura
-                    logger.info("🔍 Validando estructura del backup...")
-                    has_dump = False
-                    has_filestore = False
-                    
-                    for root, dirs, files in os.walk(extract_dir):
-                        if 'dump.sql' in files:
-                            has_dump = True
-                            logger.info(f"✅ dump.sql encontrado en: {root}")
-                        if 'filestore' in dirs:
-                            has_filestore = True
-                            logger.info(f"✅ filestore encontrado en: {root}")
-                    
-                    if not has_dump:
-                        logger.error("❌ El backup no contiene dump.sql")
-                        shutil.rmtree(extract_dir)
-                        os.remove(temp_path)
-                        return {'success': False, 'error': 'El backup no contiene dump.sql'}
-                    
-                    if not has_filestore:
-                        logger.warning("⚠️ El backup no contiene filestore")
-                    
-                    # Crear TAR.GZ desde el contenido extraído
-                    logger.info("📦 Creando archivo TAR.GZ...")
-                    final_filename = f"backup_{timestamp}.tar.gz"
-                    final_filepath = os.path.join(instance_dir, final_filename)
-                    
-                    with tarfile.open(final_filepath, 'w:gz') as tar:
-                        for item in os.listdir(extract_dir):
-                            logger.info(f"➕ Agregando: {item}")
-                            tar.add(os.path.join(extract_dir, item), arcname=item)
-                    
-                    logger.info(f"✅ TAR.GZ creado: {final_filepath}")
-                    
-                    # Limpiar temporales
-                    logger.info("🧹 Limpiando archivos temporales...")
-                    shutil.rmtree(extract_dir)
-                    os.remove(temp_path)
-                    
+                    transcoded = transcode_zip_to_tar_gz(source_path, final_filepath)
                 except Exception as e:
                     logger.error(f"❌ Error en conversión ZIP: {str(e)}")
-                    if os.path.exists(extract_dir):
-                        shutil.rmtree(extract_dir)
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
                     return {'success': False, 'error': f'Error al procesar ZIP: {str(e)}'}
+                checksum = transcoded['checksum_sha256']
+                logger.info(f"✅ TAR.GZ creado: {final_filepath}")
             
             else:
-                # Es TAR.GZ, validar estructura
+                # Es TAR.GZ: validar estructura y calcular el checksum en la misma lectura
                 logger.info("🔍 Validando estructura del TAR.GZ...")
                 try:
-                    with tarfile.open(temp_path, 'r:gz') as tar:
-                        members = tar.getnames()
-                        has_dump = any('dump.sql' in m for m in members)
-                        has_filestore = any('filestore' in m for m in members)
-                        
-                        if not has_dump:
-                            logger.error("❌ El backup no contiene dump.sql")
-                            os.remove(temp_path)
-                            return {'success': False, 'error': 'El backup no contiene dump.sql'}
-                        
-                        if not has_filestore:
-                            logger.warning("⚠️ El backup no contiene filestore")
-                        
-                        logger.info("✅ Estructura válida")
-                    
-                    # Mover a directorio final
-                    final_filename = f"backup_{timestamp}.tar.gz"
-                    final_filepath = os.path.join(instance_dir, final_filename)
-                    shutil.move(temp_path, final_filepath)
-                    logger.info(f"✅ Archivo movido a: {final_filepath}")
-                    
-                except Exception as e:
+                    index = read_tar_gz_index(source_path)
+                except (tarfile.TarError, OSError, EOFError) as e:
                     logger.error(f"❌ Error validando TAR.GZ: {str(e)}")
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
                     return {'success': False, 'error': f'Error al validar TAR.GZ: {str(e)}'}
-            
-            # Actualizar configuración de la instancia
-            final_size = os.path.getsize(final_filepath)
-            config = self.get_instance_config(instance_name)
-            config['last_backup'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            config['last_backup_status'] = 'uploaded'
-            config['last_backup_size'] = final_size
-            config['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            self._save_instance_config(instance_name, config)
-            
-            logger.info("=" * 80)
-            logger.info(f"✅ Upload completado exitosamente")
-            logger.info(f"📁 Archivo final: {final_filename}")
-            logger.info(f"📊 Tamaño: {final_size / 1024 / 1024:.2f}MB")
-            logger.info("=" * 80)
-            sys.stdout.flush()
-            
-            return {
-                'success': True,
-                'filename': final_filename,
-                'size': final_size,
-                'size_human': self._human_readable_size(final_size),
-                'message': 'Backup subido exitosamente'
-            }
-            
-        except Exception as e:
-            logger.error(f"💥 Error en upload_backup: {str(e)}")
-            logger.exception("Stack trace:")
-            sys.stdout.flush()
-            return {'success': False, 'error': str(e)}
+                
+                members = index['names']
+                if not has_database_dump(members):
+                    logger.error(f"❌ {MISSING_DUMP_ERROR}")
+                    return {'success': False, 'error': MISSING_DUMP_ERROR}
+                
+                if not any('filestore' in m for m in members):
+                    logger.warning("⚠️ El backup no contiene filestore")
+                
+                logger.info("✅ Estructura válida")
+                
+                # Mover a directorio final (mismo filesystem: rename)
+                os.replace(source_path, final_filepath)
+                checksum = index['checksum_sha256']
+                logger.info(f"✅ Archivo movido a: {final_filepath}")
+        finally:
+            if os.path.exists(source_path):
+                os.remove(source_path)
+        
+        # Registrar en el catálogo
+        final_size = os.path.getsize(final_filepath)
+        write_backup_meta(final_filepath, {
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'size_bytes': final_size,
+            'checksum_sha256': checksum,
+            'source': 'upload'
+        })
+        if record:
+            self.catalog.record_file(instance_name, final_filename, source='upload')
+        
+        # Actualizar configuración de la instancia
+        config = self._load_instance_config(instance_name)
+        config['last_backup'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        config['last_backup_status'] = 'uploaded'
+        config['last_backup_size'] = final_size
+        config['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self._save_instance_config(instance_name, config)
+        
+        logger.info("=" * 80)
+        logger.info(f"✅ Upload completado exitosamente")
+        logger.info(f"📁 Archivo final: {final_filename}")
+        logger.info(f"📊 Tamaño: {final_size / 1024 / 1024:.2f}MB")
+        logger.info("=" * 80)
+        
+        return {
+            'success': True,
+            'filename': final_filename,
+            'size': final_size,
+            'size_human': self._human_readable_size(final_size),
+            'message': 'Backup subido exitosamente'
+        }
+    
+    def export_backup_stream(self, instance_name):
+        """
+        Exportación en vivo de una instancia: pg_dump + filestore como .zip en streaming.
+        
+        No crea ningún archivo en el servidor. Devuelve {'success', 'filename', 'stream'};
+        `stream` es el cuerpo de la respuesta HTTP y debe cerrarse (lo hace el servidor WSGI).
+        """
+        if instance_name not in self._get_all_production_instances():
+            return {'success': False, 'error': f'Instancia {instance_name} no encontrada'}
+        if not _export_slots.acquire(blocking=False):
+            return {'success': False, 'busy': True,
+                    'error': 'Ya hay una exportación en curso, intente de nuevo en unos minutos'}
+        
+        try:
+            dump_command = ['/usr/bin/sudo', '-n', '-u', 'postgres', 'pg_dump', instance_name]
+            filestore_path = os.path.join(Config.ODOO_FILESTORE_ROOT, instance_name)
+            stream = _ExportStream(instance_name, stream_backup_zip(dump_command, filestore_path))
+        except Exception:
+            _export_slots.release()
+            raise
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        logger.info(f"Exportación en vivo de {instance_name} iniciada")
+        return {'success': True, 'filename': f"{instance_name}_export_{timestamp}.zip", 'stream': stream}
@@ -0,0 +1,237 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+from datetime import datetime
+
+from config import Config
+from services.job_runner import enqueue_job, job_response
+
+logger = logging.getLogger(__name__)
+
+SESSION_FILE = 'session.json'
+DATA_FILE = 'data'
+CHUNKS_DIR = 'chunks'
+COMPLETED_MARKER = 'completed'
+
+UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+WRITE_BUFFER_SIZE = 1024 * 1024
+MIN_CHUNK_BYTES = 1024 * 1024
+BACKUP_TOOL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backup_tool.py')
+
+
+class ChunkedUploadManager:
+    """
+    Uploads de backups por partes, reanudables y en paralelo.
+
+    Cada upload es un directorio `<UPLOADS_PATH>/<upload_id>/` con:
+      session.json  instancia, nombre, tamaño y tamaño de parte
+      data          archivo final, preasignado (disperso) con el tamaño total
+      chunks/<n>    una marca por parte recibida con su SHA-256
+
+    Cada parte se escribe con pwrite en su offset, así que pueden llegar en
+    cualquier orden y en paralelo sin paso de ensamblado. Al completar, la
+    validación e importación (ZIP → TAR.GZ) corre como job `import_backup`.
+    """
+
+    def __init__(self, uploads_dir=None):
+        self.uploads_dir = uploads_dir or Config.UPLOADS_PATH
+
+    def _session_dir(self, upload_id):
+        return os.path.join(self.uploads_dir, upload_id)
+
+    def _load_session(self, upload_id):
+        if not upload_id or not UPLOAD_ID_RE.match(upload_id):
+            return None
+        try:
+            with open(os.path.join(self._session_dir(upload_id), SESSION_FILE), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _received_chunks(self, upload_id):
+        try:
+            return sorted(int(name) for name in os.listdir(os.path.join(self._session_dir(upload_id), CHUNKS_DIR))
+                          if name.isdigit())
+        except FileNotFoundError:
+            return []
+
+    def _chunk_length(self, session, index):
+        offset = index * session['chunk_size']
+        return min(session['chunk_size'], session['file_size'] - offset)
+
+    def cleanup_expired(self):
+        """Descarta los uploads sin actividad (sin partes nuevas) hace más de UPLOAD_SESSION_EXPIRE_HOURS"""
+        cutoff = time.time() - Config.UPLOAD_SESSION_EXPIRE_HOURS * 3600
+        removed = 0
+        try:
+            entries = os.listdir(self.uploads_dir)
+        except FileNotFoundError:
+            return 0
+        for upload_id in entries:
+            session_dir = self._session_dir(upload_id)
+            data_path = os.path.join(session_dir, DATA_FILE)
+            try:
+                last_activity = os.path.getmtime(data_path if os.path.exists(data_path) else session_dir)
+            except OSError:
+                continue
+            # Los ya completados los elimina el job de importación
+            if last_activity < cutoff and not os.path.exists(os.path.join(session_dir, COMPLETED_MARKER)):
+                shutil.rmtree(session_dir, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def init_upload(self, instance_name, file_name, file_size, chunk_size, user_id=None):
+        """Crea un upload y preasigna el archivo. Devuelve {'success', 'upload_id', ...}"""
+        instance_dir = os.path.join(Config.BACKUPS_PATH, 'instances', instance_name or '')
+        if not instance_name or os.path.basename(instance_name) != instance_name or not os.path.isdir(instance_dir):
+            return {'success': False, 'error': f'Instancia {instance_name} no encontrada'}
+        file_name = os.path.basename(file_name or '')
+        if not (file_name.endswith('.tar.gz') or file_name.endswith('.zip')):
+            return {'success': False, 'error': 'El archivo debe ser .tar.gz o .zip'}
+        if not isinstance(file_size, int) or file_size <= 0:
+            return {'success': False, 'error': 'Tamaño de archivo inválido'}
+        if not isinstance(chunk_size, int) or not MIN_CHUNK_BYTES <= chunk_size <= Config.UPLOAD_MAX_CHUNK_BYTES:
+            return {'success': False, 'error': f'El tamaño de parte debe estar entre {MIN_CHUNK_BYTES} y {Config.UPLOAD_MAX_CHUNK_BYTES} bytes'}
+
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        self.cleanup_expired()
+
+        # El archivo es disperso: comprobar que el disco alcanza para completarlo
+        free = shutil.disk_usage(self.uploads_dir).free
+        if free < file_size:
+            return {'success': False, 'error': 'No hay espacio suficiente en disco para el upload'}
+
+        upload_id = uuid.uuid4().hex
+        session_dir = self._session_dir(upload_id)
+        os.makedirs(os.path.join(session_dir, CHUNKS_DIR))
+
+        with open(os.path.join(session_dir, DATA_FILE), 'wb') as f:
+            f.truncate(file_size)
+
+        session = {
+            'upload_id': upload_id,
+            'instance_name': instance_name,
+            'file_name': file_name,
+            'file_size': file_size,
+            'chunk_size': chunk_size,
+            'total_chunks': -(-file_size // chunk_size),
+            'user_id': user_id,
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        with open(os.path.join(session_dir, SESSION_FILE), 'w') as f:
+            json.dump(session, f, indent=2)
+
+        logger.info(f"Upload {upload_id} iniciado: {file_name} ({file_size} bytes) para {instance_name}")
+        return {'success': True, **session}
+
+    def get_session(self, upload_id):
+        return self._load_session(upload_id)
+
+    def get_status(self, upload_id):
+        session = self._load_session(upload_id)
+        if not session:
+            return None
+        received = self._received_chunks(upload_id)
+        received_bytes = sum(self._chunk_length(session, index) for index in received)
+        return {
+            **session,
+            'received_chunks': received,
+            'received_bytes': received_bytes,
+            'complete': len(received) == session['total_chunks'],
+            'completed': os.path.exists(os.path.join(self._session_dir(upload_id), COMPLETED_MARKER))
+        }
+
+    def write_chunk(self, upload_id, index, stream, expected_sha256=None):
+        """Escribe una parte en su offset leyendo `stream` por bloques y verifica su SHA-256"""
+        session = self._load_session(upload_id)
+        if not session:
+            return {'success': False, 'error': 'Upload no encontrado'}
+        if not 0 <= index < session['total_chunks']:
+            return {'success': False, 'error': 'Número de parte inválido'}
+
+        session_dir = self._session_dir(upload_id)
+        if os.path.exists(os.path.join(session_dir, COMPLETED_MARKER)):
+            return {'success': False, 'error': 'El upload ya fue completado'}
+
+        # Una parte reenviada invalida la marca anterior hasta terminar de escribirse
+        marker = os.path.join(session_dir, CHUNKS_DIR, str(index))
+        try:
+            os.remove(marker)
+        except FileNotFoundError:
+            pass
+
+        offset = index * session['chunk_size']
+        expected_length = self._chunk_length(session, index)
+        sha256 = hashlib.sha256()
+        written = 0
+
+        fd = os.open(os.path.join(session_dir, DATA_FILE), os.O_WRONLY)
+        try:
+            while True:
+                buffer = stream.read(WRITE_BUFFER_SIZE)
+                if not buffer:
+                    break
+                if written + len(buffer) > expected_length:
+                    return {'success': False, 'error': f'La parte {index} excede {expected_length} bytes'}
+                sha256.update(buffer)
+                view = memoryview(buffer)
+                while view:
+                    count = os.pwrite(fd, view, offset + written)
+                    view = view[count:]
+                    written += count
+        finally:
+            os.close(fd)
+
+        if written != expected_length:
+            return {'success': False, 'error': f'La parte {index} llegó incompleta ({written}/{expected_length} bytes)'}
+
+        digest = sha256.hexdigest()
+        if expected_sha256 and expected_sha256.lower() != digest:
+            return {'success': False, 'error': f'Checksum de la parte {index} no coincide'}
+
+        # La marca se escribe al final y de forma atómica: solo cuenta si la parte está completa
+        with open(marker + '.tmp', 'w') as f:
+            f.write(digest)
+        os.replace(marker + '.tmp', marker)
+
+        return {'success': True, 'index': index, 'size': written, 'sha256': digest}
+
+    def complete_upload(self, upload_id, user_id=None):
+        """Verifica que estén todas las partes y encola la validación e importación del backup"""
+        status = self.get_status(upload_id)
+        if not status:
+            return {'success': False, 'error': 'Upload no encontrado'}
+        if not status['complete']:
+            missing = sorted(set(range(status['total_chunks'])) - set(status['received_chunks']))
+            return {'success': False, 'error': f'Faltan {len(missing)} partes', 'missing_chunks': missing[:100]}
+
+        session_dir = self._session_dir(upload_id)
+        try:
+            os.close(os.open(os.path.join(session_dir, COMPLETED_MARKER), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return {'success': False, 'error': 'El upload ya fue completado'}
+
+        command = [
+            sys.executable, BACKUP_TOOL, 'import',
+            status['instance_name'], os.path.join(session_dir, DATA_FILE), status['file_name'],
+            '--cleanup', session_dir
+        ]
+        result = enqueue_job('import_backup', status['instance_name'], command, user_id=user_id)
+        if not result['success']:
+            os.remove(os.path.join(session_dir, COMPLETED_MARKER))
+        return job_response(result, 'Upload completo, validando backup')
+
+    def cancel_upload(self, upload_id):
+        session = self._load_session(upload_id)
+        if not session:
+            return {'success': False, 'error': 'Upload no encontrado'}
+        if os.path.exists(os.path.join(self._session_dir(upload_id), COMPLETED_MARKER)):
+            return {'success': False, 'error': 'El upload ya fue completado'}
+        shutil.rmtree(self._session_dir(upload_id), ignore_errors=True)
+        return {'success': True}
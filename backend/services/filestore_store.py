@@ -0,0 +1,284 @@
+import os
+import re
+import json
+import shutil
+import sqlite3
+import hashlib
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Manifiesto del filestore que se guarda junto a cada backup
+MANIFEST_SUFFIX = '.filestore.json'
+MANIFEST_VERSION = 1
+
+COPY_CHUNK_BYTES = 1024 * 1024
+
+# Objetos nuevos que se registran y mueven al almacén por transacción
+CLAIM_BATCH_OBJECTS = 500
+
+_SHA1_REGEX = re.compile(r'^[0-9a-f]{40}$')
+
+
+def manifest_path_for(archive_path):
+    """Ruta del manifiesto de filestore de un backup"""
+    return archive_path + MANIFEST_SUFFIX
+
+
+def _copy_and_hash(src, dst):
+    """Copia src a dst (vía archivo temporal + rename) y devuelve (sha1, bytes)"""
+    digest = hashlib.sha1()
+    size = 0
+    tmp = f'{dst}.tmp-{os.getpid()}'
+    try:
+        with open(src, 'rb') as fin, open(tmp, 'wb') as fout:
+            while True:
+                chunk = fin.read(COPY_CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                fout.write(chunk)
+                size += len(chunk)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return digest.hexdigest(), size
+
+
+class FilestoreStore:
+    """
+    Almacén de adjuntos direccionado por contenido, compartido por los backups.
+
+    Odoo guarda cada adjunto en `<filestore>/<sha1[:2]>/<sha1>`, así que el
+    nombre del archivo ya es su clave: un backup solo lee y copia los
+    adjuntos que el almacén todavía no tiene, y deja junto al .tar.gz un
+    manifiesto (`<archivo>.filestore.json`) con la ruta y el hash de cada uno.
+
+    `refs.sqlite` cuenta cuántos manifiestos referencian cada objeto. Al
+    borrar un backup se descuentan sus referencias y se eliminan los objetos
+    que quedan sin ninguna.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or Config.BACKUP_STORE_PATH
+        self.objects_dir = os.path.join(self.root, 'objects')
+        self.db_path = os.path.join(self.root, 'refs.sqlite')
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    @contextmanager
+    def _connect(self):
+        # Sin transacción implícita: cada operación abre BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.db_path, timeout=300, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS objects ('
+                'sha1 TEXT PRIMARY KEY, size INTEGER NOT NULL, refs INTEGER NOT NULL DEFAULT 0)'
+            )
+            yield conn
+        finally:
+            conn.close()
+
+    def object_path(self, sha1):
+        return os.path.join(self.objects_dir, sha1[:2], sha1)
+
+    def _pin_existing(self, conn, candidates):
+        """
+        Suma una referencia a los objetos que ya están en el almacén y
+        devuelve cuáles se fijaron. Se hace antes de copiar nada para que una
+        recolección concurrente no borre un objeto que este backup va a usar.
+        """
+        pinned = set()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for sha1 in candidates:
+                row = conn.execute('SELECT refs FROM objects WHERE sha1 = ?', (sha1,)).fetchone()
+                if row and os.path.exists(self.object_path(sha1)):
+                    conn.execute('UPDATE objects SET refs = refs + 1 WHERE sha1 = ?', (sha1,))
+                    pinned.add(sha1)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return pinned
+
+    def _claim_objects(self, conn, staged, staging_dir):
+        """
+        Registra los objetos copiados en `staging_dir` (sha1 -> bytes) con una
+        referencia de este backup y los mueve al almacén en la misma
+        transacción. Si otro backup ya registró el mismo objeto se suma la
+        referencia y se descarta la copia. Devuelve los que eran nuevos.
+        """
+        created = {}
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for sha1, size in staged.items():
+                staging = os.path.join(staging_dir, sha1)
+                target = self.object_path(sha1)
+                if conn.execute('SELECT 1 FROM objects WHERE sha1 = ?', (sha1,)).fetchone():
+                    conn.execute('UPDATE objects SET refs = refs + 1 WHERE sha1 = ?', (sha1,))
+                    if os.path.exists(target):
+                        os.remove(staging)
+                        continue
+                    # Registrado pero sin archivo: se repone con esta copia
+                else:
+                    conn.execute('INSERT INTO objects (sha1, size, refs) VALUES (?, ?, 1)', (sha1, size))
+                    created[sha1] = size
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(staging, target)
+            conn.execute('COMMIT')
+        except Exception:
+            # Con el lock todavía tomado nadie más pudo registrar los nuevos
+            for sha1 in created:
+                try:
+                    os.remove(self.object_path(sha1))
+                except FileNotFoundError:
+                    pass
+            conn.execute('ROLLBACK')
+            raise
+        return created
+
+    def _unref(self, conn, hashes):
+        """Descuenta referencias y elimina los objetos que quedan en cero"""
+        deleted = 0
+        freed = 0
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('UPDATE objects SET refs = refs - 1 WHERE sha1 = ?', ((h,) for h in hashes))
+            orphans = conn.execute('SELECT sha1, size FROM objects WHERE refs <= 0').fetchall()
+            for sha1, size in orphans:
+                try:
+                    os.remove(self.object_path(sha1))
+                    freed += size
+                except FileNotFoundError:
+                    pass
+                deleted += 1
+            conn.execute('DELETE FROM objects WHERE refs <= 0')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return deleted, freed
+
+    def store_filestore(self, filestore_path, manifest_path):
+        """
+        Agrega un filestore al almacén y escribe el manifiesto del backup.
+
+        Los adjuntos con nombre de hash que el almacén ya tiene no se leen;
+        los nuevos se copian calculando el SHA-1 (si no coincide con el
+        nombre, se usa el hash real) a un directorio propio del backup y se
+        registran por lotes. Cada objeto entra al almacén ya con la referencia
+        de este backup: si el backup falla, solo se descuentan sus referencias
+        y un objeto que otro backup registró a la vez no se borra.
+        """
+        entries = []
+        for root, _dirs, files in os.walk(filestore_path):
+            for name in files:
+                path = os.path.join(root, name)
+                rel_path = os.path.relpath(path, filestore_path)
+                entries.append((rel_path, path, name if _SHA1_REGEX.match(name) else None))
+
+        staging_dir = os.path.join(self.objects_dir, f'.incoming-{os.getpid()}')
+        with self._connect() as conn:
+            pinned = self._pin_existing(conn, {key for _rel, _path, key in entries if key})
+            new_objects = {}
+            staged = {}
+            files = []
+            total_bytes = 0
+            try:
+                os.makedirs(staging_dir, exist_ok=True)
+                for rel_path, path, key in entries:
+                    if key in pinned:
+                        size = os.path.getsize(path)
+                    else:
+                        incoming = os.path.join(staging_dir, 'incoming')
+                        key_real, size = _copy_and_hash(path, incoming)
+                        if key and key_real != key:
+                            logger.warning(f"Adjunto con hash distinto al nombre: {rel_path} ({key_real})")
+                        key = key_real
+                        if key in pinned or key in staged:
+                            os.remove(incoming)
+                        else:
+                            os.replace(incoming, os.path.join(staging_dir, key))
+                            staged[key] = size
+                            if len(staged) >= CLAIM_BATCH_OBJECTS:
+                                new_objects.update(self._claim_objects(conn, staged, staging_dir))
+                                pinned.update(staged)
+                                staged = {}
+                    files.append([rel_path, key, size])
+                    total_bytes += size
+
+                new_objects.update(self._claim_objects(conn, staged, staging_dir))
+                pinned.update(staged)
+            except Exception:
+                # Solo lo propio: las referencias de este backup y su directorio de copia
+                self._unref(conn, pinned)
+                raise
+            finally:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+            manifest = {
+                'version': MANIFEST_VERSION,
+                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'source': filestore_path,
+                'file_count': len(files),
+                'total_bytes': total_bytes,
+                'new_objects': len(new_objects),
+                'new_bytes': sum(new_objects.values()),
+                'files': files,
+            }
+            tmp = f'{manifest_path}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(tmp, manifest_path)
+
+        logger.info(
+            f"Filestore almacenado: {len(files)} archivos, {len(new_objects)} nuevos "
+            f"({manifest['new_bytes']} bytes)"
+        )
+        return {key: value for key, value in manifest.items() if key != 'files'}
+
+    def load_manifest(self, manifest_path):
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+
+    def release(self, manifest_path):
+        """Libera las referencias de un backup eliminado y borra su manifiesto"""
+        manifest = self.load_manifest(manifest_path)
+        hashes = {sha1 for _rel, sha1, _size in manifest.get('files', [])}
+        with self._connect() as conn:
+            deleted, freed = self._unref(conn, hashes)
+        os.remove(manifest_path)
+        return {'released': len(hashes), 'deleted_objects': deleted, 'freed_bytes': freed}
+
+    def iter_files(self, manifest_path):
+        """(ruta_relativa, ruta_del_objeto) de cada adjunto de un manifiesto"""
+        manifest = self.load_manifest(manifest_path)
+        return [(rel_path, self.object_path(sha1)) for rel_path, sha1, _size in manifest.get('files', [])]
+
+    def materialize(self, manifest_path, destination):
+        """Reconstruye en `destination` el filestore descrito por un manifiesto"""
+        manifest = self.load_manifest(manifest_path)
+        missing = []
+        for rel_path, sha1, _size in manifest.get('files', []):
+            target = os.path.join(destination, rel_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                shutil.copyfile(self.object_path(sha1), target)
+            except FileNotFoundError:
+                missing.append(rel_path)
+        if missing:
+            logger.error(f"Faltan {len(missing)} objetos del almacén para {manifest_path}")
+        return {'file_count': manifest.get('file_count', 0), 'missing': missing}
+
+    def stats(self):
+        with self._connect() as conn:
+            objects, total_bytes, refs = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refs), 0) FROM objects'
+            ).fetchone()
+        return {'objects': objects, 'total_bytes': total_bytes, 'references': refs}
@@ -1,13 +1,24 @@
 import os
 import subprocess
 import re
-import sys
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import current_app
 
+from services.instance_registry import get_instance_registry
+from services.service_status import get_service_status_collector
+from services.nginx_log_demux import get_nginx_log_demux
+from services.journal_reader import read_journal, format_journal_lines
+from services.job_runner import enqueue_job, job_response
+from services.backup_catalog import BackupCatalog
+from config import Config
+
 logger = logging.getLogger(__name__)
 
+# Línea del update-db.sh generado por versiones anteriores (dump completo a /tmp)
+LEGACY_UPDATE_DB_DUMP = 'pg_dump "$PROD_DB" > "/tmp/${DEV_DB}_dump.sql"'
+
+
 class InstanceManager:
     """Gestor de instancias Odoo"""
     
@@ -27,127 +38,76 @@ class InstanceManager:
             self.puertos_file = current_app.config['PUERTOS_FILE']
             self.dev_instances_file = current_app.config['DEV_INSTANCES_FILE']
     
-    def list_instances(self):
-        """Lista todas las instancias (producción y desarrollo)"""
+    def _registry(self):
+        """Registro compartido de instancias para las rutas configuradas"""
         self._init_paths()
-        instances = []
-        
-        # Instancias de producción
-        if os.path.exists(self.prod_root):
-            for name in os.listdir(self.prod_root):
-                path = os.path.join(self.prod_root, name)
-                if os.path.isdir(path):
-                    info = self._get_instance_info(name, path, 'production')
-                    instances.append(info)
-        
-        # Instancias de desarrollo
-        if os.path.exists(self.dev_root):
-            for name in os.listdir(self.dev_root):
-                path = os.path.join(self.dev_root, name)
-                if os.path.isdir(path):
-                    info = self._get_instance_info(name, path, 'development')
-                    instances.append(info)
+        return get_instance_registry(self.prod_root, self.dev_root)
+
+    def _enqueue(self, job_type, instance_name, command, message, cwd=None, stdin_data=None, user_id=None):
+        """Encola la operación en el supervisor de jobs y arma la respuesta estándar"""
+        result = enqueue_job(job_type, instance_name, command, cwd=cwd, stdin_data=stdin_data, user_id=user_id)
+        return job_response(result, message)
+    
+    def _clone_backup_for(self, prod_instance):
+        """
+        Backup reciente de producción (catálogo) para clonar la base sin volcarla.
         
-        return instances
+        Solo sirven los dumps en formato directorio (pg_restore -j); devuelve la
+        ruta o '' si no hay uno dentro de CLONE_BACKUP_MAX_AGE_HOURS.
+        """
+        max_age = Config.CLONE_BACKUP_MAX_AGE_HOURS
+        if not prod_instance or max_age <= 0:
+            return ''
+        try:
+            catalog = BackupCatalog()
+            record = catalog.latest_backup(
+                prod_instance, dump_format='directory', since=datetime.now() - timedelta(hours=max_age)
+            )
+        except Exception as e:
+            logger.warning(f"No se pudo consultar el catálogo de backups de {prod_instance}: {e}")
+            return ''
+        return catalog.backup_path(record) if record else ''
+    
+    def list_instances(self):
+        """Lista todas las instancias (producción y desarrollo)"""
+        return self._attach_statuses(self._registry().list_instances())
     
     def list_production_instances(self):
         """Lista solo las instancias de producción válidas para clonar"""
-        self._init_paths()
-        instances = []
-        
-        if os.path.exists(self.prod_root):
-            for name in os.listdir(self.prod_root):
-                path = os.path.join(self.prod_root, name)
-                # Filtrar solo directorios válidos con odoo.conf
-                if os.path.isdir(path) and os.path.exists(os.path.join(path, 'odoo.conf')):
-                    # Excluir directorios especiales
-                    if name not in ['temp', 'backups']:
-                        info = self._get_instance_info(name, path, 'production')
-                        instances.append(info)
-        
-        return instances
+        instances = self._registry().list_instances(env_type='production', require_conf=True)
+        # Excluir directorios especiales
+        instances = [info for info in instances if info['name'] not in ['temp', 'backups']]
+        return self._attach_statuses(instances)
+
+    def get_instance(self, instance_name):
+        """Obtiene una instancia por nombre (con estado) sin listar todas"""
+        info = self._registry().get_instance(instance_name)
+        if not info:
+            return None
+        return self._attach_statuses([info])[0]
     
-    def _get_instance_info(self, name, path, env_type):
-        """Obtiene información de una instancia"""
-        info = {
-            'name': name,
-            'type': env_type,
-            'path': path,
-            'status': 'unknown',
-            'port': None,
-            'domain': None,
-            'database': None,
-            'service': None
-        }
-        
-        # Leer archivo info-instancia.txt si existe
-        info_file = os.path.join(path, 'info-instancia.txt')
-        if os.path.exists(info_file):
-            try:
-                with open(info_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    
-                    # Extraer información con regex (soporta formato con y sin emojis)
-                    port_match = re.search(r'Puerto(?:\s+HTTP)?:\s*(\d+)', content)
-                    if port_match:
-                        info['port'] = int(port_match.group(1))
-                    
-                    domain_match = re.search(r'Dominio:\s*https?://([^\s]+)', content)
-                    if domain_match:
-                        info['domain'] = domain_match.group(1)
-                    
-                    db_match = re.search(r'Base de datos:\s*([^\s]+)', content)
-                    if db_match:
-                        info['database'] = db_match.group(1)
-                    
-                    # Buscar servicio con varios formatos posibles
-                    service_match = re.search(r'(?:Servicio(?:\s+systemd)?|🧩\s+Servicio):\s*([^\s]+)', content)
-                    if service_match:
-                        info['service'] = service_match.group(1)
-            except Exception as e:
-                print(f"Error leyendo info de {name}: {e}")
-        
-        # Verificar estado del servicio
-        if info['service']:
-            try:
-                info['status'] = self._get_service_status(info['service'])
-                print(f"Service {info['service']} status: {info['status']}", file=sys.stderr, flush=True)
-            except Exception as e:
-                print(f"Error getting status for {info['service']}: {e}", file=sys.stderr, flush=True)
-                info['status'] = 'unknown'
+    def _attach_statuses(self, instances):
+        """Agrega el estado systemd a cada instancia con una sola consulta batch"""
+        services = [info['service'] for info in instances if info['service']]
+        try:
+            statuses = get_service_status_collector().get_statuses(services) if services else {}
+        except Exception as e:
+            logger.error(f"Error getting service statuses: {e}")
+            statuses = {}
+
+        for info in instances:
+            if info['service']:
+                info['status'] = statuses.get(info['service'], 'unknown')
         
-        return info
+        return instances
     
     def _get_service_status(self, service_name):
         """Obtiene el estado de un servicio systemd"""
-        try:
-            result = subprocess.run(
-                ['/usr/bin/systemctl', 'is-active', service_name],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            status = result.stdout.strip()
-            logger.info(f"Service check: {service_name} -> stdout='{status}', returncode={result.returncode}")
-            
-            # Retornar el estado tal como lo devuelve systemctl
-            if status == 'active':
-                return 'active'
-            elif status == 'inactive':
-                return 'inactive'
-            elif status == 'failed':
-                return 'inactive'
-            else:
-                logger.warning(f"Unknown status '{status}' for service {service_name}")
-                return 'unknown'
-        except Exception as e:
-            logger.error(f"Error checking service status for {service_name}: {e}")
-            return 'unknown'
+        return get_service_status_collector().get_status(service_name)
     
     def get_instance_status(self, instance_name):
         """Obtiene el estado detallado de una instancia"""
-        instances = self.list_instances()
-        instance = next((i for i in instances if i['name'] == instance_name), None)
+        instance = self.get_instance(instance_name)
         
         if not instance:
             return None
@@ -220,6 +180,8 @@ export PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin
 PROD_DB="__PROD_DB__"
 DEV_DB="__DEV_DB__"
 INSTANCE_NAME="__INSTANCE_NAME__"
+# Backup reciente de producción para clonar sin volcar la base (opcional, lo pasa el panel)
+CLONE_BACKUP_FILE="${1:-}"
 
 echo "🔄 Actualizando base de datos de desarrollo desde producción..."
 echo "   Producción: $PROD_DB"
@@ -238,17 +200,12 @@ fi
 echo "⏹️  Deteniendo servicio Odoo..."
 sudo systemctl stop "odoo19e-$INSTANCE_NAME"
 
-echo "🗄️  Eliminando BD de desarrollo actual..."
-sudo -u postgres psql -c "SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = '$DEV_DB';" >/dev/null 2>&1
-sudo -u postgres dropdb "$DEV_DB" 2>/dev/null
-
-echo "📦 Creando dump de producción..."
-sudo -u postgres pg_dump "$PROD_DB" > "/tmp/${DEV_DB}_dump.sql"
-
-echo "🔄 Restaurando en desarrollo..."
-sudo -u postgres createdb "$DEV_DB" -O "mtg" --encoding='UTF8'
-sudo -u postgres psql -d "$DEV_DB" < "/tmp/${DEV_DB}_dump.sql"
-rm -f "/tmp/${DEV_DB}_dump.sql"
+echo "🗄️  Clonando BD de producción (reemplaza la de desarrollo)..."
+if ! "__SCRIPTS_PATH__/odoo/clone-database.sh" "$PROD_DB" "$DEV_DB" "mtg" "$CLONE_BACKUP_FILE"; then
+  echo "❌ Error al clonar la base de datos"
+  sudo systemctl start "odoo19e-$INSTANCE_NAME"
+  exit 1
+fi
 
 echo "🔐 Configurando permisos..."
 sudo -u postgres psql -d "$DEV_DB" -c "GRANT ALL ON SCHEMA public TO mtg;" > /dev/null
@@ -475,6 +432,7 @@ echo "✅ Assets regenerados correctamente"
         git_branch: str = '',
         system_username: str = '',
         system_instance_accesses=None,
+        user_id=None,
     ):
         """
         Crea una nueva instancia de desarrollo clonando desde producción
@@ -515,33 +473,29 @@ echo "✅ Assets regenerados correctamente"
             system_access_arg = ','.join(system_instance_accesses or [])
             script_args.append(system_access_arg)
             
+            # Backup reciente de producción como origen del clonado (octavo argumento, opcional)
+            script_args.append(self._clone_backup_for(source_instance))
+            
             # El nombre de la instancia completa incluye el prefijo "dev-"
             instance_name = f'dev-{name}'
-            log_file_path = f'/tmp/odoo-create-{instance_name}.log'
             
-            # Ejecutar script en background desacoplado del proceso padre
-            with open(log_file_path, 'w') as log_file:
-                process = subprocess.Popen(
-                    script_args,
-                    stdout=log_file,
-                    stderr=subprocess.STDOUT,
-                    start_new_session=True,
-                    text=True,
-                    bufsize=1
-                )
-            logger.info(f"Process started for dev instance {instance_name} from source {source_instance or 'default'} (neutralize={neutralize}, git_branch={git_branch or 'default'})")
-            
-            return {
-                'success': True,
-                'message': f'Creación de instancia {instance_name} iniciada. Ver logs: {log_file_path}',
-                'log_file': log_file_path,
-                'instance_name': instance_name,  # Devolver el nombre completo de la instancia
-                'git_branch': git_branch  # Devolver la rama Git configurada
-            }
+            # El clonado corre como job (cola con prioridad y límite de concurrencia)
+            result = self._enqueue(
+                'create_dev',
+                instance_name,
+                script_args,
+                f'Creación de instancia {instance_name} encolada',
+                user_id=user_id,
+            )
+            if result['success']:
+                logger.info(f"Job {result['job_id']} queued for dev instance {instance_name} from source {source_instance or 'default'} (neutralize={neutralize}, git_branch={git_branch or 'default'})")
+                result['instance_name'] = instance_name  # Devolver el nombre completo de la instancia
+                result['git_branch'] = git_branch  # Devolver la rama Git configurada
+            return result
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def create_prod_instance(self, name, version='19', edition='enterprise', ssl_method='letsencrypt'):
+    def create_prod_instance(self, name, version='19', edition='enterprise', ssl_method='letsencrypt', user_id=None):
         """Crea una nueva instancia de producción con subdominio obligatorio
         
         Args:
@@ -587,47 +541,31 @@ echo "✅ Assets regenerados correctamente"
         
         try:
             instance_name = f'prod-{name.lower()}'
-            pid_file = f"/tmp/{instance_name}.pid"
-            status_file = f"/tmp/{instance_name}.status"
-            log_file_path = f'/tmp/odoo-create-{instance_name}.log'
             
             # Mapear método SSL a número (1=letsencrypt, 2=cloudflare, 3=http)
             ssl_map = {'letsencrypt': '1', 'cloudflare': '2', 'http': '3'}
             ssl_arg = ssl_map.get(ssl_method, '1')
 
-            # Ejecutar script en background desacoplado del proceso padre
             # Argumentos: nombre, version, edition, ssl_method
-            log_fd = os.open(log_file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
-            process = subprocess.Popen(
+            result = self._enqueue(
+                'create_prod',
+                instance_name,
                 ['/bin/bash', script_path, name, version, edition, ssl_arg],
-                stdout=log_fd,
-                stderr=subprocess.STDOUT,
-                start_new_session=True,
-                text=True,
-                bufsize=1
+                f'Creación de instancia de producción {instance_name} encolada. Dominio: {name}.{domain_root} - Odoo {version} {edition}',
+                user_id=user_id,
             )
-            os.close(log_fd)
-
-            # Guardar PID y estado inicial
-            with open(pid_file, 'w') as f:
-                f.write(str(process.pid))
-
-            with open(status_file, 'w') as f:
-                f.write("running")
+            if not result['success']:
+                return result
             
-            logger.info(f"Production instance creation started: {instance_name} (Odoo {version} {edition})")
+            logger.info(f"Production instance creation queued: {instance_name} (Odoo {version} {edition}, job {result['job_id']})")
             
-            return {
-                'success': True,
-                'message': f'Creación de instancia de producción {instance_name} iniciada. Dominio: {name}.{domain_root} - Odoo {version} {edition}',
-                'log_file': log_file_path,
+            result.update({
                 'instance_name': instance_name,
                 'domain': f'{name}.{domain_root}',
                 'version': version,
-                'edition': edition,
-                'pid': process.pid,
-                'status_file': status_file
-            }
+                'edition': edition
+            })
+            return result
         except Exception as e:
             logger.error(f"Error creating production instance: {e}")
             return {'success': False, 'error': str(e)}
@@ -715,12 +653,18 @@ echo "✅ Assets regenerados correctamente"
             logger.error(f"Error deleting production instance: {e}")
             return {'success': False, 'error': str(e)}
     
-    def update_instance_db(self, instance_name, neutralize=True):
+    def update_instance_db(self, instance_name, neutralize=True, user_id=None):
         """Actualiza la base de datos de una instancia de desarrollo"""
         self._init_paths()
         instance_path = os.path.join(self.dev_root, instance_name)
         script_path = os.path.join(instance_path, 'update-db.sh')
         
+        # Los update-db.sh generados antes de clone-database.sh volcaban a /tmp: regenerarlos
+        if os.path.exists(script_path):
+            with open(script_path, 'r', encoding='utf-8', errors='replace') as f:
+                if LEGACY_UPDATE_DB_DUMP in f.read():
+                    os.remove(script_path)
+        
         if not os.path.exists(script_path):
             ok, details = self._ensure_dev_action_scripts(instance_name, instance_path)
             if not ok or not os.path.exists(script_path):
@@ -730,31 +674,24 @@ echo "✅ Assets regenerados correctamente"
         try:
             # Responder automáticamente: s para continuar, s/n para neutralizar
             neutralize_answer = 's' if neutralize else 'n'
-            with open(f'/tmp/odoo-update-db-{instance_name}.log', 'w') as log_file:
-                process = subprocess.Popen(
-                    ['/bin/bash', script_path],
-                    stdin=subprocess.PIPE,
-                    stdout=log_file,
-                    stderr=subprocess.STDOUT,
-                    start_new_session=True,
-                    cwd=instance_path,
-                    text=True
-                )
-                # Enviar confirmación para continuar y para neutralizar
-                process.stdin.write(f's\n{neutralize_answer}\n')
-                process.stdin.close()
-            
             neutralize_msg = " (con neutralización)" if neutralize else " (sin neutralización)"
-            return {
-                'success': True,
-                'message': f'Actualización de BD iniciada{neutralize_msg}. Ver logs: /tmp/odoo-update-db-{instance_name}.log',
-                'log_file': f'/tmp/odoo-update-db-{instance_name}.log',
-                'neutralize': neutralize
-            }
+            context = self._infer_dev_context(instance_name, instance_path)
+            clone_backup = self._clone_backup_for(context['prod_db']) if context else ''
+            result = self._enqueue(
+                'update_db',
+                instance_name,
+                ['/bin/bash', script_path, clone_backup],
+                f'Actualización de BD encolada{neutralize_msg}',
+                cwd=instance_path,
+                stdin_data=f's\n{neutralize_answer}\n',
+                user_id=user_id,
+            )
+            result['neutralize'] = neutralize
+            return result
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def update_instance_files(self, instance_name):
+    def update_instance_files(self, instance_name, user_id=None):
         """Actualiza los archivos de una instancia de desarrollo"""
         self._init_paths()
         instance_path = os.path.join(self.dev_root, instance_name)
@@ -767,33 +704,22 @@ echo "✅ Assets regenerados correctamente"
             logger.info(f'Scripts regenerados para {instance_name}: {details}')
         
         try:
-            # Ejecutar script en background con log
-            with open(f'/tmp/odoo-update-files-{instance_name}.log', 'w') as log_file:
-                process = subprocess.Popen(
-                    ['/bin/bash', script_path],
-                    stdin=subprocess.PIPE,
-                    stdout=log_file,
-                    stderr=subprocess.STDOUT,
-                    start_new_session=True,
-                    cwd=instance_path,
-                    text=True
-                )
-                # Enviar confirmación
-                process.stdin.write('s\n')
-                process.stdin.close()
-            
-            return {
-                'success': True,
-                'message': f'Actualización de archivos iniciada. Ver logs: /tmp/odoo-update-files-{instance_name}.log',
-                'log_file': f'/tmp/odoo-update-files-{instance_name}.log'
-            }
+            # Confirmación del script por stdin
+            return self._enqueue(
+                'update_files',
+                instance_name,
+                ['/bin/bash', script_path],
+                'Actualización de archivos encolada',
+                cwd=instance_path,
+                stdin_data='s\n',
+                user_id=user_id,
+            )
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
     def get_instance_logs(self, instance_name, lines=100, log_type='systemd'):
         """Obtiene los logs de una instancia según el tipo especificado"""
-        instances = self.list_instances()
-        instance = next((i for i in instances if i['name'] == instance_name), None)
+        instance = self.get_instance(instance_name)
         
         if not instance:
             return {'success': False, 'error': 'Instancia no encontrada'}
@@ -804,15 +730,10 @@ echo "✅ Assets regenerados correctamente"
                 if not instance['service']:
                     return {'success': False, 'error': 'Servicio no encontrado'}
                 
-                result = subprocess.run(
-                    ['/usr/bin/journalctl', '-u', instance['service'], '-n', str(lines), '--no-pager'],
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
+                result = read_journal(instance['service'], lines=lines)
                 return {
                     'success': True,
-                    'logs': result.stdout,
+                    'logs': format_journal_lines(result['lines']),
                     'lines': lines,
                     'type': 'systemd'
                 }
@@ -840,58 +761,26 @@ echo "✅ Assets regenerados correctamente"
                     'type': 'odoo'
                 }
             
-            elif log_type == 'nginx-access':
-                # Logs de acceso de Nginx filtrados por dominio
+            elif log_type in ('nginx-access', 'nginx-error'):
+                # Logs de Nginx del dominio, desde los buffers por dominio (sin recorrer el log completo)
                 if not instance['domain']:
                     return {'success': False, 'error': 'Dominio no encontrado'}
                 
-                result = subprocess.run(
-                    f"/usr/bin/grep '{instance['domain']}' /var/log/nginx/access.log | /usr/bin/tail -n {lines}",
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
+                kind = log_type.split('-', 1)[1]
+                domain_lines = get_nginx_log_demux().get_lines(kind, instance['domain'], lines)
                 
-                if result.returncode == 0 and result.stdout:
-                    logs_text = result.stdout
-                elif result.returncode == 1:  # grep no encontró coincidencias
+                if domain_lines:
+                    logs_text = '\n'.join(domain_lines) + '\n'
+                elif kind == 'access':
                     logs_text = f'No hay logs de acceso para el dominio {instance["domain"]}'
                 else:
-                    logs_text = f'Error al leer logs: {result.stderr}'
-                
-                return {
-                    'success': True,
-                    'logs': logs_text,
-                    'lines': lines,
-                    'type': 'nginx-access'
-                }
-            
-            elif log_type == 'nginx-error':
-                # Logs de error de Nginx filtrados por dominio
-                if not instance['domain']:
-                    return {'success': False, 'error': 'Dominio no encontrado'}
-                
-                result = subprocess.run(
-                    f"/usr/bin/grep '{instance['domain']}' /var/log/nginx/error.log | /usr/bin/tail -n {lines}",
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
-                
-                if result.returncode == 0 and result.stdout:
-                    logs_text = result.stdout
-                elif result.returncode == 1:  # grep no encontró coincidencias
                     logs_text = f'No hay logs de error para el dominio {instance["domain"]}'
-                else:
-                    logs_text = f'Error al leer logs: {result.stderr}'
                 
                 return {
                     'success': True,
                     'logs': logs_text,
                     'lines': lines,
-                    'type': 'nginx-error'
+                    'type': log_type
                 }
             
             else:
@@ -902,8 +791,7 @@ echo "✅ Assets regenerados correctamente"
     
     def restart_instance(self, instance_name):
         """Reinicia una instancia"""
-        instances = self.list_instances()
-        instance = next((i for i in instances if i['name'] == instance_name), None)
+        instance = self.get_instance(instance_name)
         
         if not instance or not instance['service']:
             return {'success': False, 'error': 'Instancia o servicio no encontrado'}
@@ -914,11 +802,12 @@ echo "✅ Assets regenerados correctamente"
                 check=True,
                 timeout=30
             )
+            get_service_status_collector().invalidate()
             return {'success': True, 'message': f'Instancia {instance_name} reiniciada'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def sync_filestore(self, instance_name):
+    def sync_filestore(self, instance_name, user_id=None):
         """Sincroniza el filestore de una instancia de desarrollo desde producción"""
         self._init_paths()
         instance_path = os.path.join(self.dev_root, instance_name)
@@ -931,30 +820,20 @@ echo "✅ Assets regenerados correctamente"
             logger.info(f'Scripts regenerados para {instance_name}: {details}')
         
         try:
-            # Ejecutar script en background con log
-            with open(f'/tmp/odoo-sync-filestore-{instance_name}.log', 'w') as log_file:
-                process = subprocess.Popen(
-                    ['/bin/bash', script_path],
-                    stdin=subprocess.PIPE,
-                    stdout=log_file,
-                    stderr=subprocess.STDOUT,
-                    start_new_session=True,
-                    cwd=instance_path,
-                    text=True
-                )
-                # Enviar confirmación
-                process.stdin.write('s\n')
-                process.stdin.close()
-            
-            return {
-                'success': True,
-                'message': f'Sincronización de filestore iniciada. Ver logs: /tmp/odoo-sync-filestore-{instance_name}.log',
-                'log_file': f'/tmp/odoo-sync-filestore-{instance_name}.log'
-            }
+            # Confirmación del script por stdin
+            return self._enqueue(
+                'sync_filestore',
+                instance_name,
+                ['/bin/bash', script_path],
+                'Sincronización de filestore encolada',
+                cwd=instance_path,
+                stdin_data='s\n',
+                user_id=user_id,
+            )
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def regenerate_assets(self, instance_name):
+    def regenerate_assets(self, instance_name, user_id=None):
         """Regenera los assets de una instancia de desarrollo"""
         self._init_paths()
         instance_path = os.path.join(self.dev_root, instance_name)
@@ -967,25 +846,15 @@ echo "✅ Assets regenerados correctamente"
             logger.info(f'Scripts regenerados para {instance_name}: {details}')
         
         try:
-            # Ejecutar script en background con log
-            with open(f'/tmp/odoo-regenerate-assets-{instance_name}.log', 'w') as log_file:
-                process = subprocess.Popen(
-                    ['/bin/bash', script_path],
-                    stdin=subprocess.PIPE,
-                    stdout=log_file,
-                    stderr=subprocess.STDOUT,
-                    start_new_session=True,
-                    cwd=instance_path,
-                    text=True
-                )
-                # Enviar confirmación
-                process.stdin.write('s\n')
-                process.stdin.close()
-            
-            return {
-                'success': True,
-                'message': f'Regeneración de assets iniciada. Ver logs: /tmp/odoo-regenerate-assets-{instance_name}.log',
-                'log_file': f'/tmp/odoo-regenerate-assets-{instance_name}.log'
-            }
+            # Confirmación del script por stdin
+            return self._enqueue(
+                'regenerate_assets',
+                instance_name,
+                ['/bin/bash', script_path],
+                'Regeneración de assets encolada',
+                cwd=instance_path,
+                stdin_data='s\n',
+                user_id=user_id,
+            )
         except Exception as e:
             return {'success': False, 'error': str(e)}
@@ -0,0 +1,251 @@
+import os
+import time
+import logging
+import threading
+import subprocess
+
+import psutil
+from sqlalchemy import text
+
+from config import Config
+from models import db
+from services.instance_registry import get_instance_registry
+from services.service_status import get_service_status_collector
+from services.traffic_analytics import get_traffic_analytics
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de bases y filestore: costosos y de variación lenta, se recalculan cada tanto
+SLOW_METRICS_TTL_SECONDS = 300
+
+# Medidor de filestores: espera entre revisiones cuando no hay nada vencido,
+# tiempo máximo de cada `du` y cuánto sigue vivo sin que collect() lo consulte
+FILESTORE_POLL_SECONDS = 10
+FILESTORE_DU_TIMEOUT_SECONDS = 120
+FILESTORE_IDLE_SECONDS = 600
+
+
+def _read_file(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _read_key_values(path):
+    """Parsea archivos de cgroup con formato `clave valor` por línea"""
+    content = _read_file(path)
+    values = {}
+    for line in (content or '').splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].isdigit():
+            values[parts[0]] = int(parts[1])
+    return values
+
+
+class InstanceMetricsCollector:
+    """
+    Recolector de consumo por instancia Odoo.
+
+    - CPU, memoria y procesos salen del cgroup v2 de la unidad systemd
+      (`<CGROUP_SYSTEM_SLICE>/<servicio>.service`): cpu.stat, memory.stat y
+      cgroup.procs. La CPU se expresa como % de la capacidad total del host,
+      comparable con el cpu_percent de SystemMonitor.
+    - Conexiones: sockets TCP establecidos de los procesos del cgroup.
+    - Tamaño de base: una sola consulta pg_database_size() para todas las bases.
+    - Filestore: `du` del directorio de la base, en un hilo aparte que mide
+      una base por vez (la de medición más vieja); collect() solo lee el
+      último valor y no espera a ningún `du`.
+    - Requests/min: analítica del access.log de nginx por dominio.
+    """
+
+    def __init__(self, cgroup_root=None, filestore_root=None):
+        self.cgroup_root = cgroup_root or Config.CGROUP_SYSTEM_SLICE
+        self.filestore_root = filestore_root or Config.ODOO_FILESTORE_ROOT
+        self._cpu_usage = {}
+        self._db_sizes = {}
+        self._db_sizes_at = None
+        self._filestore_sizes = {}
+        self._filestore_wanted = ((), None)
+        self._filestore_lock = threading.Lock()
+        self._filestore_thread = None
+        self._filestore_thread_pid = None
+
+    def _cgroup_path(self, service):
+        return os.path.join(self.cgroup_root, f'{service}.service')
+
+    def _cgroup_pids(self, path):
+        content = _read_file(os.path.join(path, 'cgroup.procs'))
+        return [int(pid) for pid in (content or '').split() if pid.isdigit()]
+
+    def _cpu_percent(self, service, path, now):
+        usage_usec = _read_key_values(os.path.join(path, 'cpu.stat')).get('usage_usec')
+        if usage_usec is None:
+            return None
+
+        previous = self._cpu_usage.get(service)
+        self._cpu_usage[service] = (usage_usec, now)
+        if not previous or usage_usec < previous[0]:
+            # Primera lectura o servicio reiniciado: todavía no hay delta
+            return None
+
+        elapsed_usec = (now - previous[1]) * 1_000_000
+        if elapsed_usec <= 0:
+            return None
+        capacity = elapsed_usec * (psutil.cpu_count() or 1)
+        return round((usage_usec - previous[0]) / capacity * 100, 2)
+
+    def _memory_mb(self, path):
+        # `anon` de memory.stat es lo más parecido al RSS (sin page cache)
+        anon = _read_key_values(os.path.join(path, 'memory.stat')).get('anon')
+        if anon is None:
+            current = _read_file(os.path.join(path, 'memory.current'))
+            anon = int(current) if current and current.strip().isdigit() else None
+        return round(anon / (1024 ** 2), 2) if anon is not None else None
+
+    def _connections_by_pid(self):
+        counts = {}
+        try:
+            for conn in psutil.net_connections(kind='tcp'):
+                if conn.pid and conn.status == psutil.CONN_ESTABLISHED:
+                    counts[conn.pid] = counts.get(conn.pid, 0) + 1
+        except (psutil.AccessDenied, OSError) as e:
+            logger.warning(f"No se pudieron listar conexiones: {e}")
+            return None
+        return counts
+
+    def _refresh_db_sizes(self, now):
+        if self._db_sizes_at and now - self._db_sizes_at < SLOW_METRICS_TTL_SECONDS:
+            return
+        self._db_sizes_at = now
+        # pg_database_size() falla sin CONNECT sobre la base: una sola base sin
+        # permiso no debe dejar sin tamaño al resto (CASE garantiza no evaluarla)
+        try:
+            rows = db.session.execute(text(
+                "SELECT datname, CASE WHEN has_database_privilege(datname, 'CONNECT') "
+                "OR pg_has_role('pg_read_all_stats', 'USAGE') "
+                "THEN pg_database_size(datname) END "
+                "FROM pg_database WHERE NOT datistemplate AND datallowconn"
+            )).fetchall()
+            self._db_sizes = {name: round(size / (1024 ** 2), 2) for name, size in rows if size is not None}
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"No se pudo consultar el tamaño de las bases: {e}")
+
+    def _measure_filestore(self, database):
+        path = os.path.join(self.filestore_root, database)
+        if not os.path.isdir(path):
+            return None
+        try:
+            result = subprocess.run(['du', '-sk', path], capture_output=True, text=True,
+                                    timeout=FILESTORE_DU_TIMEOUT_SECONDS)
+            if result.stdout:
+                return round(int(result.stdout.split()[0]) / 1024, 2)
+        except (subprocess.TimeoutExpired, ValueError, OSError) as e:
+            logger.warning(f"No se pudo medir el filestore de {database}: {e}")
+        return None
+
+    def _next_filestore(self, now):
+        """Base a medir (la de medición más vieja, si venció) o None"""
+        with self._filestore_lock:
+            wanted, _requested_at = self._filestore_wanted
+            for database in list(self._filestore_sizes):
+                if database not in wanted:
+                    del self._filestore_sizes[database]
+            due = [
+                database for database in wanted
+                if database not in self._filestore_sizes
+                or now - self._filestore_sizes[database][1] >= SLOW_METRICS_TTL_SECONDS
+            ]
+            if not due:
+                return None
+            return min(due, key=lambda database: self._filestore_sizes.get(database, (None, float('-inf')))[1])
+
+    def _run_filestore_sizer(self):
+        while True:
+            now = time.monotonic()
+            with self._filestore_lock:
+                requested_at = self._filestore_wanted[1]
+                if requested_at is None or now - requested_at > FILESTORE_IDLE_SECONDS:
+                    # Este proceso dejó de ser el líder del grabador
+                    self._filestore_thread = None
+                    return
+            database = self._next_filestore(now)
+            if database is None:
+                time.sleep(FILESTORE_POLL_SECONDS)
+                continue
+            size = self._measure_filestore(database)
+            with self._filestore_lock:
+                self._filestore_sizes[database] = (size, time.monotonic())
+
+    def _request_filestore_sizes(self, databases, now):
+        """Actualiza las bases a medir y arranca el medidor si no está corriendo en este proceso"""
+        with self._filestore_lock:
+            self._filestore_wanted = (frozenset(databases), now)
+            if (self._filestore_thread and self._filestore_thread.is_alive()
+                    and self._filestore_thread_pid == os.getpid()):
+                return
+            self._filestore_thread_pid = os.getpid()
+            self._filestore_thread = threading.Thread(
+                target=self._run_filestore_sizer, name='filestore-sizer', daemon=True
+            )
+            self._filestore_thread.start()
+
+    def _filestore_mb(self, database):
+        with self._filestore_lock:
+            cached = self._filestore_sizes.get(database)
+        return cached[0] if cached else None
+
+    def _requests_per_min(self, domains):
+        """{dominio: requests/min del último minuto completo}, de lo que guardó el lector de logs"""
+        if not domains:
+            return {}
+        try:
+            return get_traffic_analytics().request_rates(domains)
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"No se pudo calcular requests/min: {e}")
+            return {}
+
+    def collect(self):
+        """Devuelve {instancia: {métrica: valor}} para todas las instancias registradas"""
+        now = time.monotonic()
+        instances = get_instance_registry(Config.PROD_ROOT, Config.DEV_ROOT).list_instances(require_conf=True)
+        collector = get_service_status_collector()
+
+        self._refresh_db_sizes(now)
+        connections = self._connections_by_pid()
+        requests_per_min = self._requests_per_min([info['domain'] for info in instances if info.get('domain')])
+        self._request_filestore_sizes([info.get('database') or info['name'] for info in instances], now)
+
+        result = {}
+        for info in instances:
+            name = info['name']
+            service = info.get('service') or collector.find_service(name)
+            if service and service.endswith('.service'):
+                service = service[:-len('.service')]
+            database = info.get('database') or name
+
+            metrics = {
+                'cpu_percent': None,
+                'memory_mb': None,
+                'workers': None,
+                'connections': None,
+                'db_size_mb': self._db_sizes.get(database),
+                'filestore_mb': self._filestore_mb(database),
+                'requests_per_min': requests_per_min.get(info['domain']) if info.get('domain') else None,
+            }
+
+            path = self._cgroup_path(service) if service else None
+            if path and os.path.isdir(path):
+                pids = self._cgroup_pids(path)
+                metrics['cpu_percent'] = self._cpu_percent(service, path, now)
+                metrics['memory_mb'] = self._memory_mb(path)
+                metrics['workers'] = len(pids)
+                if connections is not None:
+                    metrics['connections'] = sum(connections.get(pid, 0) for pid in pids)
+
+            result[name] = metrics
+
+        return result
@@ -0,0 +1,171 @@
+import os
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+INFO_FILENAME = 'info-instancia.txt'
+
+# Expresiones del archivo info-instancia.txt (soporta formato con y sin emojis)
+PORT_REGEX = re.compile(r'Puerto(?:\s+HTTP)?:\s*(\d+)')
+DOMAIN_REGEX = re.compile(r'Dominio:\s*https?://([^\s]+)')
+DATABASE_REGEX = re.compile(r'Base de datos:\s*([^\s]+)')
+SERVICE_REGEX = re.compile(r'(?:Servicio(?:\s+systemd)?|🧩\s+Servicio):\s*([^\s]+)')
+
+
+def _stat_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def parse_instance_info(name, path, env_type):
+    """Parsea info-instancia.txt y devuelve la información estática de la instancia"""
+    info = {
+        'name': name,
+        'type': env_type,
+        'path': path,
+        'status': 'unknown',
+        'port': None,
+        'domain': None,
+        'database': None,
+        'service': None
+    }
+
+    info_file = os.path.join(path, INFO_FILENAME)
+    if not os.path.exists(info_file):
+        return info
+
+    try:
+        with open(info_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except Exception as e:
+        logger.error(f"Error leyendo info de {name}: {e}")
+        return info
+
+    port_match = PORT_REGEX.search(content)
+    if port_match:
+        info['port'] = int(port_match.group(1))
+
+    domain_match = DOMAIN_REGEX.search(content)
+    if domain_match:
+        info['domain'] = domain_match.group(1)
+
+    db_match = DATABASE_REGEX.search(content)
+    if db_match:
+        info['database'] = db_match.group(1)
+
+    service_match = SERVICE_REGEX.search(content)
+    if service_match:
+        info['service'] = service_match.group(1)
+
+    return info
+
+
+class InstanceRegistry:
+    """
+    Registro en memoria de las instancias Odoo del servidor.
+
+    Cada info-instancia.txt se parsea una sola vez y se vuelve a leer solo
+    cuando cambia el mtime del directorio de la instancia o del archivo.
+    Los directorios raíz se vuelven a listar solo si cambia su mtime
+    (alta o baja de instancias), por lo que una consulta cuesta unos pocos
+    stat() en lugar de abrir y parsear todos los archivos.
+    """
+
+    def __init__(self, roots):
+        # roots: lista ordenada de (ruta_raiz, tipo)
+        self._roots = list(roots)
+        self._lock = threading.Lock()
+        self._root_mtimes = {}
+        self._root_names = {root: [] for root, _ in self._roots}
+        self._entries = {}
+
+    def _refresh_root(self, root):
+        mtime = _stat_mtime(root)
+        if mtime is None:
+            self._root_mtimes.pop(root, None)
+            self._root_names[root] = []
+            return
+
+        if self._root_mtimes.get(root) == mtime:
+            return
+
+        names = []
+        for name in os.listdir(root):
+            if os.path.isdir(os.path.join(root, name)):
+                names.append(name)
+
+        # Descartar entradas de instancias que ya no existen
+        removed = set(self._root_names.get(root, [])) - set(names)
+        for name in removed:
+            self._entries.pop((root, name), None)
+
+        self._root_names[root] = names
+        self._root_mtimes[root] = mtime
+
+    def _get_entry(self, root, env_type, name):
+        path = os.path.join(root, name)
+        signature = (_stat_mtime(path), _stat_mtime(os.path.join(path, INFO_FILENAME)))
+
+        entry = self._entries.get((root, name))
+        if entry and entry['signature'] == signature:
+            return entry
+
+        entry = {
+            'signature': signature,
+            'info': parse_instance_info(name, path, env_type),
+            'has_conf': os.path.exists(os.path.join(path, 'odoo.conf')),
+        }
+        self._entries[(root, name)] = entry
+        return entry
+
+    def list_instances(self, env_type=None, require_conf=False):
+        """Lista las instancias registradas (copias, se pueden modificar libremente)"""
+        instances = []
+        with self._lock:
+            for root, root_type in self._roots:
+                if env_type and root_type != env_type:
+                    continue
+                self._refresh_root(root)
+                for name in self._root_names[root]:
+                    entry = self._get_entry(root, root_type, name)
+                    if require_conf and not entry['has_conf']:
+                        continue
+                    instances.append(dict(entry['info']))
+        return instances
+
+    def get_instance(self, instance_name):
+        """Busca una instancia por nombre sin recorrer el resto del registro"""
+        if not instance_name or os.path.basename(instance_name) != instance_name:
+            return None
+
+        with self._lock:
+            for root, root_type in self._roots:
+                self._refresh_root(root)
+                if instance_name in self._root_names[root]:
+                    return dict(self._get_entry(root, root_type, instance_name)['info'])
+        return None
+
+    def invalidate(self):
+        """Fuerza a releer todo en la próxima consulta"""
+        with self._lock:
+            self._root_mtimes.clear()
+            self._entries.clear()
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_instance_registry(prod_root, dev_root):
+    """Devuelve el registro compartido por proceso para un par de rutas raíz"""
+    key = (prod_root, dev_root)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = InstanceRegistry([(prod_root, 'production'), (dev_root, 'development')])
+            _registries[key] = registry
+        return registry
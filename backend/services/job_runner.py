@@ -0,0 +1,505 @@
+import os
+import json
+import time
+import signal
+import threading
+import subprocess
+import logging
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from models import db, Job
+from services.process_lock import ProcessLock
+
+logger = logging.getLogger(__name__)
+
+# Tipos de job: (prioridad, pesado). Mayor prioridad se despacha antes;
+# los pesados (pg_dump/pg_restore/copias grandes) cuentan para el límite del host
+JOB_TYPES = {
+    'restore': (30, True),
+    'backup': (20, True),
+    'base_backup': (20, True),
+    'import_backup': (20, True),
+    'create_prod': (15, True),
+    'create_dev': (10, True),
+    'update_db': (10, True),
+    'sync_filestore': (10, True),
+    'update_files': (5, False),
+    'regenerate_assets': (5, False),
+}
+
+ACTIVE_STATUSES = ('queued', 'running')
+FINISHED_STATUSES = ('success', 'error', 'cancelled')
+
+# Línea que los scripts pueden emitir para informar avance: "##PROGRESS 40 Restaurando filestore"
+PROGRESS_MARKER = '##PROGRESS'
+
+# Ejecuta el comando y deja el código de salida en un archivo: el supervisor lo
+# lee aunque el proceso no sea hijo suyo (p. ej. si el worker líder cambió).
+# El trap hace que un SIGTERM de cancelación también deje el código.
+JOB_WRAPPER = (
+    "trap ':' TERM INT; "
+    'code=0; "$@" || code=$?; '
+    'echo "$code" > "$JOB_EXIT_FILE.tmp" && mv -f "$JOB_EXIT_FILE.tmp" "$JOB_EXIT_FILE"; '
+    'exit "$code"'
+)
+
+# Cada cuánto un worker que no es líder vuelve a intentar tomar el lock
+LEADER_RETRY_SECONDS = 10
+
+# Bytes del final del log que se leen para detectar avance
+PROGRESS_SCAN_BYTES = 16 * 1024
+
+# Máximo de bytes devueltos por una lectura incremental del log
+LOG_CHUNK_BYTES = 1024 * 1024
+
+# Cada cuánto se revisa el log (y la base) mientras se espera por datos nuevos
+LOG_WAIT_POLL_SECONDS = 0.5
+LOG_WAIT_REFRESH_SECONDS = 2
+
+
+def _exit_file(job):
+    return f'{job.log_path}.exit'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _active_job(job_type, instance_name):
+    return Job.query.filter(
+        Job.instance_name == instance_name,
+        Job.job_type == job_type,
+        Job.status.in_(ACTIVE_STATUSES),
+    ).first()
+
+
+def _already_active(job):
+    state = 'en curso' if job.status == 'running' else 'en cola'
+    return {
+        'success': False,
+        'error': f'Ya hay un job {job.job_type} {state} para {job.instance_name} (#{job.id})',
+        'job': job,
+    }
+
+
+def enqueue_job(job_type, instance_name, command, cwd=None, stdin_data=None, user_id=None):
+    """
+    Encola un job. No se aceptan dos jobs activos del mismo tipo para la
+    misma instancia: lo garantiza el índice único parcial de `jobs`, así que
+    dos encolados simultáneos no pueden pasar los dos. Devuelve
+    {'success', 'job'} o {'success': False, 'error'}.
+    """
+    if job_type not in JOB_TYPES:
+        return {'success': False, 'error': f'Tipo de job inválido: {job_type}'}
+
+    existing = _active_job(job_type, instance_name)
+    if existing:
+        return _already_active(existing)
+
+    priority, _heavy = JOB_TYPES[job_type]
+    job = Job(
+        job_type=job_type,
+        instance_name=instance_name,
+        priority=priority,
+        command=json.dumps(command),
+        cwd=cwd,
+        stdin_data=stdin_data,
+        user_id=user_id,
+    )
+    try:
+        db.session.add(job)
+        db.session.flush()
+        job.log_path = os.path.join(Config.JOBS_LOG_PATH, f'job-{job.id}-{job_type}-{instance_name}.log')
+        db.session.commit()
+    except IntegrityError as e:
+        # Otro proceso encoló el mismo job entre la consulta y el insert
+        db.session.rollback()
+        existing = _active_job(job_type, instance_name)
+        if existing:
+            return _already_active(existing)
+        logger.error(f"Error encolando job {job_type} de {instance_name}: {e}")
+        return {'success': False, 'error': f'No se pudo encolar el job: {e}'}
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error encolando job {job_type} de {instance_name}: {e}")
+        return {'success': False, 'error': f'No se pudo encolar el job: {e}'}
+
+    logger.info(f"Job #{job.id} encolado: {job_type} {instance_name} (prioridad {priority})")
+    if _runner is not None:
+        _runner.wake()
+    return {'success': True, 'job': job}
+
+
+def job_response(result, message):
+    """Respuesta estándar de los servicios a partir del resultado de enqueue_job"""
+    if not result['success']:
+        job = result.get('job')
+        return {'success': False, 'error': result['error'], 'job_id': job.id if job else None}
+
+    job = result['job']
+    return {
+        'success': True,
+        'message': f'{message} (job #{job.id})',
+        'job_id': job.id,
+        'status': job.status,
+        'log_file': job.log_path
+    }
+
+
+def latest_job(instance_name, job_types):
+    """Último job de una instancia entre los tipos indicados"""
+    if isinstance(job_types, str):
+        job_types = [job_types]
+    return Job.query.filter(
+        Job.instance_name == instance_name,
+        Job.job_type.in_(job_types),
+    ).order_by(Job.id.desc()).first()
+
+
+def queue_position(job):
+    """Posición en la cola (1 = el próximo en despacharse) o None si no está en cola"""
+    if job.status != 'queued':
+        return None
+    ahead = Job.query.filter(
+        Job.status == 'queued',
+        db.or_(
+            Job.priority > job.priority,
+            db.and_(Job.priority == job.priority, Job.id < job.id),
+        ),
+    ).count()
+    return ahead + 1
+
+
+def read_job_log(job, max_bytes=None):
+    """Devuelve (texto, tamaño total) del log del job; con max_bytes, solo el final"""
+    if not job.log_path or not os.path.exists(job.log_path):
+        return '', 0
+    with open(job.log_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        start = max(size - max_bytes, 0) if max_bytes else 0
+        f.seek(start)
+        return f.read().decode('utf-8', errors='replace'), size
+
+
+def _log_size(log_path):
+    try:
+        return os.path.getsize(log_path) if log_path else 0
+    except OSError:
+        return 0
+
+
+def _utf8_cut(data):
+    """Largo de `data` sin un carácter UTF-8 cortado al final"""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte < 0x80:
+            return len(data)
+        if byte >= 0xC0:
+            # Byte inicial: ver si la secuencia está completa
+            needed = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            return len(data) if back >= needed else len(data) - back
+    return len(data)
+
+
+def read_job_log_since(job, offset=0, max_bytes=LOG_CHUNK_BYTES):
+    """
+    Lee lo agregado al log desde `offset` (como mucho `max_bytes`).
+
+    Devuelve (texto, next_offset, tamaño). Si el offset es mayor al tamaño
+    (el log se recreó al relanzar el job) se vuelve a leer desde 0.
+    """
+    size = _log_size(job.log_path)
+    if offset > size:
+        offset = 0
+    if offset == size:
+        return '', offset, size
+
+    with open(job.log_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(min(max_bytes, size - offset))
+    cut = _utf8_cut(data)
+    return data[:cut].decode('utf-8', errors='replace'), offset + cut, size
+
+
+def wait_for_job_log(job, offset, timeout):
+    """
+    Bloquea hasta que el log crezca más allá de `offset`, el job termine o
+    pase `timeout`. Mientras espera no retiene una conexión de la base; el
+    estado se consulta cada tanto. Devuelve el job recargado.
+    """
+    job_id, log_path, finished = job.id, job.log_path, job.finished
+    db.session.close()
+
+    deadline = time.monotonic() + timeout
+    next_refresh = time.monotonic() + LOG_WAIT_REFRESH_SECONDS
+    while not finished and _log_size(log_path) <= offset and time.monotonic() < deadline:
+        time.sleep(LOG_WAIT_POLL_SECONDS)
+        if time.monotonic() >= next_refresh:
+            status = db.session.query(Job.status).filter(Job.id == job_id).scalar()
+            db.session.close()
+            finished = status in FINISHED_STATUSES
+            next_refresh = time.monotonic() + LOG_WAIT_REFRESH_SECONDS
+
+    return Job.query.get(job_id)
+
+
+def cancel_job(job):
+    """Cancela un job en cola o envía SIGTERM al grupo de procesos de uno en curso"""
+    if job.finished:
+        return {'success': False, 'error': f'El job ya terminó ({job.status})'}
+
+    try:
+        if job.status == 'queued':
+            job.status = 'cancelled'
+            job.finished_at = datetime.utcnow()
+            job.cancel_requested = True
+            db.session.commit()
+            return {'success': True, 'message': f'Job #{job.id} cancelado'}
+
+        job.cancel_requested = True
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return {'success': False, 'error': str(e)}
+
+    if job.pid:
+        try:
+            # start_new_session: el pid del wrapper es el id del grupo de procesos
+            os.killpg(job.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        except PermissionError as e:
+            return {'success': False, 'error': f'No se pudo detener el proceso: {e}'}
+    return {'success': True, 'message': f'Cancelación del job #{job.id} solicitada'}
+
+
+class JobRunner:
+    """
+    Supervisor de jobs.
+
+    Despacha los jobs en cola por prioridad (restore > backup > clonados de
+    desarrollo) respetando un máximo de jobs pesados simultáneos en el host
+    y de jobs por instancia. Cada job corre desacoplado dentro de un wrapper
+    que escribe el código de salida junto al log; el supervisor lo recoge,
+    actualiza el estado y el avance (`##PROGRESS <n> <mensaje>` o la última
+    línea del log). Con varios workers de gunicorn solo supervisa el que
+    tiene el lock; si muere, otro toma el relevo y recoge los jobs en curso.
+    """
+
+    def __init__(self, app, poll_interval=None, max_concurrent=None, max_per_instance=None, lock_path=None):
+        self.app = app
+        self.poll_interval = poll_interval or Config.JOBS_POLL_INTERVAL_SECONDS
+        self.max_concurrent = max_concurrent or Config.JOBS_MAX_CONCURRENT
+        self.max_per_instance = max_per_instance or Config.JOBS_MAX_PER_INSTANCE
+        self.leader_lock = ProcessLock(lock_path or Config.JOB_RUNNER_LOCK_FILE)
+        self._processes = {}
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Arranca el hilo supervisor si no está corriendo en este proceso"""
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._processes = {}
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='job-runner', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def wake(self):
+        """Adelanta el próximo ciclo (p. ej. al encolar desde este proceso)"""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.leader_lock.try_acquire():
+                self._stop.wait(LEADER_RETRY_SECONDS)
+                continue
+
+            with self.app.app_context():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error en el supervisor de jobs: {e}")
+                finally:
+                    db.session.remove()
+
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def run_once(self):
+        """Recoge los jobs terminados y despacha los que entran en los límites"""
+        running = Job.query.filter_by(status='running').all()
+        for job in running:
+            self._reap(job)
+        db.session.commit()
+        for job in running:
+            if job.finished:
+                _run_finish_hooks(job)
+
+        running = [job for job in running if job.status == 'running']
+        heavy_running = sum(1 for job in running if JOB_TYPES.get(job.job_type, (0, True))[1])
+        per_instance = {}
+        for job in running:
+            per_instance[job.instance_name] = per_instance.get(job.instance_name, 0) + 1
+
+        queued = Job.query.filter_by(status='queued').order_by(Job.priority.desc(), Job.id).all()
+        for job in queued:
+            heavy = JOB_TYPES.get(job.job_type, (0, True))[1]
+            if heavy and heavy_running >= self.max_concurrent:
+                continue
+            if per_instance.get(job.instance_name, 0) >= self.max_per_instance:
+                continue
+            if self._launch(job):
+                heavy_running += 1 if heavy else 0
+                per_instance[job.instance_name] = per_instance.get(job.instance_name, 0) + 1
+            db.session.commit()
+
+    def _launch(self, job):
+        try:
+            os.makedirs(os.path.dirname(job.log_path), exist_ok=True)
+            exit_file = _exit_file(job)
+            if os.path.exists(exit_file):
+                os.remove(exit_file)
+
+            env = dict(os.environ, JOB_EXIT_FILE=exit_file, JOB_ID=str(job.id))
+            with open(job.log_path, 'wb') as log_file:
+                process = subprocess.Popen(
+                    ['/bin/bash', '-c', JOB_WRAPPER, f'job-{job.id}'] + json.loads(job.command),
+                    stdin=subprocess.PIPE if job.stdin_data else subprocess.DEVNULL,
+                    stdout=log_file,
+                    stderr=subprocess.STDOUT,
+                    cwd=job.cwd or None,
+                    env=env,
+                    start_new_session=True,
+                )
+            if job.stdin_data:
+                process.stdin.write(job.stdin_data.encode('utf-8'))
+                process.stdin.close()
+        except Exception as e:
+            logger.error(f"No se pudo iniciar el job #{job.id}: {e}")
+            job.status = 'error'
+            job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            return False
+
+        self._processes[job.id] = process
+        job.status = 'running'
+        job.pid = process.pid
+        job.started_at = datetime.utcnow()
+        logger.info(f"Job #{job.id} iniciado: {job.job_type} {job.instance_name} (pid {process.pid})")
+        return True
+
+    def _reap(self, job):
+        process = self._processes.get(job.id)
+        if process is not None:
+            # Recoger al hijo para que no quede zombie
+            process.poll()
+
+        self._update_progress(job)
+
+        exit_code = None
+        exit_file = _exit_file(job)
+        try:
+            with open(exit_file, 'r') as f:
+                exit_code = int(f.read().strip())
+        except (OSError, ValueError):
+            pass
+
+        if exit_code is None:
+            alive = process.returncode is None if process is not None else (job.pid and _pid_alive(job.pid))
+            if alive:
+                return
+            exit_code = process.returncode if process is not None else None
+            job.error = 'El proceso terminó sin registrar código de salida'
+
+        self._processes.pop(job.id, None)
+        job.exit_code = exit_code
+        job.finished_at = datetime.utcnow()
+        if job.cancel_requested:
+            job.status = 'cancelled'
+        elif exit_code == 0:
+            job.status = 'success'
+            job.progress = 100 if job.progress is not None else None
+        else:
+            job.status = 'error'
+            if not job.error:
+                job.error = f'El proceso terminó con código {exit_code}'
+        logger.info(f"Job #{job.id} finalizado: {job.status} (código {exit_code})")
+
+    def _update_progress(self, job):
+        try:
+            text, _size = read_job_log(job, PROGRESS_SCAN_BYTES)
+        except OSError:
+            return
+
+        last_line = None
+        for line in reversed(text.splitlines()):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith(PROGRESS_MARKER):
+                parts = line[len(PROGRESS_MARKER):].strip().split(None, 1)
+                if parts and parts[0].isdigit():
+                    job.progress = min(int(parts[0]), 100)
+                    if last_line is None and len(parts) > 1:
+                        last_line = parts[1]
+                break
+            if last_line is None:
+                last_line = line
+
+        if last_line and last_line != job.progress_message:
+            job.progress_message = last_line[:500]
+
+
+_finish_hooks = {}
+
+
+def register_job_hook(job_type, callback):
+    """Registra `callback(job)` para cuando termine un job del tipo dado (en el líder)"""
+    _finish_hooks.setdefault(job_type, []).append(callback)
+
+
+def _run_finish_hooks(job):
+    for callback in _finish_hooks.get(job.job_type, ()):
+        try:
+            callback(job)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error en hook de fin del job #{job.id} ({job.job_type}): {e}")
+
+
+_runner = None
+
+
+def start_job_runner(app):
+    """Arranca el supervisor de jobs del proceso"""
+    global _runner
+    if _runner is None:
+        _runner = JobRunner(app)
+    _runner.start()
+    return _runner
+
+
+def get_job_runner():
+    """Devuelve el supervisor del proceso, o None si no se arrancó"""
+    return _runner
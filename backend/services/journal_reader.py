@@ -0,0 +1,151 @@
+import re
+import json
+import logging
+import threading
+import subprocess
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+JOURNALCTL = '/usr/bin/journalctl'
+
+# Prioridades syslog de journald -> niveles de Odoo
+PRIORITY_LEVELS = {
+    0: 'CRITICAL',  # emerg
+    1: 'CRITICAL',  # alert
+    2: 'CRITICAL',  # crit
+    3: 'ERROR',
+    4: 'WARNING',
+    5: 'INFO',      # notice
+    6: 'INFO',
+    7: 'DEBUG',
+}
+
+# Rango de prioridades de cada nivel, para filtrar dentro de journalctl (-p)
+LEVEL_PRIORITY_RANGES = {
+    'CRITICAL': '0..2',
+    'ERROR': '3..3',
+    'WARNING': '4..4',
+    'INFO': '5..6',
+    'DEBUG': '7..7',
+}
+
+# Campos pedidos a journalctl (__CURSOR y __REALTIME_TIMESTAMP siempre vienen)
+OUTPUT_FIELDS = ('MESSAGE', 'PRIORITY', '_PID', 'SYSLOG_IDENTIFIER')
+
+DEFAULT_TIMEOUT_SECONDS = 10
+
+
+def _decode_message(value):
+    # journald exporta como lista de bytes los mensajes que no son UTF-8 válido
+    if isinstance(value, list):
+        return bytes(value).decode('utf-8', errors='replace')
+    return value or ''
+
+
+def parse_journal_entry(entry):
+    """Convierte una entrada JSON de journalctl al formato de parse_log_line()"""
+    try:
+        priority = int(entry.get('PRIORITY', 6))
+    except (TypeError, ValueError):
+        priority = 6
+    level = PRIORITY_LEVELS.get(priority, 'INFO')
+
+    timestamp = ''
+    realtime = entry.get('__REALTIME_TIMESTAMP')
+    if realtime:
+        moment = datetime.fromtimestamp(int(realtime) / 1_000_000)
+        timestamp = moment.strftime('%Y-%m-%d %H:%M:%S') + f',{moment.microsecond // 1000:03d}'
+
+    pid = entry.get('_PID') or ''
+    identifier = entry.get('SYSLOG_IDENTIFIER') or 'systemd'
+    message = _decode_message(entry.get('MESSAGE'))
+
+    return {
+        'timestamp': timestamp,
+        'pid': pid,
+        'level': level,
+        'priority': priority,
+        'database': '',
+        'logger': identifier,
+        'message': message,
+        'raw': f'{timestamp} {pid} {level} {identifier}: {message}',
+    }
+
+
+def build_journal_command(unit, lines=None, after_cursor=None, level=None,
+                          since=None, until=None, search=''):
+    """
+    Arma el comando journalctl en formato JSON con los filtros aplicados
+    por el propio journal (prioridad, rango de fechas y texto).
+    """
+    cmd = [
+        JOURNALCTL, '-u', unit, '--no-pager', '-o', 'json', '--all',
+        f'--output-fields={",".join(OUTPUT_FIELDS)}',
+    ]
+    if after_cursor:
+        cmd.append(f'--after-cursor={after_cursor}')
+    if lines:
+        cmd.extend(['-n', str(lines)])
+    if level in LEVEL_PRIORITY_RANGES:
+        cmd.extend(['-p', LEVEL_PRIORITY_RANGES[level]])
+    if since:
+        cmd.append(f'--since={since}')
+    if until:
+        cmd.append(f'--until={until}')
+    if search:
+        # Búsqueda literal (journalctl -g usa PCRE2) sin distinguir mayúsculas
+        cmd.extend(['-g', re.escape(search), '--case-sensitive=false'])
+    return cmd
+
+
+def read_journal(unit, lines=None, after_cursor=None, level=None, since=None,
+                 until=None, search='', limit=1000, timeout=DEFAULT_TIMEOUT_SECONDS):
+    """
+    Lee entradas del journal de una unidad.
+
+    - Con `lines` devuelve las últimas N entradas que cumplen los filtros.
+    - Sin `lines` (con `after_cursor` o `since`) lee hacia adelante y corta
+      en `limit` entradas; `has_more` indica que quedaron pendientes.
+
+    `cursor` es el cursor de journald de la última entrada devuelta (o el
+    recibido si no hubo nuevas) para seguir con `after_cursor` en el próximo
+    poll sin volver a leer lo ya enviado.
+    """
+    cmd = build_journal_command(unit, lines, after_cursor, level, since, until, search)
+    entries = []
+    cursor = after_cursor
+    has_more = False
+
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # journalctl sin -f termina solo; el timer solo cubre un journal trabado
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+    try:
+        for raw in process.stdout:
+            if not lines and len(entries) >= limit:
+                has_more = True
+                break
+            try:
+                entry = json.loads(raw)
+            except ValueError:
+                continue
+            entries.append(parse_journal_entry(entry))
+            cursor = entry.get('__CURSOR') or cursor
+    finally:
+        if has_more:
+            process.kill()
+        stderr = process.stderr.read().decode('utf-8', errors='replace').strip()
+        process.wait()
+        timer.cancel()
+
+    # journalctl -g sale con 1 cuando no hay coincidencias: no es un error
+    if process.returncode not in (0, 1) and not has_more and not entries:
+        raise RuntimeError(stderr or f'journalctl terminó con código {process.returncode}')
+
+    return {'lines': entries, 'cursor': cursor, 'has_more': has_more}
+
+
+def format_journal_lines(entries):
+    """Texto plano (una entrada por línea) para las vistas que muestran logs crudos"""
+    return '\n'.join(entry['raw'] for entry in entries)
@@ -0,0 +1,133 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Máximo de bytes leídos por llamada (evita picos si el archivo creció mucho)
+DEFAULT_MAX_READ_BYTES = 8 * 1024 * 1024
+
+# seek_time(): tamaño al que se acota la búsqueda y líneas que se prueban por paso
+SEEK_BLOCK_BYTES = 64 * 1024
+SEEK_PROBE_LINES = 20
+
+
+class LogFollower:
+    """
+    Lector incremental de un archivo de log (como `tail -F`).
+
+    Recuerda el inodo y el offset leído; cada llamada a read_lines() devuelve
+    solo las líneas completas agregadas desde la anterior. Detecta rotación
+    (cambia el inodo) y truncado (el tamaño es menor al offset) y en ese caso
+    vuelve a empezar desde el principio del archivo nuevo.
+
+    Con `backfill_bytes` la primera lectura arranca esa cantidad de bytes
+    antes del final (descartando la primera línea, que puede estar cortada).
+    """
+
+    def __init__(self, path, from_start=False, max_read_bytes=DEFAULT_MAX_READ_BYTES, backfill_bytes=0):
+        self.path = path
+        self.from_start = from_start
+        self.max_read_bytes = max_read_bytes
+        self.backfill_bytes = backfill_bytes
+        self.inode = None
+        self.offset = 0
+        self._partial = b''
+        self._skip_first_line = False
+
+    def _reset(self, inode, offset):
+        self.inode = inode
+        self.offset = offset
+        self._partial = b''
+
+    def resume(self, inode, offset):
+        """Sigue desde una posición guardada (si el archivo rotó, se detecta en la lectura)"""
+        self._reset(inode, offset)
+        self._skip_first_line = False
+
+    def position(self):
+        """(inodo, offset) de la primera línea todavía no devuelta, para guardar y retomar"""
+        return self.inode, self.offset - len(self._partial)
+
+    def behind(self):
+        """Bytes del archivo que quedan por leer"""
+        try:
+            return max(os.stat(self.path).st_size - self.offset, 0)
+        except OSError:
+            return 0
+
+    def seek_time(self, since, line_epoch):
+        """
+        Posiciona la primera lectura cerca de la primera línea con fecha >= since.
+
+        Búsqueda binaria sobre el archivo (las líneas están ordenadas por
+        fecha): `line_epoch(línea)` devuelve la fecha en epoch o None si no
+        la reconoce. Puede quedar hasta SEEK_BLOCK_BYTES antes; las líneas
+        más viejas las descarta quien las consume.
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+
+        low, high = 0, stat.st_size
+        try:
+            with open(self.path, 'rb') as f:
+                while high - low > SEEK_BLOCK_BYTES:
+                    middle = (low + high) // 2
+                    f.seek(middle)
+                    f.readline()  # línea posiblemente cortada
+                    epoch = None
+                    for _ in range(SEEK_PROBE_LINES):
+                        line = f.readline()
+                        if not line:
+                            break
+                        epoch = line_epoch(line.decode('utf-8', errors='replace'))
+                        if epoch is not None:
+                            break
+                    if epoch is not None and epoch >= since:
+                        high = middle
+                    else:
+                        low = middle
+        except OSError as e:
+            logger.error(f"Error buscando en {self.path}: {e}")
+            return
+
+        self._reset(stat.st_ino, low)
+        self._skip_first_line = low > 0
+
+    def read_lines(self):
+        """Devuelve la lista de líneas nuevas (str, sin salto de línea)"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return []
+
+        if self.inode is None:
+            # Primera lectura: arrancar desde el final salvo que se pida lo contrario
+            start = 0 if self.from_start else max(stat.st_size - self.backfill_bytes, 0)
+            self._reset(stat.st_ino, start)
+            self._skip_first_line = start > 0 and self.backfill_bytes > 0
+        elif stat.st_ino != self.inode or stat.st_size < self.offset:
+            logger.info(f"Log rotado o truncado: {self.path}")
+            self._reset(stat.st_ino, 0)
+
+        if stat.st_size == self.offset:
+            return []
+
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read(self.max_read_bytes)
+        except OSError as e:
+            logger.error(f"Error leyendo {self.path}: {e}")
+            return []
+
+        self.offset += len(data)
+        data = self._partial + data
+        lines = data.split(b'\n')
+        # La última porción puede ser una línea todavía incompleta
+        self._partial = lines.pop()
+        if self._skip_first_line and lines:
+            lines = lines[1:]
+            self._skip_first_line = False
+        return [line.decode('utf-8', errors='replace') for line in lines]
@@ -0,0 +1,391 @@
+import os
+import re
+import json
+import glob
+import time
+import hashlib
+import threading
+import logging
+
+from config import Config
+from services.instance_registry import get_instance_registry
+from services.odoo_log_reader import LEVELS, parse_log_line
+from services.process_lock import ProcessLock
+
+logger = logging.getLogger(__name__)
+
+# Solo timestamp (sin milisegundos) y nivel: lo mínimo para indexar rápido
+INDEX_LINE_REGEX = re.compile(
+    rb'^(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}),\d+\s+\d+\s+(DEBUG|INFO|WARNING|ERROR|CRITICAL)\s'
+)
+
+# Cada cuánto un worker que no es líder vuelve a intentar tomar el lock
+LEADER_RETRY_SECONDS = 60
+
+INDEX_VERSION = 1
+
+
+def normalize_timestamp(value):
+    """Lleva '2026-02-08T15:03', '2026-02-08 15:03:42,089', etc. a 'YYYY-MM-DD HH:MM:SS'"""
+    if not value:
+        return None
+    value = value.strip().replace('T', ' ')
+    match = re.match(r'^(\d{4}-\d{2}-\d{2})(?:\s+(\d{2}):(\d{2})(?::(\d{2}))?)?', value)
+    if not match:
+        raise ValueError(f'Fecha inválida: {value}')
+    date, hour, minute, second = match.groups()
+    return f"{date} {hour or '00'}:{minute or '00'}:{second or '00'}"
+
+
+class LogIndex:
+    """
+    Índice disperso de un archivo de log de Odoo.
+
+    Cada `every_lines` líneas se guarda un checkpoint con el offset en bytes,
+    el primer y último timestamp del tramo y la cantidad de líneas por nivel.
+    Con eso una consulta por rango de fechas o por nivel lee solo los tramos
+    que pueden contener resultados. El índice se persiste como JSON en
+    `index_dir` y se actualiza de forma incremental (solo lo agregado al log);
+    si cambia el inodo o el archivo se achica, se reconstruye.
+
+    Solo el indexador líder llama a `update()`; las búsquedas leen el índice
+    persistido y recorren sin indexar, con un tope, lo escrito después.
+    """
+
+    def __init__(self, log_path, index_dir=None, every_lines=None):
+        self.log_path = log_path
+        self.every_lines = every_lines or Config.LOG_INDEX_EVERY_LINES
+        digest = hashlib.sha1(log_path.encode('utf-8')).hexdigest()
+        self.index_path = os.path.join(index_dir or Config.LOG_INDEX_PATH, f'{digest}.json')
+        self.inode = None
+        self.indexed_offset = 0
+        self.segments = []
+        self._loaded_mtime = None
+        # _lock protege el estado en memoria (se toma por poco tiempo);
+        # _update_lock serializa las pasadas de indexado, que leen el archivo
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+        try:
+            with open(self.index_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Índice de log ilegible {self.index_path}: {e}")
+            return
+        if data.get('version') != INDEX_VERSION or data.get('log_path') != self.log_path:
+            return
+        # Otro proceso pudo haber avanzado más: quedarse con el más completo
+        if data.get('inode') != self.inode or data.get('indexed_offset', 0) > self.indexed_offset:
+            self.inode = data.get('inode')
+            self.indexed_offset = data.get('indexed_offset', 0)
+            self.segments = data.get('segments', [])
+        self._loaded_mtime = mtime
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'version': INDEX_VERSION,
+                'log_path': self.log_path,
+                'inode': self.inode,
+                'indexed_offset': self.indexed_offset,
+                'every_lines': self.every_lines,
+                'segments': self.segments,
+            }, f, separators=(',', ':'))
+        os.replace(tmp_path, self.index_path)
+        self._loaded_mtime = os.stat(self.index_path).st_mtime_ns
+
+    def _new_segment(self, offset):
+        return {'offset': offset, 'lines': 0, 'ts_first': None, 'ts_last': None, 'counts': {}}
+
+    def update(self):
+        """Indexa lo agregado al log desde la última vez. Devuelve los bytes procesados."""
+        with self._update_lock:
+            with self._lock:
+                self._load()
+                inode = self.inode
+                start = self.indexed_offset
+                # El último tramo se sigue completando: copiarlo para no
+                # modificar el que están leyendo las búsquedas
+                segments = [dict(s, counts=dict(s['counts'])) for s in self.segments[-1:]]
+                segments = self.segments[:-1] + segments
+            try:
+                stat = os.stat(self.log_path)
+            except OSError:
+                return 0
+
+            rebuild = stat.st_ino != inode or stat.st_size < start
+            if rebuild:
+                inode = stat.st_ino
+                start = 0
+                segments = []
+            elif stat.st_size == start:
+                return 0
+
+            offset = start
+            segment = segments[-1] if segments else None
+            if segment is None or segment['lines'] >= self.every_lines:
+                segment = self._new_segment(offset)
+                segments.append(segment)
+
+            with open(self.log_path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Línea todavía incompleta: queda para la próxima pasada
+                        break
+                    if segment['lines'] >= self.every_lines:
+                        segment = self._new_segment(offset)
+                        segments.append(segment)
+
+                    match = INDEX_LINE_REGEX.match(line)
+                    if match:
+                        timestamp = match.group(1).decode()
+                        level = match.group(2).decode()
+                        if segment['ts_first'] is None:
+                            segment['ts_first'] = timestamp
+                        segment['ts_last'] = timestamp
+                        segment['counts'][level] = segment['counts'].get(level, 0) + 1
+                    segment['lines'] += 1
+                    offset += len(line)
+
+            if segments and segments[-1]['lines'] == 0:
+                segments.pop()
+            with self._lock:
+                self.inode = inode
+                self.indexed_offset = offset
+                self.segments = segments
+                try:
+                    self._save()
+                except OSError as e:
+                    logger.error(f"No se pudo guardar el índice {self.index_path}: {e}")
+            return offset - start
+
+    def find_ranges(self, start_ts=None, end_ts=None, level=None):
+        """
+        Rangos de bytes [inicio, fin) que pueden contener líneas que cumplan
+        el filtro, ya unidos cuando son contiguos.
+        """
+        with self._lock:
+            segments = list(self.segments)
+            indexed_offset = self.indexed_offset
+        return [tuple(r) for r in self._find_ranges(segments, indexed_offset, start_ts, end_ts, level)]
+
+    @staticmethod
+    def _find_ranges(segments, indexed_offset, start_ts, end_ts, level):
+        ranges = []
+        last_ts = None
+        for i, segment in enumerate(segments):
+            end = segments[i + 1]['offset'] if i + 1 < len(segments) else indexed_offset
+            # Tramos de solo continuaciones heredan el timestamp del anterior
+            first = segment['ts_first'] or last_ts
+            last = segment['ts_last'] or last_ts
+            last_ts = last
+
+            if start_ts and last and last < start_ts:
+                continue
+            if end_ts and first and first > end_ts:
+                # El log es cronológico: no hay más tramos en el rango
+                break
+            if level and not segment['counts'].get(level):
+                continue
+
+            if ranges and ranges[-1][1] == segment['offset']:
+                ranges[-1][1] = end
+            else:
+                ranges.append([segment['offset'], end])
+        return ranges
+
+    def summary(self):
+        """Cantidad de líneas por nivel y rango de fechas del archivo indexado"""
+        with self._lock:
+            self._load()
+            counts = {level: 0 for level in LEVELS}
+            for segment in self.segments:
+                for level, count in segment['counts'].items():
+                    counts[level] = counts.get(level, 0) + count
+            first = next((s['ts_first'] for s in self.segments if s['ts_first']), None)
+            last = next((s['ts_last'] for s in reversed(self.segments) if s['ts_last']), None)
+            return {
+                'indexed_bytes': self.indexed_offset,
+                'segments': len(self.segments),
+                'from': first,
+                'to': last,
+                'counts': counts,
+            }
+
+    def search(self, start_ts=None, end_ts=None, level=None, text='', limit=1000, resume_offset=None):
+        """
+        Busca líneas por rango de fechas, nivel y texto leyendo solo los
+        tramos relevantes. Las continuaciones (tracebacks) acompañan a la
+        línea que las precede. Devuelve (líneas, next_offset) donde
+        next_offset permite seguir paginando si se alcanzó el límite.
+
+        No indexa: usa lo que dejó persistido el indexador líder y lo escrito
+        después se recorre entero, hasta LOG_INDEX_SEARCH_TAIL_MB por llamada
+        (si queda más, next_offset apunta a donde seguir). Sin indexador
+        habilitado no hay líder y la búsqueda indexa antes por su cuenta.
+        """
+        if not Config.LOG_INDEX_ENABLED:
+            self.update()
+        with self._lock:
+            self._load()
+            segments = list(self.segments)
+            indexed_offset = self.indexed_offset
+            inode = self.inode
+
+        stat = os.stat(self.log_path)
+        if stat.st_ino != inode or stat.st_size < indexed_offset:
+            # Log rotado o truncado después del último indexado
+            segments = []
+            indexed_offset = 0
+        ranges = self._find_ranges(segments, indexed_offset, start_ts, end_ts, level)
+        tail_start = max(indexed_offset, resume_offset or 0)
+        tail_end = min(stat.st_size, tail_start + Config.LOG_INDEX_SEARCH_TAIL_MB * 1024 * 1024)
+        if tail_end > tail_start:
+            if ranges and ranges[-1][1] == tail_start:
+                ranges[-1][1] = tail_end
+            else:
+                ranges.append([tail_start, tail_end])
+
+        text = (text or '').lower()
+        results = []
+        keep_continuation = False
+        position = None
+
+        for range_start, range_end in ranges:
+            if resume_offset is not None:
+                if range_end <= resume_offset:
+                    continue
+                range_start = max(range_start, resume_offset)
+
+            keep_continuation = False
+            with open(self.log_path, 'rb') as f:
+                f.seek(range_start)
+                position = range_start
+                while position < range_end:
+                    raw = f.readline()
+                    if not raw:
+                        break
+                    line_offset = position
+                    position += len(raw)
+                    line = raw.rstrip(b'\n').decode('utf-8', errors='replace')
+                    parsed = parse_log_line(line)
+
+                    if parsed['level'] == 'CONTINUATION':
+                        if keep_continuation:
+                            results.append(parsed)
+                        continue
+
+                    timestamp = parsed['timestamp'][:19]
+                    if end_ts and timestamp > end_ts:
+                        return results, None
+                    keep_continuation = (
+                        (not start_ts or timestamp >= start_ts)
+                        and (not level or parsed['level'] == level)
+                        and (not text or text in line.lower())
+                    )
+                    if not keep_continuation:
+                        continue
+                    if len(results) >= limit:
+                        return results, line_offset
+                    results.append(parsed)
+
+        # Quedó log sin recorrer más allá del tope: seguir desde la línea siguiente
+        if tail_end < stat.st_size and position is not None and position < stat.st_size:
+            return results, position
+        return results, None
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_log_index(log_path):
+    """Índice compartido por proceso para un archivo de log"""
+    with _indexes_lock:
+        index = _indexes.get(log_path)
+        if index is None:
+            index = LogIndex(log_path)
+            _indexes[log_path] = index
+        return index
+
+
+class LogIndexer:
+    """
+    Hilo que mantiene actualizados los índices de los *.log de todas las
+    instancias. Con varios workers solo indexa el que tiene el lock; los
+    demás leen el índice que este persiste.
+    """
+
+    def __init__(self, interval=None, lock_path=None):
+        self.interval = interval or Config.LOG_INDEX_INTERVAL_SECONDS
+        self.leader_lock = ProcessLock(lock_path or os.path.join(Config.LOG_INDEX_PATH, 'indexer.lock'))
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Arranca el hilo indexador si no está corriendo en este proceso"""
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='log-indexer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _log_files(self):
+        registry = get_instance_registry(Config.PROD_ROOT, Config.DEV_ROOT)
+        for info in registry.list_instances(require_conf=True):
+            yield from sorted(glob.glob(os.path.join(info['path'], '*.log')))
+
+    def run_once(self):
+        """Actualiza todos los índices. Devuelve los bytes indexados."""
+        total = 0
+        for log_path in self._log_files():
+            if self._stop.is_set():
+                break
+            try:
+                total += get_log_index(log_path).update()
+            except Exception as e:
+                logger.error(f"Error indexando {log_path}: {e}")
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.leader_lock.try_acquire():
+                self._stop.wait(LEADER_RETRY_SECONDS)
+                continue
+
+            started = time.monotonic()
+            indexed = self.run_once()
+            if indexed:
+                logger.info(f"Logs indexados: {indexed} bytes en {time.monotonic() - started:.1f}s")
+            self._stop.wait(self.interval)
+
+
+_indexer = None
+
+
+def start_log_indexer():
+    """Arranca el indexador del proceso (si está habilitado)"""
+    global _indexer
+    if not Config.LOG_INDEX_ENABLED:
+        return None
+    if _indexer is None:
+        _indexer = LogIndexer()
+    _indexer.start()
+    return _indexer
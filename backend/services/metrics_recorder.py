@@ -0,0 +1,165 @@
+import os
+import time
+import threading
+import logging
+from datetime import datetime
+
+from config import Config
+from models import db, MetricsHistory, InstanceMetricsHistory
+from services.instance_metrics import InstanceMetricsCollector
+from services.metrics_store import host_row_from_sample, run_metrics_maintenance
+from services.process_lock import ProcessLock
+from services.system_monitor import get_system_monitor
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto un worker que no es líder vuelve a intentar tomar el lock
+LEADER_RETRY_SECONDS = 30
+
+# Muestras que se conservan en memoria si la base no está disponible
+MAX_BUFFERED_ROWS = 1000
+
+
+class MetricsRecorder:
+    """
+    Grabador de métricas en segundo plano.
+
+    Toma la última muestra de SystemMonitor cada `record_interval` segundos,
+    la acumula en memoria y la inserta en bloque cada `flush_interval`
+    segundos; después de cada inserción corre los rollups y la retención.
+    Cada `instance_interval` segundos también toma el consumo por instancia.
+    Con varios workers de gunicorn solo graba el que obtiene el lock
+    (`lock_path`); el resto reintenta periódicamente por si el líder muere.
+    """
+
+    def __init__(self, app, record_interval=None, flush_interval=None, lock_path=None, monitor=None,
+                 instance_interval=None):
+        self.app = app
+        self.record_interval = record_interval or Config.METRICS_RECORD_INTERVAL_SECONDS
+        self.flush_interval = flush_interval or Config.METRICS_FLUSH_INTERVAL_SECONDS
+        self.instance_interval = instance_interval or Config.INSTANCE_METRICS_INTERVAL_SECONDS
+        self.monitor = monitor or get_system_monitor()
+        self.instance_collector = InstanceMetricsCollector()
+        self.leader_lock = ProcessLock(lock_path or Config.METRICS_RECORDER_LOCK_FILE)
+        self._buffer = []
+        self._instance_buffer = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_leader(self):
+        return self.leader_lock.held
+
+    def start(self):
+        """Arranca el hilo grabador si no está corriendo en este proceso"""
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='metrics-recorder', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Detiene el hilo y graba lo pendiente"""
+        self._stop.set()
+        if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+            self._thread.join(timeout=self.record_interval + 5)
+
+    def _collect_instances(self):
+        timestamp = datetime.utcnow()
+        with self.app.app_context():
+            try:
+                collected = self.instance_collector.collect()
+            finally:
+                db.session.remove()
+        for name, metrics in collected.items():
+            self._instance_buffer.append(dict(metrics, instance_name=name, timestamp=timestamp))
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        next_instances = time.monotonic()
+
+        while not self._stop.is_set():
+            if not self.leader_lock.try_acquire():
+                self._stop.wait(LEADER_RETRY_SECONDS)
+                continue
+
+            started = time.monotonic()
+            try:
+                sample = self.monitor.get_latest_sample()
+                self._buffer.append(host_row_from_sample(sample, datetime.utcnow()))
+            except Exception as e:
+                logger.error(f"Error tomando muestra de métricas: {e}")
+
+            if started >= next_instances:
+                try:
+                    self._collect_instances()
+                except Exception as e:
+                    logger.error(f"Error tomando métricas por instancia: {e}")
+                next_instances = started + self.instance_interval
+
+            if started >= next_flush:
+                self.flush()
+                next_flush = started + self.flush_interval
+
+            elapsed = time.monotonic() - started
+            self._stop.wait(max(self.record_interval - elapsed, 0))
+
+        if self.is_leader:
+            self.flush()
+            self.leader_lock.release()
+
+    def flush(self):
+        """Inserta en bloque las muestras acumuladas y corre el mantenimiento"""
+        rows, self._buffer = self._buffer, []
+        instance_rows, self._instance_buffer = self._instance_buffer, []
+        if not rows and not instance_rows:
+            return 0
+
+        with self.app.app_context():
+            try:
+                if rows:
+                    db.session.execute(MetricsHistory.__table__.insert(), rows)
+                if instance_rows:
+                    db.session.execute(InstanceMetricsHistory.__table__.insert(), instance_rows)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                db.session.remove()
+                logger.error(f"Error guardando {len(rows) + len(instance_rows)} muestras de métricas: {e}")
+                # Reintentar en el próximo flush sin crecer indefinidamente
+                self._buffer = (rows + self._buffer)[-MAX_BUFFERED_ROWS:]
+                self._instance_buffer = (instance_rows + self._instance_buffer)[-MAX_BUFFERED_ROWS:]
+                return 0
+
+            try:
+                run_metrics_maintenance()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error en mantenimiento de métricas: {e}")
+            finally:
+                db.session.remove()
+
+        return len(rows) + len(instance_rows)
+
+
+_recorder = None
+
+
+def start_metrics_recorder(app):
+    """Arranca el grabador compartido del proceso (si está habilitado)"""
+    global _recorder
+    if not Config.METRICS_RECORDER_ENABLED:
+        return None
+    if _recorder is None:
+        _recorder = MetricsRecorder(app)
+    _recorder.start()
+    return _recorder
+
+
+def get_metrics_recorder():
+    """Devuelve el grabador del proceso, o None si no se arrancó"""
+    return _recorder
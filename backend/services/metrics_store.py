@@ -0,0 +1,379 @@
+import math
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, case
+from sqlalchemy.exc import IntegrityError
+
+from models import db, MetricsHistory, MetricsRollup, InstanceMetricsHistory, InstanceMetricsRollup
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+# Las filas crudas (una cada ~15 s) se conservan 24 h
+RAW_RETENTION = timedelta(hours=24)
+
+# Niveles de agregación: (resolución en segundos, retención)
+# Cada nivel se calcula a partir del anterior (crudo -> 1 min -> 5 min -> 1 h)
+ROLLUP_TIERS = (
+    (60, timedelta(days=7)),
+    (300, timedelta(days=35)),
+    (3600, timedelta(days=400)),
+)
+
+HOST_METRIC_FIELDS = (
+    'cpu_percent',
+    'ram_percent',
+    'ram_used_gb',
+    'ram_total_gb',
+    'disk_percent',
+    'disk_used_gb',
+    'disk_total_gb',
+    'network_sent_mb',
+    'network_recv_mb',
+)
+
+INSTANCE_METRIC_FIELDS = (
+    'cpu_percent',
+    'memory_mb',
+    'workers',
+    'connections',
+    'db_size_mb',
+    'filestore_mb',
+    'requests_per_min',
+)
+
+
+def to_epoch(value):
+    """Segundos desde epoch de un datetime naive en UTC"""
+    return (value - EPOCH).total_seconds()
+
+
+def from_epoch(seconds):
+    """Inverso de to_epoch"""
+    return EPOCH + timedelta(seconds=float(seconds))
+
+
+def floor_datetime(value, seconds):
+    """Alinea un datetime al múltiplo anterior de `seconds` (contado desde epoch)"""
+    return from_epoch(math.floor(to_epoch(value) / seconds) * seconds)
+
+
+def _merge_bucket(target, source, fields):
+    """Combina dos agregados del mismo bucket (promedio ponderado por muestras)"""
+    total = target['count'] + source['count']
+    for field in fields:
+        for suffix, pick in (('_min', min), ('_max', max)):
+            values = [v for v in (target[field + suffix], source[field + suffix]) if v is not None]
+            target[field + suffix] = pick(values) if values else None
+
+        weighted = [
+            (bucket[field + '_avg'], bucket['count'])
+            for bucket in (target, source)
+            if bucket[field + '_avg'] is not None
+        ]
+        weight = sum(count for _, count in weighted)
+        target[field + '_avg'] = sum(v * count for v, count in weighted) / weight if weight else None
+    target['count'] = total
+    return target
+
+
+class MetricSeries:
+    """
+    Serie temporal con almacenamiento por niveles.
+
+    - raw_model: tabla cruda (columna `timestamp` + campos métricos)
+    - rollup_model: tabla de agregados con `resolution_seconds`, `bucket_start`,
+      `sample_count` y columnas `<campo>_min/_avg/_max`
+    - key_fields: columnas que identifican sub-series (p. ej. instance_name)
+    """
+
+    def __init__(self, raw_model, rollup_model, fields, key_fields=()):
+        self.raw_model = raw_model
+        self.rollup_model = rollup_model
+        self.fields = tuple(fields)
+        self.key_fields = tuple(key_fields)
+
+    # ------------------------------------------------------------------
+    # Rollups y retención
+    # ------------------------------------------------------------------
+
+    def _source_columns(self, tier_index):
+        """Columnas (timestamp, count, min/avg/max por campo) del nivel fuente"""
+        if tier_index == 0:
+            model = self.raw_model
+            ts_col = model.timestamp
+            columns = [func.count()]
+            for field in self.fields:
+                col = getattr(model, field)
+                columns.extend([func.min(col), func.avg(col), func.max(col)])
+            return model, ts_col, columns, []
+
+        model = self.rollup_model
+        ts_col = model.bucket_start
+        source_resolution = ROLLUP_TIERS[tier_index - 1][0]
+        columns = [func.sum(model.sample_count)]
+        for field in self.fields:
+            avg_col = getattr(model, field + '_avg')
+            weight = func.sum(case((avg_col.isnot(None), model.sample_count), else_=0))
+            columns.extend([
+                func.min(getattr(model, field + '_min')),
+                func.sum(avg_col * model.sample_count) / func.nullif(weight, 0),
+                func.max(getattr(model, field + '_max')),
+            ])
+        return model, ts_col, columns, [model.resolution_seconds == source_resolution]
+
+    def _watermark(self, resolution):
+        """Inicio del último bucket agregado para una resolución"""
+        return db.session.query(func.max(self.rollup_model.bucket_start)).filter(
+            self.rollup_model.resolution_seconds == resolution
+        ).scalar()
+
+    def rollup(self, now=None):
+        """Agrega los buckets completos pendientes de cada nivel. Devuelve filas creadas."""
+        now = now or datetime.utcnow()
+        created = 0
+
+        for tier_index, (resolution, _retention) in enumerate(ROLLUP_TIERS):
+            model, ts_col, columns, filters = self._source_columns(tier_index)
+
+            watermark = self._watermark(resolution)
+            if watermark is not None:
+                start = watermark + timedelta(seconds=resolution)
+            else:
+                first = db.session.query(func.min(ts_col)).filter(*filters).scalar()
+                if first is None:
+                    continue
+                start = floor_datetime(first, resolution)
+            end = floor_datetime(now, resolution)
+            if start >= end:
+                continue
+
+            bucket = (func.floor(func.extract('epoch', ts_col) / resolution) * resolution).label('bucket')
+            key_columns = [getattr(model, key) for key in self.key_fields]
+            query = db.session.query(bucket, *key_columns, *columns).filter(
+                ts_col >= start, ts_col < end, *filters
+            ).group_by(bucket, *key_columns)
+
+            rows = []
+            for result in query:
+                row = {
+                    'resolution_seconds': resolution,
+                    'bucket_start': from_epoch(result[0]),
+                    'sample_count': int(result[1 + len(key_columns)] or 0),
+                }
+                for i, key in enumerate(self.key_fields):
+                    row[key] = result[1 + i]
+                values = result[2 + len(key_columns):]
+                for i, field in enumerate(self.fields):
+                    row[field + '_min'], row[field + '_avg'], row[field + '_max'] = [
+                        float(v) if v is not None else None for v in values[i * 3:i * 3 + 3]
+                    ]
+                rows.append(row)
+
+            if not rows:
+                continue
+
+            try:
+                db.session.execute(self.rollup_model.__table__.insert(), rows)
+                db.session.commit()
+                created += len(rows)
+            except IntegrityError:
+                # Otro proceso agregó el mismo rango
+                db.session.rollback()
+
+        return created
+
+    def prune(self, now=None):
+        """Elimina filas vencidas, sin tocar datos que el nivel siguiente aún no agregó"""
+        now = now or datetime.utcnow()
+        deleted = 0
+
+        levels = [(0, RAW_RETENTION)] + list(ROLLUP_TIERS)
+        for index, (resolution, retention) in enumerate(levels):
+            cutoff = now - retention
+            if index + 1 < len(levels):
+                next_resolution = levels[index + 1][0]
+                next_watermark = self._watermark(next_resolution)
+                if next_watermark is None:
+                    continue
+                cutoff = min(cutoff, next_watermark + timedelta(seconds=next_resolution))
+
+            if resolution == 0:
+                query = self.raw_model.query.filter(self.raw_model.timestamp < cutoff)
+            else:
+                query = self.rollup_model.query.filter(
+                    self.rollup_model.resolution_seconds == resolution,
+                    self.rollup_model.bucket_start < cutoff
+                )
+            deleted += query.delete(synchronize_session=False)
+
+        db.session.commit()
+        return deleted
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def select_resolution(self, start, bucket_seconds, now=None):
+        """Elige el nivel más grueso que no supere el bucket pedido y que cubra `start`"""
+        now = now or datetime.utcnow()
+        levels = [(0, RAW_RETENTION)] + list(ROLLUP_TIERS)
+        covering = [resolution for resolution, retention in levels if now - retention <= start]
+
+        fitting = [resolution for resolution in covering if resolution <= bucket_seconds]
+        if fitting:
+            return max(fitting)
+        if covering:
+            return min(covering)
+        return ROLLUP_TIERS[-1][0]
+
+    def _empty_bucket(self):
+        bucket = {'count': 0}
+        for field in self.fields:
+            bucket[field + '_min'] = None
+            bucket[field + '_avg'] = None
+            bucket[field + '_max'] = None
+        return bucket
+
+    def _collect_buckets(self, query):
+        """Materializa un GROUP BY (índice, count, min/avg/max por campo) como dict de buckets"""
+        buckets = {}
+        # Se itera en lotes de tuplas livianas: la memoria depende de la cantidad de buckets
+        for row in query.yield_per(500):
+            bucket = {'count': int(row[1] or 0)}
+            for i, field in enumerate(self.fields):
+                values = row[2 + i * 3:5 + i * 3]
+                bucket[field + '_min'], bucket[field + '_avg'], bucket[field + '_max'] = [
+                    float(v) if v is not None else None for v in values
+                ]
+            buckets[int(row[0])] = bucket
+        return buckets
+
+    def _aggregate_raw(self, start, end, origin, width, filters):
+        """Agrega filas crudas en la grilla (origin, width) directamente en SQL"""
+        model = self.raw_model
+        index = func.floor((func.extract('epoch', model.timestamp) - origin) / width).label('bucket_index')
+        columns = [func.count()]
+        for field in self.fields:
+            col = getattr(model, field)
+            columns.extend([func.min(col), func.avg(col), func.max(col)])
+
+        query = db.session.query(index, *columns).filter(
+            model.timestamp >= start,
+            model.timestamp < end,
+            *filters
+        ).group_by(index)
+        return self._collect_buckets(query)
+
+    def _aggregate_rollup(self, resolution, start, end, origin, width, filters):
+        """Agrega filas de un nivel en la grilla (origin, width) directamente en SQL"""
+        model = self.rollup_model
+        index = func.floor((func.extract('epoch', model.bucket_start) - origin) / width).label('bucket_index')
+        columns = [func.sum(model.sample_count)]
+        for field in self.fields:
+            avg_col = getattr(model, field + '_avg')
+            weight = func.sum(case((avg_col.isnot(None), model.sample_count), else_=0))
+            columns.extend([
+                func.min(getattr(model, field + '_min')),
+                func.sum(avg_col * model.sample_count) / func.nullif(weight, 0),
+                func.max(getattr(model, field + '_max')),
+            ])
+
+        query = db.session.query(index, *columns).filter(
+            model.resolution_seconds == resolution,
+            model.bucket_start >= start,
+            model.bucket_start < end,
+            *filters
+        ).group_by(index)
+        return self._collect_buckets(query)
+
+    def query(self, start, end, points, keys=None, now=None, resolution=None):
+        """
+        Devuelve como máximo `points` buckets entre start y end.
+
+        Cada punto trae el promedio en `<campo>` y los extremos en
+        `<campo>_min` / `<campo>_max`. Con resolution=0 se agrega solo la
+        tabla cruda (sin rollups). Retorna (puntos, resolución_usada, ancho_bucket).
+        """
+        now = now or datetime.utcnow()
+        span = max((end - start).total_seconds(), 1)
+        target = span / max(points, 1)
+        if resolution is None:
+            resolution = self.select_resolution(start, target, now)
+
+        if resolution:
+            width = math.ceil(target / resolution) * resolution
+        else:
+            width = max(target, 1)
+        origin = to_epoch(start)
+
+        raw_filters = [getattr(self.raw_model, key) == value for key, value in (keys or {}).items()]
+        if resolution:
+            rollup_filters = [getattr(self.rollup_model, key) == value for key, value in (keys or {}).items()]
+            watermark = self._watermark(resolution)
+            covered_until = watermark + timedelta(seconds=resolution) if watermark else start
+            covered_until = min(max(covered_until, start), end)
+            buckets = self._aggregate_rollup(resolution, start, covered_until, origin, width, rollup_filters)
+            # Completar el tramo reciente que todavía no fue agregado con datos crudos
+            if covered_until < end:
+                tail = self._aggregate_raw(covered_until, end, origin, width, raw_filters)
+                for index, bucket in tail.items():
+                    if index in buckets:
+                        _merge_bucket(buckets[index], bucket, self.fields)
+                    else:
+                        buckets[index] = bucket
+        else:
+            buckets = self._aggregate_raw(start, end, origin, width, raw_filters)
+
+        result = []
+        for index in sorted(buckets):
+            bucket = buckets[index]
+            point = {
+                'timestamp': from_epoch(origin + index * width).isoformat(),
+                'samples': bucket['count'],
+            }
+            for field in self.fields:
+                for suffix in ('_min', '_max'):
+                    value = bucket[field + suffix]
+                    point[field + suffix] = round(value, 2) if value is not None else None
+                value = bucket[field + '_avg']
+                point[field] = round(value, 2) if value is not None else None
+            result.append(point)
+
+        return result, resolution, width
+
+
+def host_row_from_sample(sample, timestamp=None):
+    """Convierte una muestra de SystemMonitor en columnas de MetricsHistory"""
+    disk = sample['disk'][0] if sample['disk'] else None
+    return {
+        'timestamp': timestamp or datetime.utcnow(),
+        'cpu_percent': sample['cpu']['percent'],
+        'ram_percent': sample['memory']['percent'],
+        'ram_used_gb': sample['memory']['used_gb'],
+        'ram_total_gb': sample['memory']['total_gb'],
+        'disk_percent': disk['percent'] if disk else None,
+        'disk_used_gb': disk['used_gb'] if disk else None,
+        'disk_total_gb': disk['total_gb'] if disk else None,
+        'network_sent_mb': sample['network']['mb_sent'],
+        'network_recv_mb': sample['network']['mb_recv'],
+    }
+
+
+host_metrics = MetricSeries(MetricsHistory, MetricsRollup, HOST_METRIC_FIELDS)
+instance_metrics = MetricSeries(
+    InstanceMetricsHistory, InstanceMetricsRollup, INSTANCE_METRIC_FIELDS, key_fields=('instance_name',)
+)
+
+
+def run_metrics_maintenance(now=None):
+    """Ejecuta rollups y retención de todas las series"""
+    created = deleted = 0
+    for series in (host_metrics, instance_metrics):
+        created += series.rollup(now)
+        deleted += series.prune(now)
+    if created or deleted:
+        logger.info(f"Métricas: {created} buckets agregados, {deleted} filas vencidas eliminadas")
+    return {'rollups_created': created, 'rows_deleted': deleted}
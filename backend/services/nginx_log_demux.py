@@ -0,0 +1,276 @@
+import os
+import re
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+
+from config import Config
+from models import db, LogCursor
+from services.instance_registry import get_instance_registry
+from services.log_follower import LogFollower
+from services.process_lock import ProcessLock
+
+logger = logging.getLogger(__name__)
+
+# Tipos de log de nginx que se separan por dominio
+LOG_KINDS = ('access', 'error')
+
+# Intervalo entre lecturas de los logs compartidos
+POLL_INTERVAL_SECONDS = 2
+
+# Cada cuánto un worker que no es líder vuelve a intentar tomar el lock
+LEADER_RETRY_SECONDS = 30
+
+# Campo host=$host del formato `panel_timing` (más confiable que buscar el dominio en la línea)
+HOST_FIELD_REGEX = re.compile(r' host=(\S+)')
+
+_UNSAFE_FILENAME_REGEX = re.compile(r'[^A-Za-z0-9._-]')
+
+
+class NginxLogDemux:
+    """
+    Separador de los logs compartidos de nginx por dominio.
+
+    Un solo worker (el que tiene el lock) sigue access.log y error.log
+    (lectura incremental con detección de rotación) y reparte cada línea en
+    un buffer circular por dominio de instancia. Los buffers modificados se
+    escriben en `buffer_dir/<tipo>/<dominio>.log`, de donde los lee
+    cualquier worker: pedir las últimas N líneas de una instancia no depende
+    del tamaño del log combinado ni de qué worker atiende la consulta.
+
+    La posición leída de cada log se guarda en la base (LogCursor); si el
+    líder muere o se recicla, el siguiente recarga los buffers desde disco y
+    sigue desde ahí. Sin posición guardada se precarga el final de cada log
+    (`backfill_bytes`, o desde una fecha con set_backfill()). Otros
+    componentes pueden suscribirse a las líneas de cada dominio con
+    add_listener() (p. ej. la analítica de tráfico): su `flush` se ejecuta en
+    la misma transacción que guarda la posición, así lo que escriben en la
+    base nunca se cuenta dos veces ni se pierde si el líder cambia.
+    """
+
+    def __init__(self, app=None, log_paths=None, buffer_lines=None, backfill_bytes=None,
+                 buffer_dir=None, lock_path=None):
+        self.app = app
+        log_paths = log_paths or {'access': Config.NGINX_ACCESS_LOG, 'error': Config.NGINX_ERROR_LOG}
+        self.buffer_lines = buffer_lines or Config.NGINX_LOG_BUFFER_LINES
+        self.buffer_dir = buffer_dir or Config.NGINX_LOG_BUFFER_PATH
+        backfill = Config.NGINX_LOG_BACKFILL_MB * 1024 * 1024 if backfill_bytes is None else backfill_bytes
+        self._followers = {
+            kind: LogFollower(path, backfill_bytes=backfill) for kind, path in log_paths.items()
+        }
+        self._buffers = {kind: {} for kind in self._followers}
+        self._dirty = {kind: set() for kind in self._followers}
+        self._listeners = {kind: [] for kind in self._followers}
+        self._flushers = []
+        self._discarders = []
+        self._backfill_since = {}
+        self._resumed = False
+        self._domains = ()
+        self._pattern = None
+        self.leader_lock = ProcessLock(lock_path or Config.NGINX_LOG_DEMUX_LOCK_FILE)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+
+    def _buffer_path(self, kind, domain):
+        return os.path.join(self.buffer_dir, kind, _UNSAFE_FILENAME_REGEX.sub('_', domain) + '.log')
+
+    def _refresh_domains(self):
+        registry = get_instance_registry(Config.PROD_ROOT, Config.DEV_ROOT)
+        domains = tuple(sorted(
+            {info['domain'] for info in registry.list_instances() if info.get('domain')},
+            key=len, reverse=True
+        ))
+        if domains == self._domains:
+            return
+        self._domains = domains
+        # Alternancia con los dominios más largos primero (sub.dominio antes que dominio)
+        self._pattern = re.compile('|'.join(re.escape(domain) for domain in domains)) if domains else None
+
+    def _load_buffer(self, kind, domain):
+        buffer = deque(maxlen=self.buffer_lines)
+        try:
+            with open(self._buffer_path(kind, domain), 'r', encoding='utf-8', errors='replace') as f:
+                buffer.extend(line.rstrip('\n') for line in f)
+        except FileNotFoundError:
+            pass
+        return buffer
+
+    def _dispatch(self, kind, lines):
+        if not self._pattern:
+            return
+        buffers = self._buffers[kind]
+        dirty = self._dirty[kind]
+        listeners = self._listeners[kind]
+        search = self._pattern.search
+        known = set(self._domains)
+        for line in lines:
+            host = HOST_FIELD_REGEX.search(line)
+            if host and host.group(1) in known:
+                domain = host.group(1)
+            else:
+                match = search(line)
+                if not match:
+                    continue
+                domain = match.group(0)
+            buffer = buffers.get(domain)
+            if buffer is None:
+                # Lo que dejó el líder anterior
+                buffer = buffers[domain] = self._load_buffer(kind, domain)
+            buffer.append(line)
+            dirty.add(domain)
+            for listener in listeners:
+                try:
+                    listener(domain, line)
+                except Exception as e:
+                    logger.error(f"Error procesando línea de nginx: {e}")
+
+    def _resume(self):
+        """Al tomar el liderazgo: seguir cada log desde la posición guardada, si hay"""
+        for kind, follower in self._followers.items():
+            cursor = LogCursor.query.get(follower.path)
+            if cursor:
+                follower.resume(cursor.inode, cursor.offset)
+            elif kind in self._backfill_since:
+                since, line_epoch = self._backfill_since[kind]
+                follower.seek_time(since(), line_epoch)
+        self._resumed = True
+
+    def _discard(self):
+        """Tras un error al guardar: volver a la última posición guardada en la próxima lectura"""
+        with self._lock:
+            self._resumed = False
+            for kind in self._followers:
+                self._buffers[kind].clear()
+                self._dirty[kind].clear()
+            for discard in self._discarders:
+                discard()
+
+    def _save(self):
+        """Escribe los buffers modificados y guarda la posición de cada log"""
+        for kind, domains in self._dirty.items():
+            for domain in domains:
+                path = self._buffer_path(kind, domain)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f'{path}.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.writelines(line + '\n' for line in self._buffers[kind][domain])
+                os.replace(tmp_path, path)
+            domains.clear()
+
+        for follower in self._followers.values():
+            inode, offset = follower.position()
+            if inode is None:
+                continue
+            cursor = LogCursor.query.get(follower.path) or LogCursor(path=follower.path)
+            cursor.inode = inode
+            cursor.offset = offset
+            cursor.updated_at = datetime.utcnow()
+            db.session.add(cursor)
+        for flush in self._flushers:
+            flush()
+        db.session.commit()
+
+    def poll(self):
+        """
+        Lee un bloque nuevo de cada log, lo reparte y guarda el estado.
+        Devuelve la cantidad de líneas leídas.
+        """
+        total = 0
+        with self._lock:
+            if not self._resumed:
+                self._resume()
+            self._refresh_domains()
+            for kind, follower in self._followers.items():
+                lines = follower.read_lines()
+                if lines:
+                    self._dispatch(kind, lines)
+                    total += len(lines)
+            self._save()
+        return total
+
+    def add_listener(self, kind, callback, flush=None, discard=None):
+        """
+        Registra callback(dominio, línea) para cada línea nueva de un tipo de
+        log (solo corre en el líder). `flush()` escribe lo acumulado en la
+        sesión antes del commit de cada lectura; `discard()` lo descarta si
+        ese commit falló (las líneas se vuelven a leer).
+        """
+        with self._lock:
+            self._listeners[kind].append(callback)
+            if flush:
+                self._flushers.append(flush)
+            if discard:
+                self._discarders.append(discard)
+
+    def set_backfill(self, kind, since, line_epoch):
+        """Sin posición guardada, leer un log desde la fecha `since()` en vez de los últimos MB"""
+        with self._lock:
+            self._backfill_since[kind] = (since, line_epoch)
+
+    def start(self):
+        """Arranca el hilo lector si no está corriendo en este proceso"""
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='nginx-log-demux', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.leader_lock.try_acquire():
+                self._stop.wait(LEADER_RETRY_SECONDS)
+                continue
+
+            behind = 0
+            with self.app.app_context():
+                try:
+                    self.poll()
+                    behind = sum(follower.behind() for follower in self._followers.values())
+                except Exception as e:
+                    db.session.rollback()
+                    self._discard()
+                    logger.error(f"Error leyendo logs de nginx: {e}")
+                finally:
+                    db.session.remove()
+            # Mientras quede log atrasado (precarga, picos) se sigue sin esperar
+            if not behind:
+                self._stop.wait(POLL_INTERVAL_SECONDS)
+
+    def get_lines(self, kind, domain, lines=100):
+        """Últimas `lines` líneas de un dominio (kind: 'access' o 'error'), desde lo que dejó el líder"""
+        if kind not in self._buffers:
+            raise ValueError(f'Tipo de log de nginx no válido: {kind}')
+        buffer = self._load_buffer(kind, domain)
+        return list(buffer)[-lines:]
+
+
+_demux = None
+_demux_lock = threading.Lock()
+
+
+def get_nginx_log_demux():
+    """Devuelve el separador compartido por proceso"""
+    global _demux
+    with _demux_lock:
+        if _demux is None:
+            _demux = NginxLogDemux()
+        return _demux
+
+
+def start_nginx_log_demux(app):
+    """Arranca el lector de logs de nginx del proceso (solo el líder lee)"""
+    demux = get_nginx_log_demux()
+    demux.app = app
+    # La analítica de tráfico tiene que suscribirse antes de la primera lectura
+    from services.traffic_analytics import get_traffic_analytics
+    get_traffic_analytics()
+    demux.start()
+    return demux
@@ -0,0 +1,149 @@
+import os
+import re
+
+# Regex para parsear líneas de log de Odoo
+# Formato: 2026-02-08 15:03:42,089 1200 WARNING dev-mtg-production odoo.http: mensaje
+LOG_LINE_REGEX = re.compile(
+    r'^(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2},\d+)\s+'  # timestamp
+    r'(\d+)\s+'                                              # pid
+    r'(DEBUG|INFO|WARNING|ERROR|CRITICAL)\s+'                # level
+    r'(\S+)\s+'                                              # database
+    r'(\S+):\s*'                                             # logger
+    r'(.*)'                                                  # message
+)
+
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+# Máximo de bytes devueltos por una lectura incremental
+DEFAULT_INCREMENT_BYTES = 1024 * 1024
+
+TAIL_BLOCK_SIZE = 8192
+
+
+def parse_log_line(line):
+    """Parsea una línea de log de Odoo y extrae sus componentes"""
+    match = LOG_LINE_REGEX.match(line)
+    if match:
+        return {
+            'timestamp': match.group(1),
+            'pid': match.group(2),
+            'level': match.group(3),
+            'database': match.group(4),
+            'logger': match.group(5),
+            'message': match.group(6),
+            'raw': line
+        }
+    # Línea de continuación (traceback, etc.)
+    return {
+        'timestamp': '',
+        'pid': '',
+        'level': 'CONTINUATION',
+        'database': '',
+        'logger': '',
+        'message': line,
+        'raw': line
+    }
+
+
+def parse_and_filter(raw_lines, level_filter='', search=''):
+    """
+    Parsea líneas y aplica los filtros de nivel y búsqueda en una sola pasada.
+
+    Las continuaciones (tracebacks) se conservan con cualquier filtro de nivel.
+    """
+    search = search.lower()
+    parsed_lines = []
+    for line in raw_lines:
+        if not line.strip():
+            continue
+        if search and search not in line.lower():
+            continue
+        parsed = parse_log_line(line)
+        if level_filter and parsed['level'] not in ('CONTINUATION', level_filter):
+            continue
+        parsed_lines.append(parsed)
+    return parsed_lines
+
+
+def count_levels(parsed_lines):
+    """Estadísticas por nivel en una sola pasada"""
+    stats = {'total': len(parsed_lines)}
+    stats.update({level.lower(): 0 for level in LEVELS})
+    for parsed in parsed_lines:
+        key = parsed['level'].lower()
+        if key in stats:
+            stats[key] += 1
+    return stats
+
+
+def tail_file_with_cursor(filepath, lines=500):
+    """
+    Lee las últimas N líneas completas de un archivo.
+
+    Devuelve (líneas, cursor) donde cursor = {'inode', 'offset'} apunta al
+    final de la última línea leída, para continuar con read_increment().
+    """
+    with open(filepath, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        # Tamaño fijado al abrir: lo que se escriba después queda para el próximo incremento
+        end = stat.st_size
+        blocks = []
+        remaining = end
+        found_lines = 0
+
+        while remaining > 0 and found_lines < lines + 1:
+            read_size = min(TAIL_BLOCK_SIZE, remaining)
+            remaining -= read_size
+            f.seek(remaining)
+            block = f.read(read_size)
+            blocks.insert(0, block)
+            found_lines += block.count(b'\n')
+
+    data = b''.join(blocks)
+    # Descartar una última línea incompleta (se está escribiendo)
+    cut = data.rfind(b'\n') + 1
+    offset = end - (len(data) - cut)
+    all_lines = data[:cut].decode('utf-8', errors='replace').split('\n')
+    if all_lines and all_lines[-1] == '':
+        all_lines = all_lines[:-1]
+
+    return all_lines[-lines:], {'inode': stat.st_ino, 'offset': offset}
+
+
+def read_increment(filepath, inode=None, offset=None, max_bytes=DEFAULT_INCREMENT_BYTES):
+    """
+    Lee las líneas completas agregadas después de un cursor.
+
+    Si el inodo no coincide o el archivo es más chico que el offset, el log
+    fue rotado o truncado y se lee el archivo nuevo desde el principio
+    (`rotated`: True). Como máximo se leen `max_bytes`; `has_more` indica
+    que quedan datos pendientes para la próxima llamada.
+    """
+    with open(filepath, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        rotated = False
+        if offset is None or inode != stat.st_ino or offset > stat.st_size:
+            rotated = offset is not None
+            offset = 0
+
+        size = stat.st_size
+        f.seek(offset)
+        data = f.read(min(max_bytes, size - offset))
+
+    cut = data.rfind(b'\n') + 1
+    if cut == 0 and len(data) >= max_bytes:
+        # Una sola línea más larga que max_bytes: devolverla cortada para no trabarse
+        cut = len(data)
+    new_offset = offset + cut
+    text = data[:cut].decode('utf-8', errors='replace')
+    lines = text.split('\n')
+    if lines and lines[-1] == '':
+        lines = lines[:-1]
+
+    return {
+        'lines': lines,
+        'cursor': {'inode': stat.st_ino, 'offset': new_offset},
+        'rotated': rotated,
+        'has_more': len(data) >= max_bytes and new_offset < size,
+        'size': size,
+    }
@@ -0,0 +1,67 @@
+import os
+import fcntl
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessLock:
+    """
+    Lock exclusivo entre procesos basado en flock().
+
+    Sirve para elegir un único "líder" entre los workers de gunicorn: el
+    primero que obtiene el lock lo conserva mientras el proceso viva y el
+    kernel lo libera automáticamente si el proceso muere, de modo que otro
+    worker puede tomarlo en su siguiente intento.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def held(self):
+        return self._fd is not None and self._pid == os.getpid()
+
+    def try_acquire(self):
+        """Intenta tomar el lock sin bloquear. Devuelve True si este proceso es el dueño."""
+        with self._lock:
+            if self.held:
+                return True
+
+            # Un descriptor heredado por fork no es del proceso actual
+            self._fd = None
+
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError as e:
+                logger.error(f"No se pudo abrir el lock {self.path}: {e}")
+                return False
+
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+
+            os.ftruncate(fd, 0)
+            os.write(fd, f'{os.getpid()}\n'.encode())
+            self._fd = fd
+            self._pid = os.getpid()
+            return True
+
+    def release(self):
+        """Libera el lock si este proceso lo tiene"""
+        with self._lock:
+            if not self.held:
+                return
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+                self._pid = None
@@ -0,0 +1,126 @@
+import subprocess
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+SYSTEMCTL_BIN = '/usr/bin/systemctl'
+DEFAULT_UNIT_PATTERN = 'odoo*'
+DEFAULT_TTL_SECONDS = 5
+
+
+def _strip_service_suffix(unit):
+    return unit[:-len('.service')] if unit.endswith('.service') else unit
+
+
+class ServiceStatusCollector:
+    """
+    Recolector de estados de servicios systemd.
+
+    Obtiene el estado de todas las unidades odoo* (más las que se hayan
+    consultado explícitamente) con una sola llamada a systemctl y lo cachea
+    durante un TTL corto, en lugar de lanzar un `systemctl is-active` por
+    servicio.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, unit_pattern=DEFAULT_UNIT_PATTERN):
+        self.ttl = ttl
+        self.unit_pattern = unit_pattern
+        self._lock = threading.Lock()
+        self._states = {}
+        self._extra_units = set()
+        self._fetched_at = None
+        self._ok = False
+
+    def _fetch(self):
+        """Ejecuta una única consulta a systemctl y devuelve {servicio: active_state}"""
+        cmd = [
+            SYSTEMCTL_BIN, 'list-units', '--type=service', '--all',
+            '--plain', '--no-legend', '--no-pager', self.unit_pattern,
+        ]
+        cmd.extend(f'{unit}.service' for unit in sorted(self._extra_units))
+
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
+        if result.returncode != 0 and not result.stdout:
+            raise RuntimeError(result.stderr.strip() or f'systemctl devolvió {result.returncode}')
+
+        states = {}
+        for line in result.stdout.splitlines():
+            # Formato: UNIT LOAD ACTIVE SUB DESCRIPTION
+            parts = line.split()
+            if len(parts) < 3:
+                continue
+            states[_strip_service_suffix(parts[0])] = parts[2]
+        return states
+
+    def _ensure_fresh(self, units=()):
+        missing = {unit for unit in units if unit and unit not in self._states}
+        # Unidades fuera del patrón: se agregan a la consulta batch
+        new_units = {
+            unit for unit in missing
+            if not unit.startswith(self.unit_pattern.rstrip('*'))
+        } - self._extra_units
+        self._extra_units.update(new_units)
+
+        expired = self._fetched_at is None or (time.monotonic() - self._fetched_at) >= self.ttl
+        if not expired and not new_units:
+            return
+
+        try:
+            self._states = self._fetch()
+            self._ok = True
+        except Exception as e:
+            logger.error(f"Error consultando estados de systemd: {e}")
+            self._states = {}
+            self._ok = False
+        self._fetched_at = time.monotonic()
+
+    def _normalize(self, active_state):
+        if active_state == 'active':
+            return 'active'
+        if active_state in ('inactive', 'failed'):
+            return 'inactive'
+        logger.warning(f"Unknown status '{active_state}'")
+        return 'unknown'
+
+    def get_statuses(self, service_names):
+        """Devuelve {servicio: 'active'|'inactive'|'unknown'} con a lo sumo una consulta"""
+        with self._lock:
+            self._ensure_fresh(service_names)
+            statuses = {}
+            for name in service_names:
+                if not self._ok:
+                    statuses[name] = 'unknown'
+                elif name in self._states:
+                    statuses[name] = self._normalize(self._states[name])
+                else:
+                    # systemctl no lista unidades sin cargar: equivalen a 'inactive'
+                    statuses[name] = 'inactive'
+            return statuses
+
+    def get_status(self, service_name):
+        """Estado normalizado de un servicio"""
+        return self.get_statuses([service_name])[service_name]
+
+    def find_service(self, instance_name):
+        """Busca la unidad odoo* que corresponde a una instancia"""
+        with self._lock:
+            self._ensure_fresh()
+            for unit in self._states:
+                if instance_name in unit and 'odoo' in unit.lower():
+                    return unit
+        return None
+
+    def invalidate(self):
+        """Descarta la caché (p. ej. tras reiniciar un servicio)"""
+        with self._lock:
+            self._fetched_at = None
+
+
+_collector = ServiceStatusCollector()
+
+
+def get_service_status_collector():
+    """Devuelve el recolector compartido por proceso"""
+    return _collector
@@ -0,0 +1,38 @@
+import hmac
+import time
+import hashlib
+from urllib.parse import urlencode
+
+from config import Config
+
+
+def _signature(resource, expires):
+    message = f"{resource}\n{expires}".encode()
+    return hmac.new(Config.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def signed_query(resource, ttl, **params):
+    """
+    Query string firmada (HMAC) para `resource`, válida por `ttl` segundos.
+
+    La firma reemplaza al JWT en URLs que abre el navegador sin headers
+    (descargas, EventSource): solo autoriza ese recurso y por poco tiempo.
+    Devuelve (query, expires_at_epoch).
+    """
+    expires = int(time.time()) + int(ttl)
+    return urlencode({**params, 'expires': expires, 'sig': _signature(resource, expires)}), expires
+
+
+def check_signature(resource, expires, sig):
+    """None si la firma es válida y vigente; si no, (error, status)"""
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return ('Enlace inválido', 400)
+    if not resource or not sig:
+        return ('Enlace inválido', 400)
+    if not hmac.compare_digest(_signature(resource, expires), sig):
+        return ('Enlace inválido', 403)
+    if expires < time.time():
+        return ('El enlace expiró', 410)
+    return None
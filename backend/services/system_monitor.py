@@ -1,26 +1,159 @@
+import os
 import psutil
+import threading
 import time
+import logging
+from collections import deque
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
+from config import Config
+
+logger = logging.getLogger(__name__)
+
 ARGENTINA_TIMEZONE = 'America/Argentina/Buenos_Aires'
 ARGENTINA_TZ = ZoneInfo(ARGENTINA_TIMEZONE)
 
+# Tiempo mínimo entre el cebado de psutil.cpu_percent y la primera muestra
+CPU_PRIME_SECONDS = 0.5
+
+
+def diff_sample(previous, current):
+    """
+    Delta entre dos muestras: solo las claves que cambiaron.
+
+    Los dicts se comparan recursivamente; listas y escalares se reemplazan
+    completos. Aplicar el delta sobre `previous` (merge profundo de dicts)
+    reproduce `current`.
+    """
+    delta = {}
+    for key, value in current.items():
+        old = previous.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested = diff_sample(old, value)
+            if nested:
+                delta[key] = nested
+        elif value != old:
+            delta[key] = value
+    return delta
+
+
 class SystemMonitor:
-    """Monitor del sistema para obtener métricas en tiempo real"""
+    """
+    Monitor del sistema para obtener métricas en tiempo real.
+
+    Un hilo muestreador (uno por proceso) toma CPU, memoria, discos y red
+    cada `sample_interval` segundos y guarda las muestras en un buffer
+    circular; get_all_metrics() devuelve la última muestra sin bloquear.
+
+    Cada muestra lleva un número de secuencia y el delta respecto de la
+    anterior, calculado una sola vez; los suscriptores (stream SSE) esperan
+    con wait_for_sample() y reenvían ese delta sin recalcular nada.
+    """
     
-    def __init__(self):
+    def __init__(self, sample_interval=None, history_size=None):
+        self.sample_interval = sample_interval or Config.METRICS_SAMPLE_INTERVAL_SECONDS
+        self._samples = deque(maxlen=history_size or Config.METRICS_SAMPLE_HISTORY)
         self._last_net_io = None
         self._last_net_time = None
+        self._lock = threading.Lock()
+        self._new_sample = threading.Condition(self._lock)
+        self._seq = 0
+        self._last_delta = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._sampler_pid = None
+    
+    def start_sampler(self):
+        """Arranca el hilo muestreador si no está corriendo en este proceso"""
+        with self._lock:
+            # Tras un fork (workers de gunicorn) el hilo del padre no existe
+            if self._sampler and self._sampler.is_alive() and self._sampler_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._sampler_pid = os.getpid()
+            self._sampler = threading.Thread(target=self._run_sampler, name='system-monitor-sampler', daemon=True)
+            self._sampler.start()
+    
+    def stop_sampler(self):
+        """Detiene el hilo muestreador"""
+        self._stop.set()
+    
+    def _run_sampler(self):
+        # Cebar cpu_percent: las lecturas con interval=None miden desde la llamada anterior
+        psutil.cpu_percent(interval=None)
+        psutil.cpu_percent(interval=None, percpu=True)
+        self._stop.wait(CPU_PRIME_SECONDS)
+        
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self._record_sample(self._collect_sample())
+            except Exception as e:
+                logger.error(f"Error muestreando métricas del sistema: {e}")
+            elapsed = time.monotonic() - started
+            self._stop.wait(max(self.sample_interval - elapsed, 0))
+    
+    def _collect_sample(self):
+        return {
+            'timestamp': datetime.now(ARGENTINA_TZ).isoformat(),
+            'cpu': self.get_cpu_info(),
+            'memory': self.get_memory_info(),
+            'disk': self.get_disk_info(),
+            'network': self.get_network_info(),
+            'system': self.get_system_info()
+        }
+    
+    def _record_sample(self, sample):
+        with self._lock:
+            previous = self._samples[-1] if self._samples else None
+            self._last_delta = diff_sample(previous, sample) if previous else None
+            self._samples.append(sample)
+            self._seq += 1
+            self._new_sample.notify_all()
+        self._ready.set()
+    
+    def get_latest_sample(self):
+        """Última muestra del buffer (arranca el muestreador si hace falta)"""
+        self.start_sampler()
+        if not self._ready.wait(timeout=self.sample_interval + CPU_PRIME_SECONDS + 1):
+            # El muestreador no respondió a tiempo: muestrear en línea
+            self._record_sample(self._collect_sample())
+        with self._lock:
+            return self._samples[-1]
+    
+    def wait_for_sample(self, after_seq, timeout):
+        """
+        Espera una muestra posterior a `after_seq`.
+
+        Devuelve (seq, muestra, delta) o None si venció el timeout. `delta`
+        es None si el suscriptor se perdió alguna muestra intermedia (o es
+        la primera): en ese caso debe enviar la muestra completa.
+        """
+        self.start_sampler()
+        with self._new_sample:
+            if not self._new_sample.wait_for(lambda: self._seq > after_seq, timeout=timeout):
+                return None
+            seq = self._seq
+            delta = self._last_delta if seq == after_seq + 1 else None
+            return seq, self._samples[-1], delta
+    
+    def get_samples(self):
+        """Copia de las muestras del buffer circular, de la más antigua a la más nueva"""
+        self.start_sampler()
+        with self._lock:
+            return list(self._samples)
     
     def get_cpu_info(self):
-        """Obtiene información de CPU"""
+        """Obtiene información de CPU (no bloqueante: mide desde la lectura anterior)"""
+        freq = psutil.cpu_freq()
         return {
-            'percent': round(psutil.cpu_percent(interval=1), 2),
+            'percent': round(psutil.cpu_percent(interval=None), 2),
             'count': psutil.cpu_count(),
             'count_logical': psutil.cpu_count(logical=True),
-            'freq': psutil.cpu_freq()._asdict() if psutil.cpu_freq() else None,
-            'per_cpu': [round(x, 2) for x in psutil.cpu_percent(interval=1, percpu=True)]
+            'freq': freq._asdict() if freq else None,
+            'per_cpu': [round(x, 2) for x in psutil.cpu_percent(interval=None, percpu=True)]
         }
     
     def get_memory_info(self):
@@ -127,13 +260,18 @@ class SystemMonitor:
         return " ".join(parts) if parts else "< 1m"
     
     def get_all_metrics(self):
-        """Obtiene todas las métricas del sistema"""
-        current_time = datetime.now(ARGENTINA_TZ)
-        return {
-            'timestamp': current_time.isoformat(),
-            'cpu': self.get_cpu_info(),
-            'memory': self.get_memory_info(),
-            'disk': self.get_disk_info(),
-            'network': self.get_network_info(),
-            'system': self.get_system_info()
-        }
+        """Obtiene todas las métricas del sistema a partir de la última muestra"""
+        return dict(self.get_latest_sample())
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_system_monitor():
+    """Devuelve el monitor compartido por proceso"""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = SystemMonitor()
+        return _monitor
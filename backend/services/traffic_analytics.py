@@ -0,0 +1,367 @@
+import re
+import json
+import math
+import time
+import threading
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import func
+
+from config import Config
+from models import db, TrafficMinute
+from services.nginx_log_demux import get_nginx_log_demux
+
+logger = logging.getLogger(__name__)
+
+# Formato combined de nginx, con los campos opcionales del formato `panel_timing`
+# (host=$host rt=$request_time) que agrega deploy.sh
+ACCESS_LINE_REGEX = re.compile(
+    r'^\S+ \S+ \S+ \[([^\]]+)\] '           # fecha
+    r'"(\S+) (\S+)[^"]*" '                    # método y URL
+    r'(\d{3}) (\d+|-)'                        # status y bytes
+    r'(?: "[^"]*" "[^"]*")?'                  # referer y user agent
+    r'(?: host=(\S+))?'                       # host
+    r'(?: rt=([\d.]+))?'                      # request_time (segundos)
+)
+
+# Histograma logarítmico de latencias: cada bucket es un 10% más ancho que
+# el anterior (error relativo de percentiles acotado, como un HDR histogram)
+LATENCY_BASE = 1.1
+LATENCY_MIN_MS = 1.0
+
+# URLs lentas que se siguen por minuto (algoritmo Space-Saving)
+TOP_URLS_CAPACITY = 50
+
+PERCENTILES = (50, 90, 95, 99)
+
+_ID_SEGMENT_REGEX = re.compile(r'/\d+(?=/|$)')
+
+
+def normalize_url(url):
+    """Quita la query string y reemplaza ids numéricos para agrupar endpoints"""
+    path = url.split('?', 1)[0]
+    return _ID_SEGMENT_REGEX.sub('/:id', path)
+
+
+def minute_to_datetime(minute):
+    """Minuto epoch → datetime UTC sin zona (como el resto de las tablas)"""
+    return datetime.utcfromtimestamp(minute * 60)
+
+
+def minute_from_datetime(value):
+    return int(value.replace(tzinfo=timezone.utc).timestamp() // 60)
+
+
+def latency_bucket(ms):
+    if ms <= LATENCY_MIN_MS:
+        return 0
+    return int(math.log(ms / LATENCY_MIN_MS, LATENCY_BASE)) + 1
+
+
+def bucket_upper_ms(index):
+    return LATENCY_MIN_MS * (LATENCY_BASE ** index)
+
+
+def histogram_percentiles(histogram, percentiles=PERCENTILES):
+    """Percentiles (ms) de un histograma {bucket: cantidad}"""
+    total = sum(histogram.values())
+    if not total:
+        return {f'p{p}': None for p in percentiles}
+
+    result = {}
+    ordered = sorted(histogram.items())
+    for p in percentiles:
+        target = total * p / 100
+        seen = 0
+        for index, count in ordered:
+            seen += count
+            if seen >= target:
+                result[f'p{p}'] = round(bucket_upper_ms(index), 1)
+                break
+    return result
+
+
+class SpaceSaving:
+    """
+    Top-N aproximado de URLs por tiempo total (Space-Saving ponderado).
+
+    Usa memoria fija: cuando está lleno, la URL nueva reemplaza a la de menor
+    peso y hereda ese peso como cota de error.
+    """
+
+    def __init__(self, capacity=TOP_URLS_CAPACITY):
+        self.capacity = capacity
+        self.items = {}
+
+    def add(self, key, weight, latency_ms):
+        item = self.items.get(key)
+        if item is None:
+            if len(self.items) >= self.capacity:
+                victim = min(self.items, key=lambda k: self.items[k]['total_ms'])
+                floor = self.items.pop(victim)['total_ms']
+            else:
+                floor = 0.0
+            item = self.items[key] = {'total_ms': floor, 'error_ms': floor, 'count': 0, 'max_ms': 0.0}
+        item['total_ms'] += weight
+        item['count'] += 1
+        item['max_ms'] = max(item['max_ms'], latency_ms)
+
+    def merge(self, other):
+        for key, item in other.items.items():
+            current = self.items.get(key)
+            if current is None:
+                self.items[key] = dict(item)
+            else:
+                current['total_ms'] += item['total_ms']
+                current['error_ms'] += item['error_ms']
+                current['count'] += item['count']
+                current['max_ms'] = max(current['max_ms'], item['max_ms'])
+        if len(self.items) > self.capacity:
+            keep = sorted(self.items.items(), key=lambda kv: kv[1]['total_ms'], reverse=True)[:self.capacity]
+            self.items = dict(keep)
+
+    def top(self, n):
+        ordered = sorted(self.items.items(), key=lambda kv: kv[1]['total_ms'], reverse=True)[:n]
+        return [{
+            'url': url,
+            'count': item['count'],
+            'total_ms': round(item['total_ms'], 1),
+            'avg_ms': round(item['total_ms'] / item['count'], 1) if item['count'] else None,
+            'max_ms': round(item['max_ms'], 1),
+        } for url, item in ordered]
+
+
+class MinuteStats:
+    """Agregado de un minuto de tráfico de un dominio"""
+
+    __slots__ = ('minute', 'requests', 'bytes', 'status', 'latency', 'timed', 'slow_urls')
+
+    def __init__(self, minute):
+        self.minute = minute
+        self.requests = 0
+        self.bytes = 0
+        self.status = {}
+        self.latency = {}
+        self.timed = 0
+        self.slow_urls = SpaceSaving()
+
+    def add(self, status, size, url, latency_ms):
+        self.requests += 1
+        self.bytes += size
+        self.status[status] = self.status.get(status, 0) + 1
+        if latency_ms is not None:
+            self.timed += 1
+            bucket = latency_bucket(latency_ms)
+            self.latency[bucket] = self.latency.get(bucket, 0) + 1
+            self.slow_urls.add(normalize_url(url), latency_ms, latency_ms)
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.bytes += other.bytes
+        self.timed += other.timed
+        for status, count in other.status.items():
+            self.status[status] = self.status.get(status, 0) + count
+        for bucket, count in other.latency.items():
+            self.latency[bucket] = self.latency.get(bucket, 0) + count
+        self.slow_urls.merge(other.slow_urls)
+
+    @classmethod
+    def from_row(cls, row):
+        stats = cls(minute_from_datetime(row.minute))
+        stats.requests = row.requests or 0
+        stats.bytes = row.bytes or 0
+        stats.timed = row.timed or 0
+        stats.status = json.loads(row.status) if row.status else {}
+        # JSON guarda las claves como texto
+        stats.latency = {int(k): v for k, v in json.loads(row.latency).items()} if row.latency else {}
+        stats.slow_urls.items = json.loads(row.slow_urls) if row.slow_urls else {}
+        return stats
+
+    def update_row(self, row):
+        row.requests = self.requests
+        row.bytes = self.bytes
+        row.timed = self.timed
+        row.status = json.dumps(self.status)
+        row.latency = json.dumps(self.latency)
+        row.slow_urls = json.dumps(self.slow_urls.items)
+
+    def to_dict(self):
+        classes = {}
+        for status, count in self.status.items():
+            key = f'{status[0]}xx'
+            classes[key] = classes.get(key, 0) + count
+        point = {
+            'timestamp': datetime.fromtimestamp(self.minute * 60, tz=timezone.utc).isoformat(),
+            'requests': self.requests,
+            'bytes': self.bytes,
+            'status': classes,
+        }
+        point.update(histogram_percentiles(self.latency))
+        return point
+
+
+class TrafficAnalytics:
+    """
+    Analítica incremental del access.log de nginx por dominio.
+
+    En el worker líder del separador de logs, cada línea nueva suma al minuto
+    correspondiente: cantidad de requests, bytes, códigos de estado,
+    histograma logarítmico de latencias y top de URLs lentas. Lo acumulado se
+    suma a la tabla traffic_minutes en la misma transacción que guarda la
+    posición del log, y las consultas de cualquier worker leen de ahí.
+    Se conservan `retention_minutes` minutos; sin posición guardada el líder
+    relee el log desde ese momento.
+    La latencia requiere el formato `panel_timing` (rt=$request_time); con
+    el formato combined el resto de las métricas funciona igual.
+    """
+
+    def __init__(self, demux=None, retention_minutes=None):
+        self.retention_minutes = retention_minutes or Config.TRAFFIC_RETENTION_MINUTES
+        self.demux = demux or get_nginx_log_demux()
+        self._pending = {}
+        self._last_prune = None
+        self._time_cache = (None, None)
+        self._lock = threading.Lock()
+        self.demux.add_listener('access', self._on_line, flush=self._flush, discard=self._discard)
+        self.demux.set_backfill('access', self._retention_start, self._line_epoch)
+
+    def _retention_start(self):
+        return time.time() - self.retention_minutes * 60
+
+    def _parse_time(self, value):
+        # Muchas líneas seguidas comparten el mismo segundo
+        cached_value, cached_epoch = self._time_cache
+        if value == cached_value:
+            return cached_epoch
+        epoch = datetime.strptime(value, '%d/%b/%Y:%H:%M:%S %z').timestamp()
+        self._time_cache = (value, epoch)
+        return epoch
+
+    def _line_epoch(self, line):
+        match = ACCESS_LINE_REGEX.match(line)
+        if not match:
+            return None
+        try:
+            return self._parse_time(match.group(1))
+        except ValueError:
+            return None
+
+    def _on_line(self, domain, line):
+        match = ACCESS_LINE_REGEX.match(line)
+        if not match:
+            return
+        time_local, _method, url, status, size, _host, request_time = match.groups()
+        try:
+            minute = int(self._parse_time(time_local) // 60)
+        except ValueError:
+            return
+        if minute <= int(time.time() // 60) - self.retention_minutes:
+            return
+        latency_ms = float(request_time) * 1000 if request_time else None
+
+        with self._lock:
+            stats = self._pending.get((domain, minute))
+            if stats is None:
+                stats = self._pending[(domain, minute)] = MinuteStats(minute)
+            stats.add(status, int(size) if size.isdigit() else 0, url, latency_ms)
+
+    def _flush(self):
+        """Suma lo acumulado a traffic_minutes (el commit lo hace el separador de logs)"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        by_domain = {}
+        for (domain, minute), stats in pending.items():
+            by_domain.setdefault(domain, {})[minute_to_datetime(minute)] = stats
+        for domain, minutes in by_domain.items():
+            rows = TrafficMinute.query.filter(
+                TrafficMinute.domain == domain,
+                TrafficMinute.minute.in_(list(minutes))
+            ).all()
+            existing = {row.minute: row for row in rows}
+            for minute, stats in minutes.items():
+                row = existing.get(minute)
+                if row is None:
+                    row = TrafficMinute(domain=domain, minute=minute)
+                    db.session.add(row)
+                else:
+                    stats.merge(MinuteStats.from_row(row))
+                stats.update_row(row)
+
+        current = int(time.time() // 60)
+        if self._last_prune != current:
+            TrafficMinute.query.filter(
+                TrafficMinute.minute <= minute_to_datetime(current - self.retention_minutes)
+            ).delete(synchronize_session=False)
+            self._last_prune = current
+
+    def _discard(self):
+        with self._lock:
+            self._pending = {}
+        self._last_prune = None
+
+    def get_traffic(self, domain, minutes=60, top=10):
+        """Serie por minuto y resumen de la ventana para un dominio"""
+        minutes = max(1, min(minutes, self.retention_minutes))
+        since = int(time.time() // 60) - minutes + 1
+
+        rows = TrafficMinute.query.filter(
+            TrafficMinute.domain == domain,
+            TrafficMinute.minute >= minute_to_datetime(since)
+        ).order_by(TrafficMinute.minute).all()
+        window = [MinuteStats.from_row(row) for row in rows]
+
+        series = [s.to_dict() for s in window]
+        latency = {}
+        status = {}
+        slow_urls = SpaceSaving()
+        requests = bytes_served = timed = 0
+        for stats in window:
+            requests += stats.requests
+            bytes_served += stats.bytes
+            timed += stats.timed
+            for bucket, count in stats.latency.items():
+                latency[bucket] = latency.get(bucket, 0) + count
+            for code, count in stats.status.items():
+                status[code] = status.get(code, 0) + count
+            slow_urls.merge(stats.slow_urls)
+
+        summary = {
+            'requests': requests,
+            'requests_per_min': round(requests / minutes, 2),
+            'bytes': bytes_served,
+            'status': dict(sorted(status.items())),
+            'timed_requests': timed,
+            'slow_urls': slow_urls.top(top),
+        }
+        summary.update(histogram_percentiles(latency))
+        return {'series': series, 'summary': summary}
+
+    def request_rates(self, domains, minutes=1):
+        """{dominio: requests por minuto} en los últimos `minutes` minutos completos"""
+        current = int(time.time() // 60)
+        rows = db.session.query(TrafficMinute.domain, func.sum(TrafficMinute.requests)).filter(
+            TrafficMinute.domain.in_(list(domains)),
+            TrafficMinute.minute >= minute_to_datetime(current - minutes),
+            TrafficMinute.minute < minute_to_datetime(current)
+        ).group_by(TrafficMinute.domain).all()
+        totals = {domain: total or 0 for domain, total in rows}
+        return {domain: round(totals.get(domain, 0) / minutes, 2) for domain in domains}
+
+    def request_rate(self, domain, minutes=1):
+        """Requests por minuto en los últimos `minutes` minutos completos"""
+        return self.request_rates([domain], minutes)[domain]
+
+
+_analytics = None
+_analytics_lock = threading.Lock()
+
+
+def get_traffic_analytics():
+    """Devuelve la analítica compartida por proceso"""
+    global _analytics
+    with _analytics_lock:
+        if _analytics is None:
+            _analytics = TrafficAnalytics()
+        return _analytics
@@ -1,9 +1,29 @@
 from app import create_app, init_db
+from services.metrics_recorder import start_metrics_recorder
+from services.log_index import start_log_indexer
+from services.job_runner import start_job_runner
+from services.backup_catalog import start_backup_catalog
+from services.nginx_log_demux import start_nginx_log_demux
 
 app = create_app()
 
 # Inicializar BD al arrancar
 init_db(app)
 
+# Grabador de métricas (cada worker lo arranca; solo el líder escribe)
+start_metrics_recorder(app)
+
+# Indexador de logs de Odoo (solo el líder indexa en segundo plano)
+start_log_indexer()
+
+# Supervisor de jobs (solo el líder despacha y recoge los procesos)
+start_job_runner(app)
+
+# Reconciliación del catálogo de backups con el disco (solo el líder)
+start_backup_catalog(app)
+
+# Separador de logs de nginx por dominio (solo el líder lee los logs)
+start_nginx_log_demux(app)
+
 if __name__ == '__main__':
     app.run()
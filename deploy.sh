@@ -213,6 +213,7 @@ Environment="PATH=$BACKEND_DIR/venv/bin"
 
 # Configuración de Gunicorn para archivos grandes y operaciones largas
 # -w 4: 4 workers (ajustar según CPU)
+# -k gthread --threads 8: hilos por worker; cada conexión a /api/metrics/stream (SSE) ocupa uno
 # -b 127.0.0.1:5000: bind a localhost
 # --timeout 600: timeout de 10 minutos para operaciones largas (backups)
 # --max-requests 1000: reiniciar workers después de 1000 requests
@@ -221,6 +222,8 @@ Environment="PATH=$BACKEND_DIR/venv/bin"
 # --limit-request-field_size 8190: límite de campo de header
 ExecStart=$BACKEND_DIR/venv/bin/gunicorn \\
     -w 4 \\
+    -k gthread \\
+    --threads 8 \\
     -b 127.0.0.1:5000 \\
     --timeout 600 \\
     --max-requests 1000 \\
@@ -271,6 +274,14 @@ echo "✅ Frontend construido"
 # 6. Configurar Nginx
 echo "🌐 Configurando Nginx..."
 
+# Formato de access log con host y tiempo de respuesta (analítica de tráfico del panel).
+# Las instancias lo usan con: access_log /var/log/nginx/access.log panel_timing;
+sudo tee /etc/nginx/conf.d/panel-log-format.conf > /dev/null <<'EOF'
+log_format panel_timing '$remote_addr - $remote_user [$time_local] "$request" '
+                        '$status $body_bytes_sent "$http_referer" "$http_user_agent" '
+                        'host=$host rt=$request_time';
+EOF
+
 # Crear configuración temporal HTTP para obtener certificado
 sudo tee /etc/nginx/sites-available/server-panel > /dev/null <<EOF
 server {
@@ -307,6 +318,15 @@ server {
         proxy_request_buffering off;
     }
 
+    # Descargas de backups: el backend valida y responde X-Accel-Redirect,
+    # nginx sirve el archivo con sendfile (Range, ETag, Last-Modified)
+    location /_protected_backups/ {
+        internal;
+        alias ${BACKUPS_PATH:-/home/mtg/backups}/;
+        sendfile on;
+        tcp_nopush on;
+    }
+
     # Health check
     location /health {
         proxy_pass http://127.0.0.1:5000;
@@ -339,10 +359,13 @@ else
   echo "✅ Certificado SSL ya existe"
 fi
 
-# 8. Crear cron job para guardar métricas cada minuto
-echo "⏰ Configurando cron job para métricas..."
-CRON_JOB="* * * * * curl -X POST http://localhost:5000/api/metrics/save >/dev/null 2>&1"
-(crontab -l 2>/dev/null | grep -v "/api/metrics/save"; echo "$CRON_JOB") | crontab -
+# 8. Métricas: el backend las graba en segundo plano (METRICS_RECORDER_ENABLED).
+# Quitar el cron de versiones anteriores para no duplicar muestras.
+echo "⏰ Configurando guardado de métricas..."
+(crontab -l 2>/dev/null | grep -v "/api/metrics/save") | crontab -
+# Los backups programados se encolan con backup_tool.py: regenerar las líneas de cron
+"$BACKEND_DIR/venv/bin/python" "$BACKEND_DIR/backup_tool.py" sync-cron || \
+    echo "⚠️ No se pudo regenerar el cron de backups"
 
 echo ""
 echo "✅ ¡Despliegue completado con éxito!"
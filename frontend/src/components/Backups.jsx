@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { backup } from '../lib/api';
+import { backup, startDownload } from '../lib/api';
 import { Database, Download, Trash2, RefreshCw, Settings, HardDrive, Calendar, Clock, AlertCircle, RotateCcw, AlertTriangle, CheckCircle2, XCircle, Upload, Power, Activity } from 'lucide-react';
 import Toast from './Toast';
 
@@ -124,17 +124,9 @@ export default function Backups() {
   const handleDownloadBackup = async (filename) => {
     setActionLoading({ [`download-${filename}`]: true });
     try {
-      const response = await backup.download(filename);
-      
-      // Crear URL del blob y descargar
-      const url = window.URL.createObjectURL(new Blob([response.data]));
-      const link = document.createElement('a');
-      link.href = url;
-      link.setAttribute('download', filename);
-      document.body.appendChild(link);
-      link.click();
-      link.remove();
-      window.URL.revokeObjectURL(url);
+      // Enlace firmado: el navegador descarga directo, sin pasar el archivo por memoria
+      const { data } = await backup.getDownloadUrl(filename);
+      startDownload(data.url, filename);
       
       setToast({ show: true, message: 'Descarga iniciada', type: 'success' });
     } catch (error) {
@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
-import { backupV2 } from '../lib/api';
+import { backupV2, uploadBackupResumable, followJobLog, startDownload } from '../lib/api';
 import { Server, Settings, Download, Trash2, RefreshCw, AlertCircle, Clock, HardDrive, Play, Pause, Database, Upload, Pencil } from 'lucide-react';
 import Toast from './Toast';
 
@@ -167,20 +167,24 @@ export default function BackupsV2() {
 
   const handleDownloadBackup = async (instanceName, filename) => {
     try {
-      const response = await backupV2.downloadBackup(instanceName, filename);
-      const url = window.URL.createObjectURL(new Blob([response.data]));
-      const link = document.createElement('a');
-      link.href = url;
-      link.setAttribute('download', filename);
-      document.body.appendChild(link);
-      link.click();
-      link.remove();
+      const { data } = await backupV2.getDownloadUrl(instanceName, filename);
+      startDownload(data.url, filename);
       setToast({ show: true, message: 'Descarga iniciada', type: 'success' });
     } catch (error) {
       setToast({ show: true, message: 'Error al descargar backup', type: 'error' });
     }
   };
 
+  const handleExportInstance = async (instanceName) => {
+    try {
+      const { data } = await backupV2.getExportUrl(instanceName);
+      startDownload(data.url, `${instanceName}_export.zip`);
+      setToast({ show: true, message: 'Exportación iniciada', type: 'success' });
+    } catch (error) {
+      setToast({ show: true, message: 'Error al exportar la instancia', type: 'error' });
+    }
+  };
+
   const handleDeleteBackup = async (instanceName, filename) => {
     if (!confirm(`¿Eliminar el backup ${filename}?`)) return;
     try {
@@ -217,17 +221,22 @@ export default function BackupsV2() {
   const handleUploadBackup = async (file, onProgress) => {
     const { instance } = showUploadModal;
     try {
-      const formData = new FormData();
-      formData.append('file', file);
-      
-      await backupV2.uploadBackup(instance, formData, onProgress);
-      setToast({ show: true, message: 'Backup subido exitosamente', type: 'success' });
+      // Upload por partes reanudable; la validación corre en un job
+      const { job_id: jobId } = await uploadBackupResumable(instance, file, onProgress);
+      setToast({ show: true, message: `Backup subido, validando (job #${jobId})`, type: 'success' });
       setShowUploadModal({ show: false, instance: null });
-      fetchInstances();
-      // Actualizar la lista de backups si está abierta
-      if (backupListModal.show && backupListModal.instance === instance) {
-        handleViewBackups(instance);
-      }
+      followJobLog(jobId, () => {}, (job) => {
+        setToast({
+          show: true,
+          message: job.status === 'success' ? 'Backup importado exitosamente' : 'Error al validar el backup subido',
+          type: job.status === 'success' ? 'success' : 'error'
+        });
+        fetchInstances();
+        // Actualizar la lista de backups si está abierta
+        if (backupListModal.show && backupListModal.instance === instance) {
+          handleViewBackups(instance);
+        }
+      });
     } catch (error) {
       setToast({ show: true, message: error.response?.data?.error || 'Error al subir backup', type: 'error' });
     }
@@ -276,7 +285,7 @@ export default function BackupsV2() {
       )}
 
       {configModal.show && <ConfigModal instance={configModal.instance} config={configModal.config} onClose={() => setConfigModal({ show: false, instance: null, config: null })} onSave={handleSaveConfig} onChange={(field, value) => setConfigModal({ ...configModal, config: { ...configModal.config, [field]: value } })} />}
-      {backupListModal.show && <BackupListModal instance={backupListModal.instance} backups={backupListModal.backups} onClose={() => setBackupListModal({ show: false, instance: null, backups: [] })} onDownload={handleDownloadBackup} onRestore={handleRestoreBackup} onDelete={handleDeleteBackup} onUpload={() => setShowUploadModal({ show: true, instance: backupListModal.instance })} onRename={handleRenameBackup} />}
+      {backupListModal.show && <BackupListModal instance={backupListModal.instance} backups={backupListModal.backups} onClose={() => setBackupListModal({ show: false, instance: null, backups: [] })} onDownload={handleDownloadBackup} onRestore={handleRestoreBackup} onDelete={handleDeleteBackup} onUpload={() => setShowUploadModal({ show: true, instance: backupListModal.instance })} onExport={handleExportInstance} onRename={handleRenameBackup} />}
       {restoreModal.show && <RestoreConfirmModal instance={restoreModal.instance} backup={restoreModal.backup} onClose={() => setRestoreModal({ show: false, instance: null, backup: null })} onConfirm={handleConfirmRestore} />}
       {showUploadModal.show && <UploadModal instance={showUploadModal.instance} onClose={() => setShowUploadModal({ show: false, instance: null })} onUpload={handleUploadBackup} />}
       {toast.show && <Toast message={toast.message} type={toast.type} onClose={() => setToast({ show: false, message: '', type: 'success' })} />}
@@ -430,7 +439,7 @@ function ConfigModal({ instance, config, onClose, onSave, onChange }) {
   );
 }
 
-function BackupListModal({ instance, backups, onClose, onDownload, onRestore, onDelete, onUpload, onRename }) {
+function BackupListModal({ instance, backups, onClose, onDownload, onRestore, onDelete, onUpload, onExport, onRename }) {
   return (
     <div className="fixed inset-0 bg-black bg-opacity-50 flex items-center justify-center z-50">
       <div className="bg-white dark:bg-gray-800 rounded-lg p-6 w-full max-w-4xl max-h-[90vh] overflow-y-auto">
@@ -476,6 +485,10 @@ function BackupListModal({ instance, backups, onClose, onDownload, onRestore, on
             <Upload className="w-4 h-4" />
             Subir Backup
           </button>
+          <button onClick={() => onExport(instance)} title="Descarga el estado actual sin guardar un backup en el servidor" className="flex-1 px-4 py-2 bg-blue-600 hover:bg-blue-700 text-white rounded-lg transition-colors flex items-center justify-center gap-2">
+            <Download className="w-4 h-4" />
+            Exportar en vivo
+          </button>
           <button onClick={onClose} className="flex-1 px-4 py-2 bg-gray-200 dark:bg-gray-700 text-gray-900 dark:text-white rounded-lg hover:bg-gray-300 dark:hover:bg-gray-600 transition-colors">Cerrar</button>
         </div>
       </div>
@@ -95,13 +95,31 @@ export default function Dashboard() {
     return () => clearInterval(interval);
   }, [rangeMinutes]);
 
+  // Métricas en vivo por SSE. Mientras el stream está caído (cada intento de
+  // reconexión fallido) se consulta la muestra actual para no mostrar datos viejos
+  useEffect(() => {
+    const closeStream = metrics.stream(
+      (data) => {
+        setCurrentMetrics(data);
+        setLoading(false);
+      },
+      async (error) => {
+        console.error('Error en stream de métricas:', error);
+        try {
+          const response = await metrics.getCurrent();
+          setCurrentMetrics(response.data);
+          setLoading(false);
+        } catch (fetchError) {
+          console.error('Error fetching current metrics:', fetchError);
+        }
+      }
+    );
+    return closeStream;
+  }, []);
+
   const fetchMetrics = async () => {
     try {
-      const [current, hist] = await Promise.all([
-        metrics.getCurrent(),
-        metrics.getHistory(rangeMinutes)
-      ]);
-      setCurrentMetrics(current.data);
+      const hist = await metrics.getHistory(rangeMinutes);
       setHistory(hist.data.metrics || []);
       setLoading(false);
     } catch (error) {
@@ -114,7 +114,7 @@ export default function Instances() {
         
         if (response.data.success) {
           // Usar hook para manejar el polling del log
-          startUpdatePolling(instanceName, action);
+          startUpdatePolling(instanceName, action, response.data.job_id);
           fetchInstances();
         }
       } else if (action === 'restart') {
@@ -204,7 +204,7 @@ export default function Instances() {
       const instanceName = response.data.instance_name || `dev-${newInstanceName}`;
       
       // Usar hook para manejar el polling del log
-      startCreationPolling(instanceName, false); // false = dev instance
+      startCreationPolling(instanceName, false, response.data.job_id); // false = dev instance
       
       setNewInstanceName('');
       setGitBranch('');
@@ -244,7 +244,7 @@ export default function Instances() {
       const instanceName = response.data.instance_name || `prod-${newProdInstanceName}`;
       
       // Usar hook para manejar el polling del log
-      startCreationPolling(instanceName, true); // true = production instance
+      startCreationPolling(instanceName, true, response.data.job_id); // true = production instance
       
       setNewProdInstanceName('');
       setOdooVersion('19');
@@ -43,6 +43,7 @@ export default function LogViewer({ instanceName, onClose }) {
   
   const logContainerRef = useRef(null);
   const autoRefreshRef = useRef(null);
+  const cursorRef = useRef(null);
 
   useEffect(() => {
     try {
@@ -122,6 +123,7 @@ export default function LogViewer({ instanceName, onClose }) {
         setLogs(data.lines);
         setStats(data.stats);
         setFileInfo(data.file_info);
+        cursorRef.current = data.cursor || null;
       } else {
         setError(data.error || 'Error al cargar logs');
       }
@@ -132,6 +134,58 @@ export default function LogViewer({ instanceName, onClose }) {
     }
   }, [instanceName, selectedLogType, linesCount, levelFilter, searchQuery]);
 
+  // Auto-refresh incremental: solo pide las líneas nuevas desde el último cursor
+  const fetchNewLines = useCallback(async () => {
+    const cursor = cursorRef.current;
+    if (!cursor) {
+      fetchLogs();
+      return;
+    }
+    try {
+      // systemd usa el cursor de journald; los archivos, inode + offset
+      const params = new URLSearchParams(
+        cursor.journal
+          ? { type: selectedLogType, cursor: cursor.journal }
+          : {
+              type: selectedLogType,
+              inode: cursor.inode.toString(),
+              offset: cursor.offset.toString(),
+            }
+      );
+      if (levelFilter) params.append('level', levelFilter);
+      if (searchQuery) params.append('search', searchQuery);
+
+      const response = await fetch(`/api/odoo-logs/tail/${instanceName}?${params}`, {
+        headers: { 'Authorization': `Bearer ${getToken()}` }
+      });
+      const data = await response.json();
+      if (!data.success) {
+        fetchLogs();
+        return;
+      }
+
+      cursorRef.current = data.cursor;
+      setFileInfo(data.file_info);
+      if (data.rotated) {
+        setLogs(data.lines.slice(-linesCount));
+        setStats(data.stats);
+        return;
+      }
+      if (data.lines.length === 0) return;
+
+      setLogs((prev) => [...prev, ...data.lines].slice(-linesCount));
+      setStats((prev) => {
+        const next = { ...prev };
+        Object.entries(data.stats).forEach(([key, value]) => {
+          next[key] = (next[key] || 0) + value;
+        });
+        return next;
+      });
+    } catch (err) {
+      console.error('Error fetching new log lines:', err);
+    }
+  }, [instanceName, selectedLogType, linesCount, levelFilter, searchQuery, fetchLogs]);
+
   useEffect(() => {
     fetchAvailableLogs();
   }, [fetchAvailableLogs]);
@@ -148,14 +202,14 @@ export default function LogViewer({ instanceName, onClose }) {
 
   useEffect(() => {
     if (autoRefresh) {
-      autoRefreshRef.current = setInterval(fetchLogs, 5000);
+      autoRefreshRef.current = setInterval(fetchNewLines, 5000);
     } else {
       if (autoRefreshRef.current) clearInterval(autoRefreshRef.current);
     }
     return () => {
       if (autoRefreshRef.current) clearInterval(autoRefreshRef.current);
     };
-  }, [autoRefresh, fetchLogs]);
+  }, [autoRefresh, fetchNewLines]);
 
   const handleSearch = (e) => {
     e.preventDefault();
@@ -1,5 +1,5 @@
 import { useState, useEffect, useRef } from 'react';
-import { instances } from '../../../lib/api';
+import { instances, followJobLog } from '../../../lib/api';
 
 /**
  * Hook para manejar el log de creación de instancias con polling
@@ -7,6 +7,7 @@ import { instances } from '../../../lib/api';
 export function useCreationLog() {
   const [creationLog, setCreationLog] = useState({ show: false, instanceName: '', log: '' });
   const creationLogRef = useRef(null);
+  const stopFollowRef = useRef(null);
 
   // Auto-scroll cuando el log cambia
   useEffect(() => {
@@ -22,10 +23,11 @@ export function useCreationLog() {
         clearInterval(window._pollingInterval);
         window._pollingInterval = null;
       }
+      if (stopFollowRef.current) stopFollowRef.current();
     };
   }, []);
 
-  const startPolling = (instanceName, isProduction = false) => {
+  const startPolling = (instanceName, isProduction = false, jobId = null) => {
     setCreationLog({ 
       show: true, 
       instanceName, 
@@ -34,6 +36,15 @@ export function useCreationLog() {
 
     // Limpiar polling anterior si existe
     if (window._pollingInterval) clearInterval(window._pollingInterval);
+    if (stopFollowRef.current) stopFollowRef.current();
+
+    // Con job_id se sigue el log de forma incremental (long-poll)
+    if (jobId) {
+      stopFollowRef.current = followJobLog(jobId, (chunk) => {
+        setCreationLog(prev => ({ ...prev, log: prev.log + chunk }));
+      });
+      return;
+    }
 
     // Intervalo de polling (3s para producción, 2s para dev)
     const interval = isProduction ? 3000 : 2000;
@@ -51,14 +62,15 @@ export function useCreationLog() {
               : (newLog === "" ? prev.log : newLog)
         }));
 
-        // Detectar finalización
+        // Detectar finalización (estado del job o mensajes del script)
         const finishMessages = [
           '✅ Instancia de desarrollo creada con éxito',
           '✅ ¡INSTANCIA CREADA EXITOSAMENTE!',
           'Instancia creada con éxito'
         ];
 
-        if (logResponse.data.log && finishMessages.some(msg => logResponse.data.log.includes(msg))) {
+        const finished = logResponse.data.finished || logResponse.data.error;
+        if (finished || (newLog && finishMessages.some(msg => newLog.includes(msg)))) {
           clearInterval(window._pollingInterval);
           window._pollingInterval = null;
         }
@@ -73,6 +85,10 @@ export function useCreationLog() {
       clearInterval(window._pollingInterval);
       window._pollingInterval = null;
     }
+    if (stopFollowRef.current) {
+      stopFollowRef.current();
+      stopFollowRef.current = null;
+    }
     setCreationLog({ show: false, instanceName: '', log: '' });
   };
 
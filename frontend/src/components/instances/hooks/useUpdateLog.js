@@ -1,5 +1,5 @@
 import { useState, useEffect, useRef } from 'react';
-import { instances } from '../../../lib/api';
+import { instances, followJobLog } from '../../../lib/api';
 
 /**
  * Hook para manejar el log de actualización de instancias con polling
@@ -13,6 +13,7 @@ export function useUpdateLog() {
     completed: false 
   });
   const updateLogRef = useRef(null);
+  const stopFollowRef = useRef(null);
 
   // Auto-scroll cuando el log cambia
   useEffect(() => {
@@ -21,8 +22,19 @@ export function useUpdateLog() {
     }
   }, [updateLog.log]);
 
-  const startPolling = (instanceName, action) => {
+  const startPolling = (instanceName, action, jobId = null) => {
     setUpdateLog({ show: true, instanceName, action, log: '', completed: false });
+    if (stopFollowRef.current) stopFollowRef.current();
+
+    // Con job_id se sigue el log de forma incremental (long-poll)
+    if (jobId) {
+      stopFollowRef.current = followJobLog(
+        jobId,
+        (chunk) => setUpdateLog(prev => ({ ...prev, log: prev.log + chunk })),
+        () => setUpdateLog(prev => ({ ...prev, completed: true }))
+      );
+      return stopFollowRef.current;
+    }
 
     const pollLog = async () => {
       try {
@@ -60,6 +72,10 @@ export function useUpdateLog() {
   };
 
   const closeLog = () => {
+    if (stopFollowRef.current) {
+      stopFollowRef.current();
+      stopFollowRef.current = null;
+    }
     setUpdateLog({ show: false, instanceName: '', action: '', log: '', completed: false });
   };
 
@@ -6,6 +6,10 @@ const API_URL = import.meta.env.MODE === 'production'
   ? '' 
   : (import.meta.env.VITE_API_URL || 'http://localhost:5000');
 
+// Espera entre reconexiones del stream de métricas
+const STREAM_RETRY_MIN_MS = 3000;
+const STREAM_RETRY_MAX_MS = 30000;
+
 const api = axios.create({
   timeout: 30000, // Timeout seguro para evitar requests colgados
   baseURL: API_URL,
@@ -59,6 +63,69 @@ export const metrics = {
   
   getHistory: (minutes = 60) => 
     api.get(`/api/metrics/history?minutes=${minutes}`),
+
+  // Stream SSE: recibe un snapshot y luego deltas que se mezclan sobre el estado actual.
+  // Cada conexión usa un enlace firmado de corta duración (no el JWT en la URL), así
+  // que ante cualquier error se cierra y se reconecta pidiendo uno nuevo, con espera
+  // creciente mientras siga fallando
+  stream: (onMetrics, onError) => {
+    let source = null;
+    let current = null;
+    let closed = false;
+    let retryTimer = null;
+    let retryDelay = STREAM_RETRY_MIN_MS;
+
+    const merge = (target, delta) => {
+      const result = { ...target };
+      Object.entries(delta).forEach(([key, value]) => {
+        const isObject = value && typeof value === 'object' && !Array.isArray(value);
+        result[key] = isObject && result[key] ? merge(result[key], value) : value;
+      });
+      return result;
+    };
+
+    const scheduleReconnect = (error) => {
+      if (source) source.close();
+      source = null;
+      current = null;
+      if (closed) return;
+      if (onError) onError(error);
+      retryTimer = setTimeout(connect, retryDelay);
+      retryDelay = Math.min(retryDelay * 2, STREAM_RETRY_MAX_MS);
+    };
+
+    const connect = async () => {
+      try {
+        const response = await api.post('/api/metrics/stream-url');
+        if (closed) return;
+        source = new EventSource(`${API_URL}${response.data.url}`);
+      } catch (error) {
+        scheduleReconnect(error);
+        return;
+      }
+
+      source.addEventListener('snapshot', (event) => {
+        retryDelay = STREAM_RETRY_MIN_MS;
+        current = JSON.parse(event.data);
+        onMetrics(current);
+      });
+      source.addEventListener('delta', (event) => {
+        if (!current) return;
+        current = merge(current, JSON.parse(event.data));
+        onMetrics(current);
+      });
+      // También llega cuando el servidor cierra el stream al cumplir su duración máxima
+      source.onerror = scheduleReconnect;
+    };
+
+    connect();
+
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (source) source.close();
+    };
+  },
 };
 
 export const instances = {
@@ -110,6 +177,59 @@ export const instances = {
     api.get(`/api/instances/update-log/${encodeURIComponent(name)}/${encodeURIComponent(action)}`),
 };
 
+export const jobs = {
+  list: (params = {}) => {
+    const query = new URLSearchParams(params).toString();
+    return api.get(`/api/jobs?${query}`);
+  },
+  
+  get: (jobId) => 
+    api.get(`/api/jobs/${jobId}`),
+  
+  cancel: (jobId) => 
+    api.post(`/api/jobs/${jobId}/cancel`),
+  
+  // Long-poll: solo los bytes agregados desde `since`
+  getLog: (jobId, since = 0, wait = 0) => 
+    api.get(`/api/jobs/${jobId}/log?since=${since}&wait=${wait}`),
+};
+
+// Segundos que el servidor retiene cada long-poll (menos que el timeout de axios)
+const JOB_LOG_WAIT_SECONDS = 20;
+
+/**
+ * Sigue el log de un job pidiendo solo lo agregado desde el último offset.
+ * El servidor responde apenas hay datos nuevos o el job termina.
+ * Devuelve una función para dejar de seguirlo.
+ */
+export function followJobLog(jobId, onData, onFinish) {
+  let stopped = false;
+  let offset = 0;
+
+  const loop = async () => {
+    while (!stopped) {
+      try {
+        const { data } = await jobs.getLog(jobId, offset, JOB_LOG_WAIT_SECONDS);
+        if (stopped) return;
+        offset = data.next_offset;
+        if (data.data) onData(data.data, data.job);
+        if (data.finished && !data.has_more) {
+          if (onFinish) onFinish(data.job);
+          return;
+        }
+      } catch (error) {
+        console.error('Error siguiendo el log del job:', error);
+        await new Promise((resolve) => setTimeout(resolve, 3000));
+      }
+    }
+  };
+
+  loop();
+  return () => {
+    stopped = true;
+  };
+}
+
 export const logs = {
   list: (params = {}) => {
     const query = new URLSearchParams(params).toString();
@@ -130,6 +250,9 @@ export const backup = {
   download: (filename) => 
     api.get(`/api/backup/download/${filename}`, { responseType: 'blob' }),
   
+  getDownloadUrl: (filename) => 
+    api.post(`/api/backup/download-url/${encodeURIComponent(filename)}`),
+  
   delete: (filename) => 
     api.delete(`/api/backup/delete/${filename}`),
   
@@ -260,9 +383,30 @@ export const backupV2 = {
       responseType: 'blob'
     }),
   
+  // Enlace firmado de corta duración: lo descarga el navegador (reanudable)
+  getDownloadUrl: (instanceName, filename) => 
+    api.post(`/api/backup/v2/instances/${encodeURIComponent(instanceName)}/backups/${encodeURIComponent(filename)}/download-url`),
+  
+  // Exportación en vivo (dump + filestore en .zip, sin crear un backup en el servidor)
+  getExportUrl: (instanceName) => 
+    api.post(`/api/backup/v2/instances/${encodeURIComponent(instanceName)}/export-url`),
+  
   restoreBackup: (instanceName, filename) => 
     api.post(`/api/backup/v2/instances/${encodeURIComponent(instanceName)}/restore`, { filename }),
   
+  restorePointInTime: (instanceName, targetTime) => 
+    api.post(`/api/backup/v2/instances/${encodeURIComponent(instanceName)}/restore-pitr`, { target_time: targetTime }),
+  
+  // PITR (base backups + WAL archivado)
+  getPitrStatus: () => 
+    api.get('/api/backup/v2/pitr'),
+  
+  updatePitrConfig: (config) => 
+    api.put('/api/backup/v2/pitr/config', config),
+  
+  createBaseBackup: () => 
+    api.post('/api/backup/v2/pitr/base-backup'),
+  
   uploadBackup: (instanceName, formData, onProgress) => 
     api.post(`/api/backup/v2/instances/${encodeURIComponent(instanceName)}/upload`, formData, {
       headers: {
@@ -282,3 +426,133 @@ export const backupV2 = {
   getGlobalStats: () => 
     api.get('/api/backup/v2/stats'),
 };
+
+/**
+ * Descarga un archivo desde un enlace firmado del backend. El navegador
+ * gestiona la descarga (progreso, reanudación) sin cargarla en memoria.
+ */
+export function startDownload(url, filename) {
+  const link = document.createElement('a');
+  link.href = `${API_URL}${url}`;
+  link.setAttribute('download', filename);
+  document.body.appendChild(link);
+  link.click();
+  link.remove();
+}
+
+// Uploads por partes reanudables (las partes se escriben en su offset en el servidor)
+export const chunkedUpload = {
+  init: (instanceName, file, chunkSize) => 
+    api.post('/api/chunked-upload', {
+      instance_name: instanceName,
+      file_name: file.name,
+      file_size: file.size,
+      chunk_size: chunkSize
+    }),
+  
+  getStatus: (uploadId) => 
+    api.get(`/api/chunked-upload/${uploadId}`),
+  
+  putChunk: (uploadId, index, blob, sha256, onProgress) => 
+    api.put(`/api/chunked-upload/${uploadId}/chunks/${index}`, blob, {
+      headers: {
+        'Content-Type': 'application/octet-stream',
+        ...(sha256 ? { 'X-Chunk-Sha256': sha256 } : {})
+      },
+      timeout: 0,
+      onUploadProgress: onProgress
+    }),
+  
+  complete: (uploadId) => 
+    api.post(`/api/chunked-upload/${uploadId}/complete`),
+  
+  cancel: (uploadId) => 
+    api.delete(`/api/chunked-upload/${uploadId}`),
+};
+
+const UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024;
+const UPLOAD_PARALLEL_CHUNKS = 3;
+const UPLOAD_CHUNK_RETRIES = 3;
+
+async function sha256Hex(blob) {
+  // crypto.subtle solo existe en contextos seguros (https/localhost)
+  if (!window.crypto?.subtle) return null;
+  const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+  return Array.from(new Uint8Array(digest)).map((b) => b.toString(16).padStart(2, '0')).join('');
+}
+
+/**
+ * Sube un backup por partes, varias en paralelo. Si se corta, volver a
+ * llamarla con el mismo archivo retoma el upload: solo envía las partes que
+ * el servidor no tiene. Al terminar el servidor valida e importa el backup
+ * en un job; devuelve la respuesta de /complete ({job_id, ...}).
+ * onProgress recibe {loaded, total} como el onUploadProgress de axios.
+ */
+export async function uploadBackupResumable(instanceName, file, onProgress) {
+  const resumeKey = `chunked-upload:${instanceName}:${file.name}:${file.size}:${file.lastModified}`;
+  let status = null;
+
+  const savedId = localStorage.getItem(resumeKey);
+  if (savedId) {
+    try {
+      ({ data: status } = await chunkedUpload.getStatus(savedId));
+      if (status.completed) status = null;
+    } catch (error) {
+      status = null;
+    }
+  }
+  if (!status) {
+    const { data } = await chunkedUpload.init(instanceName, file, UPLOAD_CHUNK_SIZE);
+    status = { ...data, received_chunks: [] };
+    localStorage.setItem(resumeKey, status.upload_id);
+  }
+
+  const { upload_id: uploadId, chunk_size: chunkSize, total_chunks: totalChunks } = status;
+  const received = new Set(status.received_chunks);
+  const pending = [];
+  for (let index = 0; index < totalChunks; index++) {
+    if (!received.has(index)) pending.push(index);
+  }
+
+  // Bytes confirmados + bytes en vuelo de cada parte
+  let confirmed = status.received_bytes || 0;
+  const inFlight = {};
+  const report = () => {
+    if (!onProgress) return;
+    const loaded = confirmed + Object.values(inFlight).reduce((sum, value) => sum + value, 0);
+    onProgress({ loaded: Math.min(loaded, file.size), total: file.size });
+  };
+  report();
+
+  const sendChunk = async (index) => {
+    const blob = file.slice(index * chunkSize, Math.min((index + 1) * chunkSize, file.size));
+    const sha256 = await sha256Hex(blob);
+    for (let attempt = 1; ; attempt++) {
+      try {
+        await chunkedUpload.putChunk(uploadId, index, blob, sha256, (event) => {
+          inFlight[index] = event.loaded;
+          report();
+        });
+        delete inFlight[index];
+        confirmed += blob.size;
+        report();
+        return;
+      } catch (error) {
+        delete inFlight[index];
+        if (attempt >= UPLOAD_CHUNK_RETRIES || error.response?.status === 404) throw error;
+        await new Promise((resolve) => setTimeout(resolve, 1000 * attempt));
+      }
+    }
+  };
+
+  const worker = async () => {
+    while (pending.length) {
+      await sendChunk(pending.shift());
+    }
+  };
+  await Promise.all(Array.from({ length: Math.min(UPLOAD_PARALLEL_CHUNKS, pending.length) }, worker));
+
+  const { data } = await chunkedUpload.complete(uploadId);
+  localStorage.removeItem(resumeKey);
+  return data;
+}
@@ -4,6 +4,9 @@ export PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin
 # 💾 Script de backup para una instancia específica de Odoo
 # Compatible con formato estándar de Odoo Online
 # Estructura: backup.tar.gz contiene dump.sql + filestore/
+# Con BACKUP_DUMP_FORMAT=directory contiene dump/ (pg_dump -Fd) + filestore/
+# Con BACKUP_FILESTORE_MODE=store el filestore va al almacén deduplicado
+# y el backup lleva al lado el manifiesto <archivo>.filestore.json
 
 set -e
 
@@ -33,22 +36,28 @@ mkdir -p "$INSTANCE_BACKUP_DIR"
 # Leer configuración de la instancia (si existe)
 if [ -f "$CONFIG_FILE" ]; then
   RETENTION_DAYS=$(jq -r '.retention_days // 7' "$CONFIG_FILE" 2>/dev/null || echo "7")
-  AUTO_ENABLED=$(jq -r '.auto_backup_enabled // true' "$CONFIG_FILE" 2>/dev/null || echo "true")
+  DUMP_FORMAT=$(jq -r '.dump_format // empty' "$CONFIG_FILE" 2>/dev/null || true)
+  FILESTORE_MODE=$(jq -r '.filestore_mode // empty' "$CONFIG_FILE" 2>/dev/null || true)
 else
   RETENTION_DAYS=7
-  AUTO_ENABLED=true
 fi
 
-# Verificar si el backup automático está habilitado (solo para cron)
-if [ "$AUTO_ENABLED" != "true" ] && [ -t 0 ]; then
-  # Si se ejecuta desde terminal (manual), permitir
-  :
-elif [ "$AUTO_ENABLED" != "true" ]; then
-  # Si se ejecuta desde cron y está deshabilitado, salir
-  echo "⏸️  Backup automático deshabilitado para $INSTANCE_NAME"
-  exit 0
+# Formato del dump: config de la instancia > .env > sql
+DUMP_FORMAT="${DUMP_FORMAT:-${BACKUP_DUMP_FORMAT:-sql}}"
+DUMP_JOBS="${BACKUP_DUMP_JOBS:-$(nproc 2>/dev/null || echo 2)}"
+if [ "$DUMP_FORMAT" != "sql" ] && [ "$DUMP_FORMAT" != "directory" ]; then
+  echo "❌ Error: Formato de dump inválido: $DUMP_FORMAT (sql|directory)"
+  exit 1
 fi
 
+# Filestore: archive (copia completa dentro del .tar.gz) o store (almacén
+# deduplicado + manifiesto <archivo>.filestore.json junto al backup)
+FILESTORE_MODE="${FILESTORE_MODE:-${BACKUP_FILESTORE_MODE:-archive}}"
+BACKUP_TOOL=("$PROJECT_ROOT/backend/venv/bin/python" "$PROJECT_ROOT/backend/backup_tool.py")
+
+# auto_backup_enabled lo revisa `backup_tool.py enqueue-backup` (cron) antes
+# de encolar: acá siempre se hace el backup pedido
+
 # Obtener información de la instancia
 DB_NAME="$INSTANCE_NAME"
 FILESTORE_PATH="$FILESTORE_BASE/$DB_NAME"
@@ -75,47 +84,124 @@ echo "   Base de datos: $DB_NAME"
 echo "   Timestamp: $TIMESTAMP"
 echo ""
 
-# Crear directorio temporal para este backup
+# Directorio temporal para el dump (el filestore se empaqueta directo, sin copiarlo)
 mkdir -p "$BACKUP_PATH"
-
-# 1. Backup de la base de datos (dump.sql sin comprimir, como Odoo Online)
-echo "🗄️  Creando dump de base de datos..."
-if sudo -u postgres pg_dump "$DB_NAME" > "$BACKUP_PATH/dump.sql" 2>/dev/null; then
-  DB_SIZE=$(du -h "$BACKUP_PATH/dump.sql" | cut -f1)
-  echo "✅ Base de datos: $DB_SIZE"
+cleanup() {
+  sudo rm -rf "$BACKUP_PATH" 2>/dev/null || rm -rf "$BACKUP_PATH"
+}
+trap cleanup EXIT
+
+# 1. Backup de la base de datos
+if [ "$DUMP_FORMAT" = "directory" ]; then
+  # Formato directorio: un archivo por tabla, volcado en paralelo y comprimido
+  # por pg_dump (zstd desde PostgreSQL 16, gzip en versiones anteriores)
+  PG_MAJOR=$(pg_dump --version | grep -oE '[0-9]+' | head -1)
+  if [ "${PG_MAJOR:-0}" -ge 16 ]; then
+    DUMP_COMPRESS="zstd:3"
+  else
+    DUMP_COMPRESS="6"
+  fi
+  echo "🗄️  Creando dump de base de datos (directorio, $DUMP_JOBS procesos, compresión $DUMP_COMPRESS)..."
+  # pg_dump corre como postgres y escribe el directorio del dump: se lanza
+  # desde dentro de $BACKUP_PATH (ruta relativa) para no depender de que
+  # postgres pueda atravesar los directorios padre de BACKUPS_PATH
+  sudo chown postgres "$BACKUP_PATH"
+  if (cd "$BACKUP_PATH" && sudo -u postgres pg_dump -Fd -j "$DUMP_JOBS" -Z "$DUMP_COMPRESS" -f dump "$DB_NAME" 2>/dev/null); then
+    sudo chown -R "$(id -u):$(id -g)" "$BACKUP_PATH"
+    # pg_dump crea dump/ con modo 0700: se normaliza para que el tar se pueda
+    # extraer y leer con pg_restore como postgres al restaurar
+    chmod -R a+rX "$BACKUP_PATH/dump"
+    DB_SIZE=$(du -sh "$BACKUP_PATH/dump" | cut -f1)
+    DB_SIZE_BYTES=$(du -sb "$BACKUP_PATH/dump" | cut -f1)
+    DUMP_ENTRY="dump"
+    echo "✅ Base de datos: $DB_SIZE"
+  else
+    echo "❌ Error al crear dump de base de datos"
+    exit 1
+  fi
 else
-  echo "❌ Error al crear dump de base de datos"
-  rm -rf "$BACKUP_PATH"
-  exit 1
+  # dump.sql sin comprimir, como Odoo Online
+  echo "🗄️  Creando dump de base de datos..."
+  if sudo -u postgres pg_dump "$DB_NAME" > "$BACKUP_PATH/dump.sql" 2>/dev/null; then
+    DB_SIZE=$(du -h "$BACKUP_PATH/dump.sql" | cut -f1)
+    DB_SIZE_BYTES=$(du -sb "$BACKUP_PATH/dump.sql" | cut -f1)
+    DUMP_ENTRY="dump.sql"
+    echo "✅ Base de datos: $DB_SIZE"
+  else
+    echo "❌ Error al crear dump de base de datos"
+    exit 1
+  fi
 fi
 
-# 2. Copiar filestore (estructura de carpetas, como Odoo Online)
-if [ -d "$FILESTORE_PATH" ]; then
-  echo "📁 Copiando filestore..."
-  cp -r "$FILESTORE_PATH" "$BACKUP_PATH/filestore"
-  FILE_COUNT=$(find "$BACKUP_PATH/filestore" -type f 2>/dev/null | wc -l)
-  FS_SIZE=$(du -sh "$BACKUP_PATH/filestore" 2>/dev/null | cut -f1)
-  echo "✅ Filestore: $FS_SIZE ($FILE_COUNT archivos)"
+# 2. Filestore: se agrega al tar desde su ubicación, renombrado a filestore/,
+# o se guarda en el almacén deduplicado (solo se copian los adjuntos nuevos)
+FILESTORE_ARGS=()
+if [ -d "$FILESTORE_PATH" ] && [ "$FILESTORE_MODE" = "store" ]; then
+  FILE_COUNT=$(find "$FILESTORE_PATH" -type f 2>/dev/null | wc -l)
+  FS_SIZE=$(du -sh "$FILESTORE_PATH" 2>/dev/null | cut -f1)
+  FS_SIZE_BYTES=$(du -sb "$FILESTORE_PATH" 2>/dev/null | cut -f1)
+  echo "📁 Guardando filestore en el almacén deduplicado..."
+  if ! "${BACKUP_TOOL[@]}" store "$FILESTORE_PATH" "$INSTANCE_BACKUP_DIR/${BACKUP_NAME}.tar.gz"; then
+    echo "❌ Error al guardar el filestore en el almacén"
+    exit 1
+  fi
+elif [ -d "$FILESTORE_PATH" ]; then
+  FILE_COUNT=$(find "$FILESTORE_PATH" -type f 2>/dev/null | wc -l)
+  FS_SIZE=$(du -sh "$FILESTORE_PATH" 2>/dev/null | cut -f1)
+  FS_SIZE_BYTES=$(du -sb "$FILESTORE_PATH" 2>/dev/null | cut -f1)
+  echo "📁 Filestore: $FS_SIZE ($FILE_COUNT archivos)"
+  FILESTORE_ARGS=(-C "$FILESTORE_BASE" --transform "s,^$DB_NAME\(/\|\$\),filestore\1," "$DB_NAME")
 else
   echo "⚠️  No se encontró filestore en $FILESTORE_PATH"
   mkdir -p "$BACKUP_PATH/filestore"
+  FILESTORE_ARGS=(-C "$BACKUP_PATH" filestore)
   FILE_COUNT=0
   FS_SIZE="0"
+  FS_SIZE_BYTES=0
 fi
 
-# 3. Comprimir todo en formato estándar Odoo
-echo "📦 Creando archivo tar.gz..."
+# 3. Comprimir todo en formato estándar Odoo (gzip en paralelo con pigz si está)
+if command -v pigz >/dev/null 2>&1; then
+  COMPRESSOR=(pigz -p "$DUMP_JOBS")
+else
+  COMPRESSOR=(gzip)
+fi
+echo "📦 Creando archivo tar.gz (${COMPRESSOR[0]})..."
 cd "$INSTANCE_BACKUP_DIR"
-tar -czf "${BACKUP_NAME}.tar.gz" -C "$BACKUP_NAME" .
-rm -rf "$BACKUP_PATH"
+# El SHA-256 se calcula en el mismo pipeline, sin releer el archivo
+set -o pipefail
+if ! tar -cf - -C "$BACKUP_PATH" "$DUMP_ENTRY" "${FILESTORE_ARGS[@]}" | "${COMPRESSOR[@]}" \
+    | tee "${BACKUP_NAME}.tar.gz.part" | sha256sum | cut -d' ' -f1 > "$BACKUP_PATH/checksum"; then
+  echo "❌ Error al crear el archivo del backup"
+  rm -f "${BACKUP_NAME}.tar.gz.part"
+  "${BACKUP_TOOL[@]}" release "$INSTANCE_BACKUP_DIR/${BACKUP_NAME}.tar.gz" >/dev/null 2>&1 || true
+  exit 1
+fi
+set +o pipefail
+CHECKSUM=$(cat "$BACKUP_PATH/checksum")
+TOTAL_SIZE=$(du -h "${BACKUP_NAME}.tar.gz.part" | cut -f1)
+TOTAL_SIZE_BYTES=$(stat -c%s "${BACKUP_NAME}.tar.gz.part" 2>/dev/null || stat -f%z "${BACKUP_NAME}.tar.gz.part")
+
+# Metadatos para el catálogo del panel (antes del mv: el archivo nunca queda sin ellos)
+STORED_MODE="archive"
+[ -f "${BACKUP_NAME}.tar.gz.filestore.json" ] && STORED_MODE="store"
+printf '{"created_at": "%s", "size_bytes": %s, "checksum_sha256": "%s", "db_size_bytes": %s, "filestore_size_bytes": %s, "dump_format": "%s", "filestore_mode": "%s", "source": "backup"}\n' \
+  "$(date '+%Y-%m-%d %H:%M:%S')" "$TOTAL_SIZE_BYTES" "$CHECKSUM" "${DB_SIZE_BYTES:-0}" "${FS_SIZE_BYTES:-0}" \
+  "$DUMP_FORMAT" "$STORED_MODE" > "${BACKUP_NAME}.tar.gz.meta.json"
+mv "${BACKUP_NAME}.tar.gz.part" "${BACKUP_NAME}.tar.gz"
+cleanup
 
-TOTAL_SIZE=$(du -h "${BACKUP_NAME}.tar.gz" | cut -f1)
-TOTAL_SIZE_BYTES=$(stat -c%s "${BACKUP_NAME}.tar.gz" 2>/dev/null || stat -f%z "${BACKUP_NAME}.tar.gz")
 echo "✅ Backup completado: ${BACKUP_NAME}.tar.gz ($TOTAL_SIZE)"
 
 # 4. Limpiar backups antiguos según retención
 echo "🧹 Limpiando backups antiguos (retención: $RETENTION_DAYS días)..."
-find "$INSTANCE_BACKUP_DIR" -name "*.tar.gz" -type f -mtime +$RETENTION_DAYS -delete 2>/dev/null
+# Los backups con manifiesto liberan sus adjuntos del almacén antes de borrarse
+find "$INSTANCE_BACKUP_DIR" -name "*.tar.gz" -type f -mtime +$RETENTION_DAYS 2>/dev/null | while read -r OLD_BACKUP; do
+  if [ -f "$OLD_BACKUP.filestore.json" ]; then
+    "${BACKUP_TOOL[@]}" release "$OLD_BACKUP" || continue
+  fi
+  rm -f "$OLD_BACKUP" "$OLD_BACKUP.meta.json"
+done
 REMAINING=$(ls -1 "$INSTANCE_BACKUP_DIR"/*.tar.gz 2>/dev/null | wc -l)
 echo "✅ Backups restantes: $REMAINING"
 
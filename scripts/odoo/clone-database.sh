@@ -0,0 +1,250 @@
+#!/bin/bash
+export PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin
+
+# 🧬 Clona una base de datos de Odoo (producción → desarrollo)
+# Estrategias:
+#   backup    Restaura el dump de un backup reciente (pg_restore -j), sin tocar producción
+#   parallel  pg_dump -Fd -j a un directorio temporal + pg_restore -j
+#   pipe      pg_dump | psql en streaming, sin archivo intermedio
+#   template  CREATE DATABASE ... TEMPLATE: copia de archivos dentro del cluster.
+#             Requiere que el origen no tenga conexiones: espera a que no haya
+#             transacciones en curso, bloquea conexiones nuevas durante la copia
+#             y cierra las inactivas. Corta producción: solo con CLONE_STRATEGY=template
+#             y para bases de hasta CLONE_TEMPLATE_MAX_MB
+# Con CLONE_STRATEGY=auto (default) se usan en orden las que no afectan al
+# origen (backup, parallel, pipe); si una falla se pasa a la siguiente.
+
+set -e
+
+SOURCE_DB="$1"
+TARGET_DB="$2"
+OWNER="${3:-}"
+BACKUP_FILE="${4:-}"
+
+if [ -z "$SOURCE_DB" ] || [ -z "$TARGET_DB" ]; then
+  echo "❌ Error: Debe especificar la base de origen y la de destino"
+  echo "Uso: $0 <source_db> <target_db> [owner] [backup_file]"
+  exit 1
+fi
+
+# Cargar variables de entorno
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+source "$SCRIPT_DIR/../utils/load-env.sh"
+source "$SCRIPT_DIR/../utils/pg-restore.sh"
+
+OWNER="${OWNER:-${DB_USER:-go}}"
+CLONE_STRATEGY="${CLONE_STRATEGY:-auto}"
+CLONE_TEMPLATE_MAX_MB="${CLONE_TEMPLATE_MAX_MB:-2048}"
+CLONE_TEMPLATE_DRAIN_SECONDS="${CLONE_TEMPLATE_DRAIN_SECONDS:-15}"
+CLONE_PARALLEL_MIN_MB="${CLONE_PARALLEL_MIN_MB:-1024}"
+CLONE_JOBS="${BACKUP_DUMP_JOBS:-$(nproc 2>/dev/null || echo 2)}"
+# Mismos ajustes de sesión que restore-instance.sh para la carga
+RESTORE_PGOPTIONS="-c maintenance_work_mem=${RESTORE_MAINTENANCE_WORK_MEM:-1GB} -c synchronous_commit=off"
+WORK_DIR="${CLONE_WORK_DIR:-/tmp}/odoo-clone-$TARGET_DB-$$"
+
+if [ "$SOURCE_DB" = "$TARGET_DB" ]; then
+  echo "❌ Error: La base de origen y la de destino son la misma"
+  exit 1
+fi
+
+pg_sql() {
+  sudo -u postgres psql -X -q -t -A -v ON_ERROR_STOP=1 -d postgres -c "$1"
+}
+
+SOURCE_CONNECTIONS_BLOCKED=false
+cleanup() {
+  if [ "$SOURCE_CONNECTIONS_BLOCKED" = true ]; then
+    pg_sql "ALTER DATABASE \"$SOURCE_DB\" WITH ALLOW_CONNECTIONS true;" >/dev/null 2>&1 || true
+  fi
+  sudo rm -rf "$WORK_DIR" 2>/dev/null || rm -rf "$WORK_DIR"
+}
+trap cleanup EXIT
+
+if [ "$(pg_sql "SELECT 1 FROM pg_database WHERE datname = '$SOURCE_DB';")" != "1" ]; then
+  echo "❌ Error: No existe la base de datos de origen: $SOURCE_DB"
+  exit 1
+fi
+
+SOURCE_MB=$(( $(pg_sql "SELECT pg_database_size('$SOURCE_DB');") / 1024 / 1024 ))
+PG_VERSION_NUM=$(pg_sql "SHOW server_version_num;")
+
+drop_target() {
+  pg_sql "SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = '$TARGET_DB';" >/dev/null 2>&1 || true
+  sudo -u postgres dropdb --if-exists "$TARGET_DB"
+}
+
+create_empty_target() {
+  drop_target || return 1
+  sudo -u postgres createdb "$TARGET_DB" -O "$OWNER" --encoding='UTF8' || return 1
+  sudo -u postgres psql -X -q -d "$TARGET_DB" -c "CREATE EXTENSION IF NOT EXISTS vector;" >/dev/null 2>&1 || true
+}
+
+# Directorio de trabajo: postgres lo lee (pg_restore) o escribe (pg_dump)
+# desde dentro, con ruta relativa, para no atravesar los directorios padre
+prepare_work_dir() {
+  mkdir -p "$WORK_DIR" && chmod 755 "$WORK_DIR"
+}
+
+clone_template() {
+  if [ "$SOURCE_MB" -gt "$CLONE_TEMPLATE_MAX_MB" ]; then
+    echo "   ⏭️  Origen de ${SOURCE_MB}MB: supera CLONE_TEMPLATE_MAX_MB (${CLONE_TEMPLATE_MAX_MB}MB)"
+    return 1
+  fi
+
+  # No se corta trabajo en curso: esperar a que el origen solo tenga conexiones inactivas
+  local waited=0
+  while [ "$(pg_sql "SELECT count(*) FROM pg_stat_activity WHERE datname = '$SOURCE_DB' AND state <> 'idle' AND pid <> pg_backend_pid();")" != "0" ]; do
+    if [ "$waited" -ge "$CLONE_TEMPLATE_DRAIN_SECONDS" ]; then
+      echo "   ⏭️  El origen sigue con transacciones en curso tras ${CLONE_TEMPLATE_DRAIN_SECONDS}s"
+      return 1
+    fi
+    sleep 1
+    waited=$((waited + 1))
+  done
+
+  # FILE_COPY (PostgreSQL 15+) copia los archivos sin escribir toda la base al WAL
+  local strategy_clause=""
+  if [ "${PG_VERSION_NUM:-0}" -ge 150000 ]; then
+    strategy_clause="STRATEGY = FILE_COPY"
+  fi
+
+  drop_target || return 1
+  SOURCE_CONNECTIONS_BLOCKED=true
+  pg_sql "ALTER DATABASE \"$SOURCE_DB\" WITH ALLOW_CONNECTIONS false;" >/dev/null || return 1
+  local status=1
+  for attempt in 1 2 3; do
+    pg_sql "SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = '$SOURCE_DB' AND pid <> pg_backend_pid();" >/dev/null
+    if pg_sql "CREATE DATABASE \"$TARGET_DB\" WITH TEMPLATE \"$SOURCE_DB\" OWNER \"$OWNER\" $strategy_clause;" >/dev/null; then
+      status=0
+      break
+    fi
+    sleep 1
+  done
+  pg_sql "ALTER DATABASE \"$SOURCE_DB\" WITH ALLOW_CONNECTIONS true;" >/dev/null && SOURCE_CONNECTIONS_BLOCKED=false
+  return $status
+}
+
+clone_backup() {
+  if [ -z "$BACKUP_FILE" ] || [ ! -f "$BACKUP_FILE" ]; then
+    echo "   ⏭️  Sin backup reciente del origen"
+    return 1
+  fi
+  echo "   Backup: $(basename "$BACKUP_FILE")"
+
+  prepare_work_dir || return 1
+  # Solo el dump: el filestore lo copia quien llama desde el origen
+  if [[ "$BACKUP_FILE" == *.zip ]]; then
+    unzip -q -o "$BACKUP_FILE" -x 'filestore/*' -d "$WORK_DIR" || return 1
+  elif command -v pigz >/dev/null 2>&1; then
+    tar -I pigz -xf "$BACKUP_FILE" -C "$WORK_DIR" --exclude=filestore || return 1
+  else
+    tar -xzf "$BACKUP_FILE" -C "$WORK_DIR" --exclude=filestore || return 1
+  fi
+
+  local dump_entry
+  if [ -f "$WORK_DIR/dump/toc.dat" ]; then
+    dump_entry="dump"
+  elif [ -f "$WORK_DIR/dump.dump" ]; then
+    dump_entry="dump.dump"
+  elif [ -f "$WORK_DIR/dump.sql" ] && [ "$(head -c 5 "$WORK_DIR/dump.sql")" = "PGDMP" ]; then
+    dump_entry="dump.sql"
+  else
+    echo "   ⏭️  El backup no tiene un dump para pg_restore"
+    return 1
+  fi
+
+  create_empty_target || return 1
+  load_dump "$dump_entry"
+}
+
+# Carga con pg_restore un dump extraído en $WORK_DIR por el usuario del panel
+load_dump() {
+  local log="$WORK_DIR.log" format=custom
+  [ "$1" = "dump" ] && format=directory
+  if ! restore_dump "$TARGET_DB" "$WORK_DIR" "$1" "$format" "$CLONE_JOBS" "$log"; then
+    echo "   ❌ Error en pg_restore:"
+    show_restore_errors "$log"
+    rm -f "$log"
+    return 1
+  fi
+  rm -f "$log"
+}
+
+clone_parallel() {
+  # Sin compresión costosa: el directorio es temporal y se borra al terminar
+  local pg_major compress
+  pg_major=$(pg_dump --version | grep -oE '[0-9]+' | head -1)
+  if [ "${pg_major:-0}" -ge 16 ]; then
+    compress="lz4"
+  else
+    compress="1"
+  fi
+
+  prepare_work_dir && sudo chown postgres "$WORK_DIR" || return 1
+  if ! (cd "$WORK_DIR" && sudo -u postgres pg_dump -Fd -j "$CLONE_JOBS" -Z "$compress" -f dump "$SOURCE_DB"); then
+    echo "   ❌ Error en pg_dump"
+    return 1
+  fi
+
+  # El dump es de postgres: se restaura desde ahí sin cambiar permisos
+  create_empty_target || return 1
+  local log="$WORK_DIR.log"
+  if ! (cd "$WORK_DIR" && sudo -u postgres env PGOPTIONS="$RESTORE_PGOPTIONS" \
+      pg_restore -j "$CLONE_JOBS" -d "$TARGET_DB" dump >/dev/null 2>"$log"); then
+    echo "   ❌ Error en pg_restore:"
+    show_restore_errors "$log"
+    rm -f "$log"
+    return 1
+  fi
+  rm -f "$log"
+}
+
+clone_pipe() {
+  create_empty_target || return 1
+  # pg_dump y psql corren a la vez: la restauración avanza mientras se vuelca
+  set -o pipefail
+  sudo -u postgres pg_dump "$SOURCE_DB" | \
+    sudo -u postgres env PGOPTIONS="$RESTORE_PGOPTIONS" psql -X -q -d "$TARGET_DB" >/dev/null 2>&1
+  local status=$?
+  set +o pipefail
+  return $status
+}
+
+# psql tolera errores: comprobar que quedó una base de Odoo
+verify_target() {
+  odoo_database_ready "$TARGET_DB"
+}
+
+case "$CLONE_STRATEGY" in
+  auto)
+    # template no entra en auto: bloquea las conexiones de producción
+    STRATEGIES=(backup)
+    # En bases chicas el volcado en paralelo no compensa el paso por disco
+    if [ "$SOURCE_MB" -ge "$CLONE_PARALLEL_MIN_MB" ] && [ "$CLONE_JOBS" -gt 1 ]; then
+      STRATEGIES+=(parallel)
+    fi
+    STRATEGIES+=(pipe)
+    ;;
+  template|backup|parallel|pipe)
+    STRATEGIES=("$CLONE_STRATEGY")
+    ;;
+  *)
+    echo "❌ Error: CLONE_STRATEGY inválida: $CLONE_STRATEGY (auto, template, backup, parallel, pipe)"
+    exit 1
+    ;;
+esac
+
+echo "🧬 Clonando $SOURCE_DB (${SOURCE_MB}MB) → $TARGET_DB"
+START_TIME=$(date +%s)
+for strategy in "${STRATEGIES[@]}"; do
+  echo "   Estrategia: $strategy"
+  if "clone_$strategy" && verify_target; then
+    echo "✅ Base de datos clonada ($strategy) en $(( $(date +%s) - START_TIME ))s"
+    exit 0
+  fi
+  sudo rm -rf "$WORK_DIR" 2>/dev/null || rm -rf "$WORK_DIR"
+done
+
+echo "❌ Error: No se pudo clonar $SOURCE_DB"
+drop_target >/dev/null 2>&1 || true
+exit 1
@@ -75,6 +75,9 @@ AUTO_CONFIRM="${4:-${AUTO_CONFIRM:-false}}"
 APIDEV_SYSTEM_USER="${6:-}"
 APIDEV_ALLOWED_INSTANCES_CSV="${7:-}"
 
+# Backup reciente de producción para clonar la base sin volcarla (opcional, lo elige el panel)
+CLONE_BACKUP_FILE="${8:-}"
+
 if [[ -z "$PROD_INSTANCE" ]]; then
     # Si no se pasó como argumento, listar y preguntar
     echo ""
@@ -228,6 +231,12 @@ SERVICE="/etc/systemd/system/odoo19e-$INSTANCE_NAME.service"
 ODOO_CONF="$BASE_DIR/odoo.conf"
 ODOO_LOG="$BASE_DIR/odoo.log"
 NGINX_CONF="/etc/nginx/sites-available/$INSTANCE_NAME"
+
+# Access log con host y tiempo de respuesta si el formato del panel está instalado (deploy.sh)
+ACCESS_LOG_DIRECTIVE=""
+if [[ -f /etc/nginx/conf.d/panel-log-format.conf ]]; then
+    ACCESS_LOG_DIRECTIVE="access_log /var/log/nginx/access.log panel_timing;"
+fi
 INFO_FILE="$BASE_DIR/info-instancia.txt"
 VENV_DIR="$BASE_DIR/venv"
 APP_DIR="$BASE_DIR"
@@ -264,20 +273,9 @@ pip install -r "$BASE_DIR/odoo-server/requirements.txt"
 echo "📦 Instalando dependencias adicionales comunes..."
 pip install phonenumbers gevent greenlet
 
-# Clonar base de datos desde producción
+# Clonar base de datos desde producción (elige la estrategia más rápida disponible)
 echo "🗄️  Clonando base de datos desde producción..."
-echo "   Eliminando BD anterior si existe..."
-sudo -u postgres dropdb "$DB_NAME" 2>/dev/null || true
-echo "   Creando dump de $PROD_DB..."
-sudo -u postgres pg_dump "$PROD_DB" > "/tmp/${DB_NAME}_dump.sql"
-echo "   Creando base de datos $DB_NAME..."
-sudo -u postgres createdb "$DB_NAME" -O "$DB_USER" --encoding='UTF8'
-echo "   Instalando extensión vector..."
-sudo -u postgres psql -d "$DB_NAME" -c "CREATE EXTENSION IF NOT EXISTS vector;"
-echo "   Restaurando datos..."
-sudo -u postgres psql -d "$DB_NAME" < "/tmp/${DB_NAME}_dump.sql"
-rm -f "/tmp/${DB_NAME}_dump.sql"
-echo "✅ Base de datos clonada correctamente."
+"$SCRIPTS_PATH/odoo/clone-database.sh" "$PROD_DB" "$DB_NAME" "$DB_USER" "$CLONE_BACKUP_FILE"
 
 # Copiar filestore desde producción
 echo "📁 Copiando filestore (imágenes y archivos adjuntos)..."
@@ -441,6 +439,7 @@ if [ ! -f "/etc/letsencrypt/live/$DOMAIN/fullchain.pem" ]; then
 server {
     listen 80;
     server_name $DOMAIN;
+    $ACCESS_LOG_DIRECTIVE
 
     client_max_body_size 20M;
 
@@ -502,6 +501,7 @@ else
 
 server {
     server_name $DOMAIN;
+    $ACCESS_LOG_DIRECTIVE
 
     client_max_body_size 20M;
 
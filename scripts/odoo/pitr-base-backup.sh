@@ -0,0 +1,69 @@
+#!/bin/bash
+export PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin
+
+# 🕒 Base backup del cluster PostgreSQL para restauración a un punto en el tiempo
+# Junto con el WAL archivado (pitr-setup.sh) permite volver cualquier base a
+# cualquier momento posterior al base backup más antiguo que se conserva.
+# Estructura: <PITR_BASE_PATH>/<timestamp>/{base.tar.gz,pg_wal.tar.gz,backup.json}
+
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+source "$SCRIPT_DIR/../utils/load-env.sh"
+
+WAL_ARCHIVE="${PITR_WAL_ARCHIVE_PATH:-${BACKUPS_PATH:-/home/go/backups}/pitr/wal}"
+BASE_DIR="${PITR_BASE_PATH:-${BACKUPS_PATH:-/home/go/backups}/pitr/base}"
+RETENTION="${PITR_BASE_RETENTION:-2}"
+PG_BIN_DIR="${PG_BIN_DIR:-$(ls -d /usr/lib/postgresql/*/bin 2>/dev/null | sort -V | tail -1)}"
+
+if [ "$(sudo -u postgres psql -At -c "SHOW archive_mode;")" != "on" ]; then
+  echo "❌ Error: El archivado de WAL no está activo (ejecuta pitr-setup.sh)"
+  exit 1
+fi
+
+TIMESTAMP=$(date '+%Y%m%d_%H%M%S')
+TARGET_DIR="$BASE_DIR/$TIMESTAMP"
+STARTED_AT=$(date '+%Y-%m-%d %H:%M:%S')
+
+echo "🕒 Iniciando base backup del cluster..."
+echo "   Destino: $TARGET_DIR"
+
+sudo install -d -o postgres -g postgres -m 755 "$TARGET_DIR"
+# Checkpoint espaciado (por defecto) para no cargar la base en producción.
+# Ruta relativa: postgres no necesita atravesar los padres de BACKUPS_PATH
+if ! (cd "$TARGET_DIR" && sudo -u postgres pg_basebackup -D . -Ft -z -X stream); then
+  echo "❌ Error al crear el base backup"
+  sudo rm -rf "$TARGET_DIR"
+  exit 1
+fi
+FINISHED_AT=$(date '+%Y-%m-%d %H:%M:%S')
+
+# Forzar el archivado del segmento actual para que el backup sea restaurable ya
+sudo -u postgres psql -q -c "SELECT pg_switch_wal();" >/dev/null
+
+# Archivo .backup que marca el inicio del backup en el WAL (para limpiar segmentos viejos)
+WAL_LABEL=$(ls -1t "$WAL_ARCHIVE"/*.backup 2>/dev/null | head -1 | xargs -r basename)
+SIZE_BYTES=$(du -sb "$TARGET_DIR" | cut -f1)
+
+printf '{"started_at": "%s", "finished_at": "%s", "wal_label": "%s", "size_bytes": %s}\n' \
+  "$STARTED_AT" "$FINISHED_AT" "$WAL_LABEL" "$SIZE_BYTES" | sudo -u postgres tee "$TARGET_DIR/backup.json" >/dev/null
+
+echo "✅ Base backup completado: $(du -sh "$TARGET_DIR" | cut -f1)"
+
+# Retención: conservar los últimos N base backups y el WAL desde el más antiguo
+echo "🧹 Limpiando base backups antiguos (se conservan $RETENTION)..."
+ls -1d "$BASE_DIR"/*/ 2>/dev/null | sort -r | tail -n +$((RETENTION + 1)) | while read -r OLD_BASE; do
+  echo "   Eliminando $(basename "$OLD_BASE")"
+  sudo rm -rf "$OLD_BASE"
+done
+
+OLDEST_BASE=$(ls -1d "$BASE_DIR"/*/ 2>/dev/null | sort | head -1)
+OLDEST_LABEL=$(jq -r '.wal_label // empty' "$OLDEST_BASE/backup.json" 2>/dev/null || true)
+if [ -n "$OLDEST_LABEL" ] && [ -f "$WAL_ARCHIVE/$OLDEST_LABEL" ]; then
+  echo "🧹 Eliminando WAL anterior a $OLDEST_LABEL..."
+  sudo -u postgres "$PG_BIN_DIR/pg_archivecleanup" "$WAL_ARCHIVE" "$OLDEST_LABEL"
+fi
+
+WAL_COUNT=$(ls -1 "$WAL_ARCHIVE" 2>/dev/null | wc -l)
+WAL_SIZE=$(du -sh "$WAL_ARCHIVE" 2>/dev/null | cut -f1)
+echo "✅ WAL archivado: $WAL_COUNT segmentos ($WAL_SIZE)"
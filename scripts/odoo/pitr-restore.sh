@@ -0,0 +1,154 @@
+#!/bin/bash
+export PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin
+
+# 🕒 Restauración de una instancia a un punto en el tiempo (PITR)
+# El WAL es de todo el cluster: se levanta una copia temporal del cluster
+# desde el base backup, se reproduce el WAL hasta la fecha pedida, se vuelca
+# solo la base de la instancia y se carga con restore-instance.sh.
+# El filestore no forma parte del WAL: se conserva el actual.
+# Uso: pitr-restore.sh <instance_name> "<YYYY-MM-DD HH:MM:SS>"
+
+set -e
+
+INSTANCE_NAME="$1"
+TARGET_TIME="$2"
+
+if [ -z "$INSTANCE_NAME" ] || [ -z "$TARGET_TIME" ]; then
+  echo "❌ Error: Debe especificar la instancia y la fecha objetivo"
+  echo "Uso: $0 <instance_name> \"<YYYY-MM-DD HH:MM:SS>\""
+  exit 1
+fi
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+# load-env.sh redefine SCRIPT_DIR si PROJECT_ROOT no está en el entorno
+ODOO_SCRIPTS_DIR="$SCRIPT_DIR"
+source "$SCRIPT_DIR/../utils/load-env.sh"
+
+DB_NAME="$INSTANCE_NAME"
+WAL_ARCHIVE="${PITR_WAL_ARCHIVE_PATH:-${BACKUPS_PATH:-/home/go/backups}/pitr/wal}"
+BASE_DIR="${PITR_BASE_PATH:-${BACKUPS_PATH:-/home/go/backups}/pitr/base}"
+PG_BIN_DIR="${PG_BIN_DIR:-$(ls -d /usr/lib/postgresql/*/bin 2>/dev/null | sort -V | tail -1)}"
+RESTORE_PORT="${PITR_RESTORE_PORT:-5499}"
+DUMP_JOBS="${BACKUP_DUMP_JOBS:-$(nproc 2>/dev/null || echo 2)}"
+WORK_DIR="/tmp/odoo-pitr-$INSTANCE_NAME-$$"
+CLUSTER_DIR="$WORK_DIR/cluster"
+ARCHIVE="$WORK_DIR/pitr_restore.tar.gz"
+
+TARGET_EPOCH=$(date -d "$TARGET_TIME" +%s 2>/dev/null) || {
+  echo "❌ Error: Fecha inválida: $TARGET_TIME"
+  exit 1
+}
+# El panel muestra y valida en hora local del servidor; el cluster temporal no
+# tiene timezone configurado (GMT), así que se le pasa el offset explícito
+TARGET_TIME_TZ=$(date -d "$TARGET_TIME" '+%F %T%z')
+
+# Base backup más reciente terminado antes de la fecha objetivo
+BASE_BACKUP=""
+for CANDIDATE in $(ls -1d "$BASE_DIR"/*/ 2>/dev/null | sort -r); do
+  FINISHED_AT=$(jq -r '.finished_at // empty' "$CANDIDATE/backup.json" 2>/dev/null || true)
+  if [ -n "$FINISHED_AT" ] && [ "$(date -d "$FINISHED_AT" +%s)" -le "$TARGET_EPOCH" ]; then
+    BASE_BACKUP="${CANDIDATE%/}"
+    break
+  fi
+done
+
+if [ -z "$BASE_BACKUP" ]; then
+  echo "❌ Error: No hay un base backup anterior a $TARGET_TIME"
+  exit 1
+fi
+
+echo "🕒 Restauración a un punto en el tiempo de $INSTANCE_NAME"
+echo "   Fecha objetivo: $TARGET_TIME"
+echo "   Base backup: $(basename "$BASE_BACKUP")"
+echo ""
+
+cleanup() {
+  if sudo test -f "$CLUSTER_DIR/postmaster.pid"; then
+    sudo -u postgres "$PG_BIN_DIR/pg_ctl" -D "$CLUSTER_DIR" -m immediate stop >/dev/null 2>&1 || true
+  fi
+  sudo rm -rf "$WORK_DIR"
+}
+trap cleanup EXIT
+
+# 1. Preparar el cluster temporal
+echo "📦 Extrayendo base backup..."
+mkdir -p "$WORK_DIR"
+chmod 755 "$WORK_DIR"
+sudo install -d -o postgres -g postgres -m 700 "$CLUSTER_DIR" "$CLUSTER_DIR/pg_wal"
+sudo -u postgres tar -xzf "$BASE_BACKUP/base.tar.gz" -C "$CLUSTER_DIR"
+sudo -u postgres tar -xzf "$BASE_BACKUP/pg_wal.tar.gz" -C "$CLUSTER_DIR/pg_wal"
+
+# En Debian la configuración vive fuera del data directory: se crea una mínima.
+# postgresql.auto.conf se lee al final, así que ahí se pisan los ALTER SYSTEM
+# del cluster original (puerto, archivado)
+sudo -u postgres tee "$CLUSTER_DIR/postgresql.conf" >/dev/null <<EOF
+listen_addresses = ''
+unix_socket_directories = '$CLUSTER_DIR'
+EOF
+echo "local all postgres peer" | sudo -u postgres tee "$CLUSTER_DIR/pg_hba.conf" >/dev/null
+sudo -u postgres tee -a "$CLUSTER_DIR/postgresql.auto.conf" >/dev/null <<EOF
+port = $RESTORE_PORT
+archive_mode = 'off'
+hot_standby = 'on'
+restore_command = 'cp $WAL_ARCHIVE/%f %p'
+recovery_target_time = '$TARGET_TIME_TZ'
+recovery_target_action = 'promote'
+EOF
+sudo -u postgres touch "$CLUSTER_DIR/recovery.signal"
+
+# 2. Reproducir el WAL hasta la fecha objetivo
+echo "🔁 Reproduciendo WAL hasta $TARGET_TIME..."
+if ! sudo -u postgres "$PG_BIN_DIR/pg_ctl" -D "$CLUSTER_DIR" -l "$WORK_DIR/recovery.log" -w -t 3600 start >/dev/null; then
+  echo "❌ Error: No se pudo iniciar el cluster temporal"
+  sudo tail -n 20 "$WORK_DIR/recovery.log" || true
+  exit 1
+fi
+
+PSQL=(sudo -u postgres psql -h "$CLUSTER_DIR" -p "$RESTORE_PORT" -At)
+while [ "$("${PSQL[@]}" -c 'SELECT pg_is_in_recovery();' 2>/dev/null)" != "f" ]; do
+  if ! sudo test -f "$CLUSTER_DIR/postmaster.pid"; then
+    echo "❌ Error: La recuperación terminó antes de llegar a $TARGET_TIME"
+    sudo tail -n 20 "$WORK_DIR/recovery.log" || true
+    exit 1
+  fi
+  sleep 2
+done
+echo "✅ Cluster temporal recuperado"
+
+# La base tiene que existir y tener datos de Odoo en la fecha objetivo: se
+# comprueba antes de tocar la instancia
+if [ "$("${PSQL[@]}" -d "$DB_NAME" -c 'SELECT EXISTS (SELECT 1 FROM ir_module_module);' 2>/dev/null)" != "t" ]; then
+  echo "❌ Error: La base $DB_NAME no existe o no tiene datos de Odoo al $TARGET_TIME"
+  exit 1
+fi
+
+# 3. Volcar solo la base de la instancia (formato directorio, en paralelo)
+echo "🗄️  Volcando base $DB_NAME del cluster temporal..."
+sudo install -d -o postgres -g postgres -m 755 "$WORK_DIR/export"
+(cd "$WORK_DIR/export" && sudo -u postgres pg_dump -h "$CLUSTER_DIR" -p "$RESTORE_PORT" \
+  -Fd -j "$DUMP_JOBS" -Z 0 -f dump "$DB_NAME")
+sudo -u postgres "$PG_BIN_DIR/pg_ctl" -D "$CLUSTER_DIR" -m fast stop >/dev/null
+sudo rm -rf "$CLUSTER_DIR"
+
+if command -v pigz >/dev/null 2>&1; then
+  COMPRESSOR=(pigz -1 -p "$DUMP_JOBS")
+else
+  COMPRESSOR=(gzip -1)
+fi
+set -o pipefail
+# pg_dump crea dump/ con modo 0700: se archiva legible para pg_restore
+sudo tar --mode=a+rX -cf - -C "$WORK_DIR/export" dump | "${COMPRESSOR[@]}" > "$ARCHIVE"
+set +o pipefail
+sudo rm -rf "$WORK_DIR/export"
+echo "✅ Dump listo: $(du -h "$ARCHIVE" | cut -f1)"
+echo ""
+
+# 4. Cargar el dump en la instancia (detiene y reinicia el servicio).
+# restore-instance.sh sale con error si la base no quedó cargada
+if ! bash "$ODOO_SCRIPTS_DIR/restore-instance.sh" "$INSTANCE_NAME" "$ARCHIVE"; then
+  echo "❌ Error: La restauración de $INSTANCE_NAME al $TARGET_TIME falló"
+  exit 1
+fi
+
+echo ""
+echo "✅ $INSTANCE_NAME restaurada al $TARGET_TIME"
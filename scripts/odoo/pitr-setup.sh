@@ -0,0 +1,46 @@
+#!/bin/bash
+export PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin
+
+# 🕒 Habilita el archivado continuo de WAL en el cluster PostgreSQL
+# Requisito de los backups incrementales / restauración a un punto en el tiempo
+# Uso: pitr-setup.sh [--restart]
+#   --restart  reinicia PostgreSQL para aplicar archive_mode (si no, queda pendiente)
+
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+source "$SCRIPT_DIR/../utils/load-env.sh"
+
+WAL_ARCHIVE="${PITR_WAL_ARCHIVE_PATH:-${BACKUPS_PATH:-/home/go/backups}/pitr/wal}"
+BASE_DIR="${PITR_BASE_PATH:-${BACKUPS_PATH:-/home/go/backups}/pitr/base}"
+ARCHIVE_TIMEOUT="${PITR_ARCHIVE_TIMEOUT:-60s}"
+
+echo "🕒 Configurando archivado de WAL..."
+echo "   Archivo de WAL: $WAL_ARCHIVE"
+echo "   Base backups: $BASE_DIR"
+
+# Los segmentos los escribe postgres; el panel solo necesita listarlos
+sudo install -d -o postgres -g postgres -m 755 "$WAL_ARCHIVE" "$BASE_DIR"
+
+sudo -u postgres psql -q -c "ALTER SYSTEM SET wal_level = 'replica';"
+sudo -u postgres psql -q -c "ALTER SYSTEM SET archive_mode = 'on';"
+sudo -u postgres psql -q -c "ALTER SYSTEM SET archive_command = 'test ! -f $WAL_ARCHIVE/%f && cp %p $WAL_ARCHIVE/%f';"
+# Fuerza el cambio de segmento aunque haya poca escritura: acota el RPO
+sudo -u postgres psql -q -c "ALTER SYSTEM SET archive_timeout = '$ARCHIVE_TIMEOUT';"
+sudo -u postgres psql -q -c "SELECT pg_reload_conf();" >/dev/null
+
+CURRENT_MODE=$(sudo -u postgres psql -At -c "SHOW archive_mode;")
+if [ "$CURRENT_MODE" = "on" ]; then
+  echo "✅ Archivado de WAL activo"
+elif [ "$1" = "--restart" ]; then
+  echo "🔄 Reiniciando PostgreSQL para activar archive_mode..."
+  sudo systemctl restart postgresql
+  echo "✅ Archivado de WAL activo"
+else
+  echo "⚠️  archive_mode requiere reiniciar PostgreSQL: ejecuta este script con --restart"
+  echo "   o reinicia manualmente en una ventana de mantenimiento"
+fi
+
+echo ""
+echo "💡 Siguiente paso: crear el primer base backup"
+echo "   $SCRIPT_DIR/pitr-base-backup.sh"
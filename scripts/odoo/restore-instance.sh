@@ -2,7 +2,9 @@
 export PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin
 
 # 🔄 Script de restauración para una instancia específica de Odoo
-# Compatible con formato estándar de Odoo Online
+# Compatible con formato estándar de Odoo Online (dump.sql) y con dumps
+# de pg_dump en formato directorio (dump/) o custom, restaurados con pg_restore -j
+# Acepta el backup como .tar.gz o directamente como .zip (Odoo.sh)
 
 set -e
 
@@ -24,6 +26,7 @@ fi
 # Cargar variables de entorno
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 source "$SCRIPT_DIR/../utils/load-env.sh"
+source "$SCRIPT_DIR/../utils/pg-restore.sh"
 
 # Configuración
 DB_NAME="$INSTANCE_NAME"
@@ -32,25 +35,86 @@ FILESTORE_PATH="$FILESTORE_BASE/$DB_NAME"
 TEMP_RESTORE_DIR="/tmp/odoo-restore-$INSTANCE_NAME-$$"
 SERVICE_NAME="odoo19e-$INSTANCE_NAME"
 
+RESTORE_JOBS="${BACKUP_DUMP_JOBS:-$(nproc 2>/dev/null || echo 2)}"
+# Ajustes de sesión para la carga: más memoria para crear índices y sin
+# esperar el fsync de cada commit (si falla, la restauración se repite)
+RESTORE_PGOPTIONS="-c maintenance_work_mem=${RESTORE_MAINTENANCE_WORK_MEM:-1GB} -c synchronous_commit=off"
+# El filestore se extrae en el mismo filesystem que el definitivo para
+# reemplazarlo con un rename atómico en lugar de copiarlo
+FILESTORE_STAGING="$FILESTORE_BASE/.restore-$DB_NAME-$$"
+
 echo "🔄 Iniciando restauración de $INSTANCE_NAME..."
 echo "   Archivo: $(basename $BACKUP_FILE)"
 echo "   Base de datos: $DB_NAME"
 echo ""
 
-# Crear directorio temporal
-mkdir -p "$TEMP_RESTORE_DIR"
+# Crear directorios temporales
+mkdir -p "$TEMP_RESTORE_DIR" "$FILESTORE_STAGING"
+cleanup() {
+  rm -rf "$TEMP_RESTORE_DIR" "$FILESTORE_STAGING"
+}
+trap cleanup EXIT
+
+# Extrae del backup (tar.gz o zip de Odoo.sh) el dump o el filestore
+if [[ "$BACKUP_FILE" == *.zip ]]; then
+  extract_dump() {
+    unzip -q -o "$BACKUP_FILE" -x 'filestore/*' -d "$TEMP_RESTORE_DIR"
+  }
+  extract_filestore() {
+    # unzip sale con 11 si el backup no trae filestore
+    unzip -q -o "$BACKUP_FILE" 'filestore/*' -d "$FILESTORE_STAGING" || [ $? -eq 11 ]
+  }
+else
+  if command -v pigz >/dev/null 2>&1; then
+    TAR_DECOMPRESS=(-I pigz)
+  else
+    TAR_DECOMPRESS=(-z)
+  fi
+  extract_dump() {
+    tar "${TAR_DECOMPRESS[@]}" -xf "$BACKUP_FILE" -C "$TEMP_RESTORE_DIR" --exclude=filestore
+  }
+  extract_filestore() {
+    # Los nombres del filestore son hashes: "dump*" solo excluye el dump
+    tar "${TAR_DECOMPRESS[@]}" -xf "$BACKUP_FILE" -C "$FILESTORE_STAGING" --exclude='dump*'
+  }
+fi
 
-# 1. Extraer backup
-echo "📦 Extrayendo backup..."
-tar -xzf "$BACKUP_FILE" -C "$TEMP_RESTORE_DIR"
-echo "✅ Backup extraído"
+# Backups con almacén deduplicado: el filestore se reconstruye desde el manifiesto
+if [ -f "$BACKUP_FILE.filestore.json" ]; then
+  extract_filestore() {
+    "$PROJECT_ROOT/backend/venv/bin/python" "$PROJECT_ROOT/backend/backup_tool.py" \
+      materialize "$BACKUP_FILE" "$FILESTORE_STAGING/filestore"
+  }
+fi
 
-# Verificar estructura
-if [ ! -f "$TEMP_RESTORE_DIR/dump.sql" ]; then
-  echo "❌ Error: El backup no contiene dump.sql"
-  rm -rf "$TEMP_RESTORE_DIR"
+# 1. Extraer: el filestore en segundo plano, en paralelo con la carga de la base
+echo "📦 Extrayendo backup..."
+extract_filestore &
+FILESTORE_PID=$!
+extract_dump
+echo "✅ Dump extraído"
+
+# Verificar estructura: dump/ (pg_dump -Fd), formato custom o dump.sql plano
+if [ -f "$TEMP_RESTORE_DIR/dump/toc.dat" ]; then
+  DUMP_FORMAT="directory"
+  DUMP_FILE="dump"
+elif [ -f "$TEMP_RESTORE_DIR/dump.dump" ]; then
+  DUMP_FORMAT="custom"
+  DUMP_FILE="dump.dump"
+elif [ -f "$TEMP_RESTORE_DIR/dump.sql" ]; then
+  DUMP_FILE="dump.sql"
+  # Odoo también genera dumps custom (pg_dump -Fc) con nombre .sql
+  if [ "$(head -c 5 "$TEMP_RESTORE_DIR/dump.sql")" = "PGDMP" ]; then
+    DUMP_FORMAT="custom"
+  else
+    DUMP_FORMAT="sql"
+  fi
+else
+  echo "❌ Error: El backup no contiene dump.sql ni dump/"
+  kill "$FILESTORE_PID" 2>/dev/null || true
   exit 1
 fi
+echo "   Formato del dump: $DUMP_FORMAT"
 
 # 2. Detener servicio de Odoo
 echo "⏹️  Deteniendo servicio Odoo..."
@@ -78,9 +142,20 @@ sudo -u postgres dropdb "$DB_NAME" 2>/dev/null || true
 echo "   Creando base de datos..."
 sudo -u postgres createdb "$DB_NAME" -O "mtg" --encoding='UTF8'
 
-# Restaurar dump
-echo "   Restaurando datos..."
-sudo -u postgres psql -d "$DB_NAME" < "$TEMP_RESTORE_DIR/dump.sql" >/dev/null 2>&1
+# Restaurar dump. Se toleran avisos, pero un pg_restore con errores o una
+# base sin módulos de Odoo dejan la restauración marcada como fallida
+RESTORE_STATUS=0
+DB_RESTORE_LOG="$TEMP_RESTORE_DIR/db-restore.log"
+if [ "$DUMP_FORMAT" = "sql" ]; then
+  echo "   Restaurando datos (psql)..."
+else
+  echo "   Restaurando datos (pg_restore, $RESTORE_JOBS procesos)..."
+fi
+if ! restore_dump "$DB_NAME" "$TEMP_RESTORE_DIR" "$DUMP_FILE" "$DUMP_FORMAT" "$RESTORE_JOBS" "$DB_RESTORE_LOG"; then
+  echo "❌ La carga del dump terminó con errores:"
+  show_restore_errors "$DB_RESTORE_LOG"
+  RESTORE_STATUS=1
+fi
 
 # Asegurar permisos
 sudo -u postgres psql -d "$DB_NAME" -c "GRANT ALL ON SCHEMA public TO mtg;" >/dev/null 2>&1
@@ -88,26 +163,32 @@ sudo -u postgres psql -d "$DB_NAME" -c "GRANT ALL PRIVILEGES ON ALL TABLES IN SC
 sudo -u postgres psql -d "$DB_NAME" -c "GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA public TO mtg;" >/dev/null 2>&1
 
 DB_SIZE=$(sudo -u postgres psql -d "$DB_NAME" -c "SELECT pg_size_pretty(pg_database_size('$DB_NAME'));" -t | xargs)
-echo "✅ Base de datos restaurada: $DB_SIZE"
+if odoo_database_ready "$DB_NAME"; then
+  echo "✅ Base de datos restaurada: $DB_SIZE"
+else
+  echo "❌ Error: La base de datos quedó sin datos de Odoo tras la restauración ($DB_SIZE)"
+  show_restore_errors "$DB_RESTORE_LOG"
+  RESTORE_STATUS=1
+fi
+
+# 4. Restaurar filestore (esperar la extracción en segundo plano)
+echo "📁 Restaurando filestore..."
+if ! wait "$FILESTORE_PID"; then
+  echo "❌ Error al extraer el filestore; se conserva el actual"
+  RESTORE_STATUS=1
+elif [ -d "$FILESTORE_STAGING/filestore" ]; then
+  chown -R mtg:mtg "$FILESTORE_STAGING/filestore" 2>/dev/null || true
 
-# 4. Restaurar filestore
-if [ -d "$TEMP_RESTORE_DIR/filestore" ]; then
-  echo "📁 Restaurando filestore..."
-  
   # Backup del filestore actual (por seguridad)
   if [ -d "$FILESTORE_PATH" ]; then
     BACKUP_FS="$FILESTORE_PATH.backup-$(date +%Y%m%d_%H%M%S)"
     mv "$FILESTORE_PATH" "$BACKUP_FS"
     echo "   Filestore actual respaldado en: $BACKUP_FS"
   fi
-  
-  # Restaurar nuevo filestore
-  mkdir -p "$FILESTORE_BASE"
-  cp -r "$TEMP_RESTORE_DIR/filestore" "$FILESTORE_PATH"
-  
-  # Ajustar permisos
-  chown -R mtg:mtg "$FILESTORE_PATH" 2>/dev/null || true
-  
+
+  # Reemplazo atómico (mismo filesystem)
+  mv "$FILESTORE_STAGING/filestore" "$FILESTORE_PATH"
+
   FILE_COUNT=$(find "$FILESTORE_PATH" -type f 2>/dev/null | wc -l)
   FS_SIZE=$(du -sh "$FILESTORE_PATH" 2>/dev/null | cut -f1)
   echo "✅ Filestore restaurado: $FS_SIZE ($FILE_COUNT archivos)"
@@ -117,7 +198,7 @@ fi
 
 # 5. Limpiar archivos temporales
 echo "🧹 Limpiando archivos temporales..."
-rm -rf "$TEMP_RESTORE_DIR"
+cleanup
 echo "✅ Limpieza completada"
 
 # 6. Iniciar servicio de Odoo
@@ -135,6 +216,12 @@ else
   echo "   Verifica los logs: sudo journalctl -u $SERVICE_NAME -n 50"
 fi
 
+if [ "$RESTORE_STATUS" -ne 0 ]; then
+  echo ""
+  echo "⚠️  Restauración de $INSTANCE_NAME completada con errores"
+  exit "$RESTORE_STATUS"
+fi
+
 echo ""
 echo "✅ Restauración de $INSTANCE_NAME completada exitosamente"
 echo ""
@@ -0,0 +1,46 @@
+#!/bin/bash
+
+# ========================================
+# FUNCIONES COMPARTIDAS PARA RESTAURAR DUMPS DE POSTGRESQL
+# ========================================
+# Uso: source /path/to/pg-restore.sh
+# Las usan restore-instance.sh, pitr-restore.sh y clone-database.sh.
+# RESTORE_PGOPTIONS (opcional) se pasa a la sesión de carga.
+
+# pg_dump -Fd crea el directorio con modo 0700 y, extraído del backup por el
+# usuario del panel, postgres no lo puede leer: abrir lectura a todos
+make_dump_readable() {
+  chmod -R a+rX "$1"
+}
+
+# Restaura un dump en una base ya creada y vacía.
+# Uso: restore_dump <db> <directorio> <entrada> <formato sql|directory|custom> <procesos> <log>
+# Se lanza desde el directorio del dump (ruta relativa) para que postgres no
+# tenga que atravesar los directorios padre. Los errores quedan en <log>.
+# Devuelve el código de salida de psql/pg_restore (pg_restore sale con error
+# si alguna sentencia falló, aunque el resto se haya cargado).
+restore_dump() {
+  local db="$1" dir="$2" entry="$3" format="$4" jobs="$5" log="$6"
+  if [ "$format" = "sql" ]; then
+    sudo -u postgres env PGOPTIONS="$RESTORE_PGOPTIONS" \
+      psql -X -q -d "$db" < "$dir/$entry" >/dev/null 2>"$log"
+  else
+    # pg_restore -j carga las tablas en paralelo y recién después crea
+    # índices, constraints y FKs, también en paralelo
+    make_dump_readable "$dir/$entry" || return 1
+    (cd "$dir" && sudo -u postgres env PGOPTIONS="$RESTORE_PGOPTIONS" \
+      pg_restore -j "$jobs" -d "$db" "$entry" >/dev/null 2>"$log")
+  fi
+}
+
+# Una base de Odoo cargada tiene módulos registrados; falla si quedó vacía
+odoo_database_ready() {
+  [ "$(sudo -u postgres psql -X -q -t -A -d "$1" -c "SELECT EXISTS (SELECT 1 FROM ir_module_module);" 2>/dev/null)" = "t" ]
+}
+
+# Últimas líneas de un log de restauración, indentadas
+show_restore_errors() {
+  if [ -s "$1" ]; then
+    tail -n 20 "$1" | sed 's/^/      /'
+  fi
+}